@@ -0,0 +1,110 @@
+"""
+Compares serializing and rendering documents to JSON and BSON, and parsing them back.
+
+    python benchmarks/renderers.py --documents 10000 --repeat 5
+
+No database is needed: documents are built in memory. The raw passthrough case renders
+documents already encoded to BSON, as BSONPassthroughMixin reads them from the collection.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=('rest_framework', 'rest_framework_mongoengine'),
+    DATABASES={'default': {'ENGINE': 'django.db.backends.dummy'}},
+)
+
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+
+import bson
+import mongoengine
+from bson import ObjectId
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from rest_framework_mongoengine.parsers import BSONParser
+from rest_framework_mongoengine.renderers import BSONRenderer, FastJSONRenderer, RawBSONDocument
+from rest_framework_mongoengine.serializers import DocumentSerializer
+
+
+class Author(mongoengine.Document):
+    name = mongoengine.StringField()
+
+
+class Reading(mongoengine.Document):
+    sensor = mongoengine.StringField()
+    author = mongoengine.ReferenceField(Author)
+    taken = mongoengine.DateTimeField()
+    value = mongoengine.FloatField()
+    count = mongoengine.IntField()
+    payload = mongoengine.BinaryField()
+    tags = mongoengine.ListField(mongoengine.StringField())
+
+
+class ReadingSerializer(DocumentSerializer):
+    class Meta:
+        model = Reading
+
+
+def make_documents(count):
+    author = ObjectId()
+    start = datetime.datetime(2015, 1, 1)
+    return [Reading(id=ObjectId(), sensor='sensor-%d' % (i % 100), author=author,
+                    taken=start + datetime.timedelta(seconds=i), value=i / 7.0, count=i,
+                    payload=b'payload', tags=['a', 'b', 'c'])
+            for i in range(count)]
+
+
+def render(renderer, documents, native):
+    context = {'native_types': renderer.native_types if native else ()}
+    data = ReadingSerializer(documents, many=True, context=context).data
+    return renderer.render(data, renderer.media_type, {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = make_documents(args.documents)
+    raw = [RawBSONDocument(bson.BSON.encode(document.to_mongo())) for document in documents] \
+        if RawBSONDocument is not None else None
+
+    cases = [
+        ('JSONRenderer', lambda: render(JSONRenderer(), documents, False)),
+        ('FastJSONRenderer', lambda: render(FastJSONRenderer(), documents, True)),
+        ('BSONRenderer', lambda: render(BSONRenderer(), documents, True)),
+    ]
+    if raw is not None:
+        cases.append(('BSONRenderer, raw passthrough', lambda: BSONRenderer().render(raw)))
+
+    json_body = render(JSONRenderer(), documents, False)
+    bson_body = render(BSONRenderer(), documents, True)
+    cases.extend([
+        ('JSONParser', lambda: JSONParser().parse(io.BytesIO(json_body), parser_context={'encoding': 'utf-8'})),
+        ('BSONParser', lambda: BSONParser().parse(io.BytesIO(bson_body))),
+    ])
+
+    print('%d documents, best of %d runs' % (args.documents, args.repeat))
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print('%-32s %8.1f ms' % (name, best * 1000))
+    print('%-32s %8d bytes' % ('JSON body', len(json_body)))
+    print('%-32s %8d bytes' % ('BSON body', len(bson_body)))
+
+
+if __name__ == '__main__':
+    main()
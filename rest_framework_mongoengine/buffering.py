@@ -0,0 +1,216 @@
+from __future__ import unicode_literals
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.utils.six.moves import queue
+from pymongo.errors import BulkWriteError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger('rest_framework_mongoengine')
+
+
+class BufferFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many pending writes, try again later.'
+
+    def __init__(self, detail=None, wait=1):
+        super(BufferFull, self).__init__(detail)
+        #sent as Retry-After by DRF's exception handler
+        self.wait = wait
+
+
+class WriteTimeout(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'The document was queued, but not written in time.'
+
+
+class PendingWrite(object):
+    """
+    A document waiting in a WriteBuffer. `wait()` blocks until its batch was written,
+    and returns the write error (a pymongo write error dict), or None on success.
+    WriteTimeout is raised when that takes longer than `timeout` seconds.
+    """
+
+    def __init__(self, son):
+        self.son = son
+        self.error = None
+        self._written = threading.Event()
+
+    def done(self, error=None):
+        self.error = error
+        self._written.set()
+
+    @property
+    def written(self):
+        return self._written.is_set()
+
+    def wait(self, timeout=None):
+        if not self._written.wait(timeout):
+            raise WriteTimeout()
+        return self.error
+
+
+class WriteBuffer(object):
+    """
+    Coalesces single-document inserts into `insert_many` batches, written by a background
+    thread. A batch is written once it holds `batch_size` documents, or `flush_interval`
+    seconds after its first document was queued.
+
+    At most `max_size` documents wait in the buffer; `put()` waits up to `put_timeout`
+    seconds for room and raises BufferFull (503) then. Pending documents are written
+    when the process exits, or on `close()`.
+
+    The thread is started on the first `put()` of every process, so buffers can be
+    created before a prefork server forks its workers.
+    """
+
+    def __init__(self, document, batch_size=500, flush_interval=0.5, max_size=10000, put_timeout=0,
+                 ordered=False):
+        self.document = document
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.put_timeout = put_timeout
+        self.ordered = ordered
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            #documents queued by a parent process are its own to write
+            self._queue = queue.Queue(self.max_size)
+            self._pid = os.getpid()
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            #keep the queue, what is in it is still to be written
+            self._thread = threading.Thread(target=self.run, name='WriteBuffer(%s)' % self.document.__name__)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def put(self, son):
+        """
+        Queue a document (as returned by `to_mongo()`, with its `_id` set) and return
+        its PendingWrite.
+        """
+        pending = PendingWrite(son)
+        with self._lock:
+            if self._closed:
+                raise BufferFull('Writes are not accepted while shutting down.')
+            self._ensure_started()
+            try:
+                self._queue.put(pending, block=self.put_timeout > 0, timeout=self.put_timeout or None)
+            except queue.Full:
+                raise BufferFull()
+        return pending
+
+    def flush(self, timeout=None):
+        """
+        Write everything queued so far, and wait for it.
+        """
+        marker = PendingWrite(None)
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(marker)
+        marker.wait(timeout)
+
+    def close(self, timeout=None):
+        """
+        Stop accepting writes, write pending documents and stop the thread.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def pending_count(self):
+        return self._queue.qsize() if self._thread is not None else 0
+
+    def collect(self):
+        """
+        Take the next batch off the queue. Returns (batch, flush markers, stop).
+        """
+        batch = []
+        markers = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.time()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, markers, True
+            if item.son is None:
+                markers.append(item)
+                break
+            batch.append(item)
+            if deadline is None:
+                deadline = time.time() + self.flush_interval
+        return batch, markers, False
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch, markers, stop = self.collect()
+            try:
+                if batch:
+                    self.write(batch)
+            except Exception as exc:
+                #one bad batch must not end the thread
+                logger.exception('Buffered %s documents were not written.', self.document.__name__)
+                for index, item in enumerate(batch):
+                    if not item.written:
+                        item.done({'index': index, 'errmsg': str(exc)})
+            finally:
+                for marker in markers:
+                    marker.done()
+
+    def write(self, batch):
+        errors = {}
+        try:
+            self.document._get_collection().insert_many([item.son for item in batch], ordered=self.ordered)
+        except BulkWriteError as exc:
+            for write_error in exc.details.get('writeErrors', []):
+                errors[write_error['index']] = write_error
+            if self.ordered and errors:
+                for index in range(min(errors) + 1, len(batch)):
+                    errors[index] = {'index': index, 'errmsg': 'Not written, since an earlier document failed.'}
+        except Exception as exc:
+            #PyMongoError, or e.g. bson's InvalidDocument for a son that can not be encoded
+            errors = dict((index, {'index': index, 'errmsg': str(exc)}) for index in range(len(batch)))
+
+        if errors:
+            logger.error('%d of %d buffered %s documents were not written.',
+                         len(errors), len(batch), self.document.__name__,
+                         extra={'errors': [error['errmsg'] for error in errors.values()]})
+        for index, item in enumerate(batch):
+            item.done(errors.get(index))
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_buffer(document, **options):
+    """
+    The WriteBuffer of `document`, created with `options` on first use.
+    """
+    with _buffers_lock:
+        if document not in _buffers:
+            _buffers[document] = WriteBuffer(document, **options)
+        return _buffers[document]
@@ -0,0 +1,273 @@
+from __future__ import unicode_literals
+
+import json
+import logging
+import random
+import threading
+
+from bson import json_util
+from mongoengine import connection
+from mongoengine.errors import InvalidQueryError, ValidationError
+from pymongo import monitoring
+
+logger = logging.getLogger('rest_framework_mongoengine.debug')
+
+_local = threading.local()
+
+#set once a QueryListener exists, the queries are then recorded as they are sent
+_listening = False
+
+#commands recorded by QueryListener, and the keys holding their filter
+RECORDED_COMMANDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'findandmodify': 'query',
+    'aggregate': 'pipeline',
+    'update': 'updates',
+    'delete': 'deletes',
+}
+
+#cursor options shown next to the filter
+COMMAND_OPTIONS = ('sort', 'projection', 'skip', 'limit', 'hint', 'fields')
+
+
+class QueryRecord(object):
+    """
+    A query issued while handling a request, and what its plan looks like.
+    `explain` is a callable returning the server's explain output for the query.
+    """
+
+    def __init__(self, source, collection, query, explain, options=None):
+        self.source = source
+        self.collection = collection
+        self.query = query
+        self.explain = explain
+        self.options = options or {}
+        self.plan = None
+        self.flags = []
+
+    def as_dict(self):
+        return {
+            'source': self.source,
+            'collection': self.collection,
+            'query': json.loads(json_util.dumps(self.query)),
+            'options': json.loads(json_util.dumps(self.options)),
+            'plan': self.plan,
+            'flags': self.flags,
+        }
+
+
+class QueryInspector(object):
+    """
+    Records the queries of a request, runs `explain()` on a sample of them and flags
+    collection scans, in-memory sorts and queries examining many more documents than
+    they return.
+    """
+
+    def __init__(self, sample_rate=1.0, max_explains=20, examined_ratio=10):
+        self.sample_rate = sample_rate
+        self.max_explains = max_explains
+        self.examined_ratio = examined_ratio
+        self.records = []
+
+    def record(self, record):
+        self.records.append(record)
+
+    def inspect(self):
+        explained = 0
+        for record in self.records:
+            if explained >= self.max_explains or random.random() >= self.sample_rate:
+                continue
+            try:
+                output = record.explain()
+            except Exception as exc:
+                record.flags.append('EXPLAIN_FAILED: %s' % exc)
+                continue
+            explained += 1
+            self.analyze(record, output)
+        return explained
+
+    def analyze(self, record, output):
+        planner = output.get('queryPlanner', {})
+        stages = get_plan_stages(planner.get('winningPlan', {}))
+        record.plan = ' <- '.join(stages)
+
+        if 'COLLSCAN' in stages:
+            record.flags.append('COLLSCAN')
+        if 'SORT' in stages:
+            record.flags.append('SORT')
+
+        stats = output.get('executionStats')
+        if stats:
+            examined = stats.get('totalDocsExamined', 0)
+            returned = stats.get('nReturned', 0)
+            if examined > self.examined_ratio * max(returned, 1):
+                record.flags.append('EXAMINED_RATIO: %s/%s' % (examined, returned))
+
+    @property
+    def flagged(self):
+        return [record for record in self.records if record.flags]
+
+    def summary(self, explained):
+        return 'queries=%d; explained=%d; flagged=%d' % (len(self.records), explained, len(self.flagged))
+
+
+def get_plan_stages(plan):
+    """
+    Flattens a winning plan into its stage names, from the root down to the leaves.
+    """
+    stages = []
+    pending = [plan]
+    while pending:
+        stage = pending.pop(0)
+        if not stage:
+            continue
+        if 'stage' in stage:
+            stages.append(stage['stage'])
+        if 'queryPlan' in stage:
+            pending.append(stage['queryPlan'])
+        if 'inputStage' in stage:
+            pending.append(stage['inputStage'])
+        pending.extend(stage.get('inputStages', []))
+    return stages
+
+
+def get_command_query(command_name, command):
+    """
+    The filter of a command sent to the server: of its first statement for `update` and
+    `delete`, of its first `$match` stage for `aggregate`.
+    """
+    value = command.get(RECORDED_COMMANDS[command_name])
+    if command_name in ('update', 'delete'):
+        return value[0].get('q', {}) if value else {}
+    if command_name == 'aggregate':
+        return next((stage['$match'] for stage in value or [] if '$match' in stage), {})
+    return value or {}
+
+
+def get_database(name):
+    #the database of a mongoengine connection, to run explain on
+    for db in connection._dbs.values():
+        if db.name == name:
+            return db
+    for alias in connection._connection_settings:
+        db = connection.get_db(alias)
+        if db.name == name:
+            return db
+    raise LookupError('No connection to database %s.' % name)
+
+
+class QueryListener(monitoring.CommandListener):
+    """
+    Records the commands sent to the server by the threads inspecting their queries,
+    as they were sent: sort, skip, limit and projection included, and for every query of
+    the request (counts, validators, fetch-free writes...). Register it before connecting,
+    so that mongoengine's clients notify it:
+
+        monitoring.register(QueryListener())
+        mongoengine.connect(...)
+
+    Without it, the views record the querysets they build only.
+    """
+
+    def __init__(self):
+        global _listening
+        _listening = True
+
+    def started(self, event):
+        inspector = getattr(_local, 'inspector', None)
+        if inspector is None or event.command_name not in RECORDED_COMMANDS:
+            return
+        command = dict((key, value) for key, value in event.command.items()
+                       if key not in ('lsid', 'txnNumber', '$db', '$clusterTime', '$readPreference',
+                                      'readConcern', 'writeConcern'))
+        if event.command_name in ('update', 'delete'):
+            #explain takes a single statement
+            key = RECORDED_COMMANDS[event.command_name]
+            command[key] = command[key][:1]
+        database_name = event.database_name
+
+        def explain():
+            return get_database(database_name).command('explain', command, verbosity='executionStats')
+
+        options = dict((key, command[key]) for key in COMMAND_OPTIONS if key in command)
+        inspector.record(QueryRecord(event.command_name, command[event.command_name],
+                                     get_command_query(event.command_name, command), explain, options))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def start_inspection(**kwargs):
+    _local.inspector = QueryInspector(**kwargs)
+    return _local.inspector
+
+
+def stop_inspection():
+    inspector = getattr(_local, 'inspector', None)
+    _local.inspector = None
+    return inspector
+
+
+def is_inspecting():
+    """
+    True when the current thread records its queries.
+    """
+    return getattr(_local, 'inspector', None) is not None
+
+
+def record_queryset(queryset, source):
+    """
+    Record a mongoengine queryset, if the current thread is inspecting queries and no
+    QueryListener records the queries as they are sent.
+    """
+    inspector = getattr(_local, 'inspector', None)
+    if inspector is None or _listening:
+        return
+    queryset = queryset.clone()
+    try:
+        query = queryset._query
+    except (ValidationError, InvalidQueryError):
+        #the query itself is invalid and will fail on its own
+        return
+    options = {}
+    if queryset._ordering:
+        options['sort'] = queryset._ordering
+    if queryset._skip:
+        options['skip'] = queryset._skip
+    if queryset._limit:
+        options['limit'] = queryset._limit
+    inspector.record(QueryRecord(source, queryset._document._get_collection_name(),
+                                 query, queryset.explain, options))
+
+
+def record_find(collection, query, source, **kwargs):
+    """
+    Record a raw pymongo `find(query, **kwargs)` (projection, sort, skip, limit...), if the
+    current thread is inspecting queries and no QueryListener records the queries as they
+    are sent.
+    """
+    inspector = getattr(_local, 'inspector', None)
+    if inspector is None or _listening:
+        return
+    inspector.record(QueryRecord(source, collection.name, query,
+                                 lambda: collection.find(query, **kwargs).explain(), kwargs))
+
+
+def report(inspector, view, request, response):
+    """
+    Explain the recorded queries, log flagged ones and add the `X-Query-Plan` header.
+    """
+    explained = inspector.inspect()
+    for record in inspector.flagged:
+        logger.warning('%s issued a query with a poor plan on %s: %s',
+                       view.__class__.__name__, record.collection, ', '.join(record.flags),
+                       extra={'view': view.__class__.__name__, 'path': request.path,
+                              'query_plan': record.as_dict()})
+    response['X-Query-Plan'] = inspector.summary(explained)
+    return response
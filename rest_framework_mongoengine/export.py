@@ -0,0 +1,278 @@
+from __future__ import unicode_literals
+
+import base64
+import datetime
+import json
+import numbers
+import os
+
+import bson
+from bson import Binary, MaxKey, MinKey, ObjectId, Timestamp
+from bson.errors import InvalidBSON
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+from mongoengine import connection
+from mongoengine.base.common import _document_registry
+from rest_framework.exceptions import ParseError
+
+from rest_framework_mongoengine.renderers import encode_bson_type
+
+try:
+    from bson.decimal128 import Decimal128
+except ImportError:
+    #pymongo < 3.4
+    Decimal128 = None
+
+try:
+    from concurrent import futures
+except ImportError:
+    #python 2 without the `futures` backport
+    futures = None
+
+_pid = os.getpid()
+
+
+def get_key_value(son, db_key):
+    for part in db_key.split('.'):
+        son = son.get(part) if isinstance(son, dict) else None
+    return son
+
+
+def get_split_points(collection, query, db_key, partitions, sample_size):
+    """
+    Values of `db_key` splitting the documents matching `query` into `partitions` ranges of
+    about the same size, estimated from a `$sample` of `sample_size` documents. Fewer points
+    come back when the sample is too small or holds repeated values.
+    """
+    if partitions < 2:
+        return []
+    pipeline = [{'$match': query}, {'$sample': {'size': sample_size}}, {'$project': {db_key: 1}}]
+    keys = [get_key_value(son, db_key) for son in collection.aggregate(pipeline)]
+    try:
+        keys = sorted(key for key in keys if key is not None)
+    except TypeError:
+        #values of several types, one range will do
+        return []
+    points = []
+    for index in range(1, partitions):
+        point = keys[len(keys) * index // partitions] if keys else None
+        if point is not None and (not points or point > points[-1]):
+            points.append(point)
+    return points
+
+
+#BSON types in the order MongoDB sorts them; missing values sort as null.
+#comparisons ($gt...) only match values of the same type bracket.
+SORT_ORDER = ['minKey', 'null', 'number', 'string', 'object', 'array', 'binData', 'objectId', 'bool',
+              'date', 'timestamp', 'regex', 'maxKey']
+TYPE_ALIASES = {
+    'number': ['double', 'int', 'long', 'decimal'],
+    'string': ['string', 'symbol'],
+}
+
+
+def get_sort_type(value):
+    if value is None:
+        return 'null'
+    elif isinstance(value, bool):
+        return 'bool'
+    elif isinstance(value, numbers.Number) or (Decimal128 is not None and isinstance(value, Decimal128)):
+        return 'number'
+    elif isinstance(value, Binary) or (six.PY3 and isinstance(value, six.binary_type)):
+        return 'binData'
+    elif isinstance(value, six.string_types):
+        return 'string'
+    elif isinstance(value, dict):
+        return 'object'
+    elif isinstance(value, (list, tuple)):
+        return 'array'
+    elif isinstance(value, ObjectId):
+        return 'objectId'
+    elif isinstance(value, datetime.datetime):
+        return 'date'
+    elif isinstance(value, Timestamp):
+        return 'timestamp'
+    elif isinstance(value, MinKey):
+        return 'minKey'
+    elif isinstance(value, MaxKey):
+        return 'maxKey'
+    return 'regex'
+
+
+def get_after_query(db_key, key, pk):
+    """
+    Matches the documents sorted after (key, pk) on `[(db_key, 1), ('_id', 1)]`, values of
+    the types sorted after the type of `key` included (`$type` lists need MongoDB 3.6). Keys
+    holding arrays are not supported.
+    """
+    sort_type = get_sort_type(key)
+    later_types = []
+    for name in SORT_ORDER[SORT_ORDER.index(sort_type) + 1:]:
+        later_types.extend(TYPE_ALIASES.get(name, [name]))
+    query = [{db_key: key, '_id': {'$gt': pk}}, {db_key: {'$type': later_types}}]
+    if key is not None:
+        query.insert(0, {db_key: {'$gt': key}})
+    return {'$or': query}
+
+
+class ExportRange(object):
+    """
+    A range of the export key, `[lower, upper)`, with the (key, _id) of the last exported
+    document in it. The first range has no lower bound, the last no upper one.
+    """
+
+    def __init__(self, lower=None, upper=None, after=None, done=False):
+        self.lower = lower
+        self.upper = upper
+        self.after = after
+        self.done = done
+
+    def get_query(self, db_key):
+        bounds = {}
+        if self.lower is not None:
+            bounds['$gte'] = self.lower
+        if self.upper is not None:
+            if self.lower is None:
+                #documents with values of other types than the bounds go here
+                bounds['$not'] = {'$gte': self.upper}
+            else:
+                bounds['$lt'] = self.upper
+        query = [{db_key: bounds}] if bounds else []
+        if self.after is not None:
+            query.append(get_after_query(db_key, *self.after))
+        return query
+
+    def as_list(self):
+        return [self.lower, self.upper, list(self.after) if self.after is not None else None, self.done]
+
+    @classmethod
+    def from_list(cls, values):
+        lower, upper, after, done = values
+        return cls(lower, upper, tuple(after) if after is not None else None, done)
+
+
+def get_ranges(split_points):
+    bounds = [None] + list(split_points) + [None]
+    return [ExportRange(lower, upper) for lower, upper in zip(bounds, bounds[1:])]
+
+
+def dump_checkpoint(ranges):
+    """
+    Token holding the progress of every range, to resume an export with.
+    """
+    data = bson.BSON.encode({'ranges': [export_range.as_list() for export_range in ranges]})
+    return base64.urlsafe_b64encode(bytes(data)).decode('ascii')
+
+
+def load_checkpoint(token):
+    try:
+        data = bson.BSON(base64.urlsafe_b64decode(token.encode('ascii'))).decode()
+        return [ExportRange.from_list(values) for values in data['ranges']]
+    except (InvalidBSON, KeyError, TypeError, ValueError):
+        raise ParseError('Invalid checkpoint.')
+
+
+def reset_connections():
+    """
+    Reconnect every registered mongoengine alias, in a forked worker: the clients of the
+    parent process must not be used after fork. Runs once per process, as the initializer
+    of process pools, or before the first batch where pools take no initializer.
+    """
+    global _pid
+    if os.getpid() == _pid:
+        return
+    _pid = os.getpid()
+    for alias, settings in list(connection._connection_settings.items()):
+        settings = dict(settings)
+        connection.disconnect(alias)
+        connection.connect(settings.pop('name'), alias=alias, **settings)
+    for document in list(_document_registry.values()):
+        #collections are cached with the database of the parent's client
+        document._collection = None
+
+
+def export_batch(task):
+    """
+    Export the next `batch_size` documents of a range. Runs on the workers, so `task` is a
+    plain dict, picklable for process pools. Returns (NDJSON lines, last (key, _id), count).
+    """
+    document = task['document']
+    reset_connections()
+    db_key = task['db_key']
+    query = [task['query']] + task['range'].get_query(db_key)
+    cursor = document._get_collection().find({'$and': query}, **task['find_kwargs'])
+    cursor = cursor.sort([(db_key, 1), ('_id', 1)]).limit(task['batch_size'])
+    sons = list(cursor)
+    if not sons:
+        return b'', None, 0
+
+    documents = [document._from_son(son) for son in sons]
+    if task.get('filter_documents') is not None:
+        documents = task['filter_documents'](documents)
+    data = task['serializer_class'](documents, many=True, context=task['context']).data
+    lines = ''.join(json.dumps(item, default=encode_bson_type) + '\n' for item in data)
+    return lines.encode('utf-8'), (get_key_value(sons[-1], db_key), sons[-1]['_id']), len(sons)
+
+
+def get_executor(kind, workers):
+    if futures is None:
+        raise ImproperlyConfigured('Parallel exports require concurrent.futures (the `futures` package on Python 2).')
+    if kind == 'process':
+        try:
+            return futures.ProcessPoolExecutor(workers, initializer=reset_connections)
+        except TypeError:
+            #python < 3.7, export_batch resets them
+            return futures.ProcessPoolExecutor(workers)
+    elif kind == 'thread':
+        return futures.ThreadPoolExecutor(workers)
+    raise ImproperlyConfigured('Unknown export executor %r, use "thread" or "process".' % kind)
+
+
+def run_export(ranges, make_task, executor, batch_size, ordered=False, checkpoint_key='__checkpoint__'):
+    """
+    Scan `ranges` on `executor`, a batch at a time per range, and yield NDJSON: the lines of
+    every batch, each followed by a checkpoint line to resume after it. `make_task(range)`
+    builds the task of a range's next `batch_size` documents. Ranges are written one after
+    another when `ordered`, else batches are written as they complete. At most one batch
+    per range is pending at any time.
+    """
+    pending = {}
+
+    def submit(export_range):
+        pending[executor.submit(export_batch, make_task(export_range))] = export_range
+
+    def complete(future):
+        export_range = pending.pop(future)
+        lines, last, count = future.result()
+        if last is not None:
+            export_range.after = last
+        if count < batch_size:
+            export_range.done = True
+        else:
+            submit(export_range)
+        return lines
+
+    def checkpoint():
+        return (json.dumps({checkpoint_key: dump_checkpoint(ranges)}) + '\n').encode('utf-8')
+
+    try:
+        for export_range in ranges:
+            if not export_range.done:
+                submit(export_range)
+        if ordered:
+            for export_range in ranges:
+                while not export_range.done:
+                    future = next(future for future, pending_range in pending.items()
+                                  if pending_range is export_range)
+                    lines = complete(future)
+                    yield lines + checkpoint()
+        else:
+            while pending:
+                done, not_done = futures.wait(list(pending), return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    lines = complete(future)
+                    yield lines + checkpoint()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -1,15 +1,16 @@
 from django.core.exceptions import ValidationError
+from django.utils import six
 from django.utils.encoding import smart_str
 
 from rest_framework import serializers
 from bson.errors import InvalidId
-from bson import DBRef, ObjectId
+from bson import Binary, DBRef, ObjectId
 
+import base64
 import numbers
 import inspect
 import json
 
-from mongoengine.dereference import DeReference
 from mongoengine.base.document import BaseDocument
 from mongoengine.document import Document, EmbeddedDocument
 from mongoengine.fields import ObjectId
@@ -26,6 +27,7 @@ from rest_framework.utils import html
 from rest_framework.utils.serializer_helpers import BindingDict
 
 from rest_framework_mongoengine.utils import get_field_info, PolymorphicChainMap
+from rest_framework_mongoengine.query import dereference, dereference_many, dereference_dbref
 
 class DocumentField(serializers.Field):
     """
@@ -46,8 +48,8 @@ class DocumentField(serializers.Field):
         except KeyError:
             raise ValueError("%s requires 'model_field' kwarg" % self.type_label)
 
-        # better hotwire.
-        self.dereference_refs = False
+        #references are only fetched when asked for, see `Meta.dereference_refs`.
+        self.dereference_refs = kwargs.pop('dereference_refs', False)
 
         super(DocumentField, self).__init__(*args, **kwargs)
 
@@ -65,6 +67,23 @@ class DocumentField(serializers.Field):
                 self._fields[key] = value
         return self._fields
 
+    @property
+    def query_options(self):
+        #QueryOptions of the view, passed down through serializer context.
+        #dereference queries issued by fields inherit these.
+        return self.context.get('query_options')
+
+    @property
+    def native_types(self):
+        #types the negotiated renderer writes itself (see renderers.FastJSONRenderer),
+        #passed down through serializer context.
+        if not hasattr(self, '_native_types'):
+            self._native_types = tuple(self.context.get('native_types', ()))
+        return self._native_types
+
+    def to_string(self, value):
+        return value if isinstance(value, self.native_types) else smart_str(value)
+
     def get_fields(self):
         #handle dynamic/dict fields
         raise NotImplementedError("Fields subclassing DocumentField need to implement get_fields.")
@@ -95,6 +114,7 @@ class DocumentField(serializers.Field):
         if self.is_drfme_field(subfield):
             kwargs['model_field'] = subfield
             kwargs['depth'] = self.depth - 1
+            kwargs['dereference_refs'] = self.dereference_refs
 
         if type(subfield) is me_fields.ObjectIdField:
             kwargs['required'] = False
@@ -160,7 +180,7 @@ class DocumentField(serializers.Field):
     def to_representation(self, value):
         #transform_object(obj, depth)
         #We don't really ever want to hit this case, in theory.
-        return smart_str(value) if isinstance(value, ObjectId) else value
+        return self.to_string(value) if isinstance(value, ObjectId) else value
 
 class ReferenceField(DocumentField):
     """
@@ -197,8 +217,8 @@ class ReferenceField(DocumentField):
         #will call get_attr(instance, field_name), which dereferences ReferenceFields
         #even if we don't need them. We need it to be mindful of depth.
         if self.go_deeper(is_ref=True):
-            #TODO: fix to iterate properly?
-            return super(DocumentField, self).get_attribute(instance)
+            #dereference ourselves, so the query carries the view's QueryOptions.
+            return dereference(self.model_cls, instance._data[self.source], self.query_options)
 
         #return dbref by grabbing data directly, instead of going through the ReferenceField's __get__ method
         return instance._data[self.source]
@@ -222,9 +242,9 @@ class ReferenceField(DocumentField):
         elif isinstance(value, (DBRef, Document)):
             #don't want to go deeper, and have either a DBRef or a document
             #we'll have a document on POSTs/PUTs, or if something else has dereferenced it for us.
-            return smart_str(value.id)
+            return self.to_string(value.id)
         else:
-            return smart_str(value)
+            return self.to_string(value)
 
 
 
@@ -266,9 +286,12 @@ class ListField(DocumentField):
     def get_attribute(self, instance):
         #since this is a passthrough, be careful about dereferencing the contents.
         serializer_field = self.fields[self.model_field.name]
-        if not self.dereference_refs and isinstance(serializer_field, ReferenceField):
-            #return data by grabbing it directly, instead of going through the field's __get__ method
-            return instance._data[self.source]
+        if isinstance(serializer_field, ReferenceField):
+            if not serializer_field.go_deeper(is_ref=True):
+                #return data by grabbing it directly, instead of going through the field's __get__ method
+                return instance._data[self.source]
+            #fetch all references in one query, carrying the view's QueryOptions.
+            return dereference_many(serializer_field.model_cls, instance._data[self.source] or [], self.query_options)
         return super(DocumentField, self).get_attribute(instance)
 
 
@@ -280,6 +303,16 @@ class ListField(DocumentField):
 class MapField(ListField):
     type_label = "MapField"
 
+    def get_attribute(self, instance):
+        serializer_field = self.fields[self.model_field.name]
+        if isinstance(serializer_field, ReferenceField) and serializer_field.go_deeper(is_ref=True):
+            #fetch the values in one query, keyed as they are stored.
+            value = instance._data[self.source] or {}
+            keys = list(value)
+            fetched = dereference_many(serializer_field.model_cls, [value[key] for key in keys], self.query_options)
+            return OrderedDict(zip(keys, fetched))
+        return super(MapField, self).get_attribute(instance)
+
     def to_internal_value(self, data):
         """
         List of dicts of native values <- List of dicts of primitive datatypes.
@@ -408,7 +441,7 @@ class DynamicField(DocumentField):
                 return ret
             else:
                 #out of depth
-                return smart_str(value.id)
+                return self.to_string(value.id)
         elif isinstance(value, EmbeddedDocument):
             if self.go_deeper():
                 cls = type(value)
@@ -429,7 +462,7 @@ class DynamicField(DocumentField):
                 return "%s Object: Out of Depth" % type(value).__name__
 
         elif isinstance(value, ObjectId):
-            return smart_str(value)
+            return self.to_string(value)
 
         elif isinstance(value, list):
             #list of things.
@@ -470,7 +503,11 @@ class DictField(DocumentField):
                 if self.go_deeper(is_ref=True):
                     #have depth, we must go deeper.
                     #serialize-on-the-fly! (patent pending)
-                    item = DeReference()([item])[0]
+                    item = dereference_dbref(item, self.query_options)
+                    if item is None:
+                        #dangling reference
+                        ret[key] = None
+                        continue
                     cls = item.__class__
                     if type(cls) not in self.serializers:
                         self.serializers[cls] = BindingDict(self)
@@ -485,7 +522,7 @@ class DictField(DocumentField):
                     ret[key] = sub_ret
                 else:
                     #no depth, so just pretty-print the dbref.
-                    ret[key] = smart_str(item.id)
+                    ret[key] = self.to_string(item.id)
             elif isinstance(item, dict) and '_cls' in item and item['_cls'] in _document_registry:
                 #has _cls, isn't a dbref, but is in the document registry - should be an embedded document.
                 if self.go_deeper():
@@ -542,7 +579,7 @@ class ObjectIdField(DocumentField):
         return {}
 
     def to_representation(self, value):
-        return smart_str(value)
+        return self.to_string(value)
 
     def to_internal_value(self, data):
         return ObjectId(data)
@@ -579,32 +616,94 @@ class HyperlinkedDocumentIdentityField(HyperlinkedIdentityField):
 
 class FileField(DocumentField):
     """
-    For now, just print the grid_id properly.
-    Allowing uploads of files via the serializer will require a bit more work.
+    Outputs the grid_id of the file. The file itself is read and written through
+    a separate resource, see generics.GridFSFileAPIView.
     """
     type_label = 'FileField'
 
     def to_representation(self, value):
-        gid = value.grid_id
-
-        return smart_str(value.grid_id)
+        if value.grid_id is None:
+            return None
+        return self.to_string(value.grid_id)
 
 class BinaryField(DocumentField):
-
+    """
+    Binary data as base64 text, or base85 with `encoding='base85'` (Python 3 only). Values
+    are encoded from a memoryview, `chunk_size` bytes at a time, so they are not copied
+    whole on the way. Input decoding to more than `max_bytes` is refused, if possible
+    before it is decoded.
+
+    With `out_of_band_bytes`, longer values are left out and represented as
+    `{"length": <bytes>}`, to be read and written through generics.BinaryFieldAPIView
+    instead. That placeholder is ignored on input, so sending a document back as it was
+    read leaves the stored value as it is.
+    """
     type_label = 'BinaryField'
+    encodings = ('base64', 'base85')
+    #a multiple of 3 and 4, so encoded chunks join up without padding
+    chunk_size = 192 * 1024
+
+    default_error_messages = {
+        'invalid': 'Not valid {encoding} data.',
+        'max_bytes': 'Ensure this value has at most {max_bytes} bytes.',
+    }
 
     def __init__(self, **kwargs):
         try:
             self.max_bytes = kwargs.pop('max_bytes')
         except KeyError:
             raise ValueError('BinaryField requires "max_bytes" kwarg')
+        self.encoding = kwargs.pop('encoding', 'base64')
+        self.out_of_band_bytes = kwargs.pop('out_of_band_bytes', None)
+        if self.encoding not in self.encodings:
+            raise ValueError('BinaryField encoding must be one of %s' % ', '.join(self.encodings))
+        if self.encoding == 'base85' and not hasattr(base64, 'b85encode'):
+            raise ValueError('BinaryField base85 encoding requires Python 3.4')
         super(BinaryField, self).__init__(**kwargs)
 
     def to_representation(self, value):
-        return smart_str(value)
+        view = memoryview(value)
+        if self.out_of_band_bytes is not None and len(view) > self.out_of_band_bytes:
+            return {'length': len(view)}
+        if isinstance(value, self.native_types):
+            return value
+        encode = base64.b85encode if self.encoding == 'base85' else base64.b64encode
+        return ''.join(encode(view[start:start + self.chunk_size]).decode('ascii')
+                       for start in range(0, len(view), self.chunk_size))
+
+    def min_decoded_length(self, data):
+        #ignoring whitespace, the encoded forms are at most that much longer
+        if self.encoding == 'base85':
+            return len(data) * 4 // 5 - 1
+        return len(data) * 3 // 4 - 2
+
+    def is_placeholder(self, data):
+        return self.out_of_band_bytes is not None and isinstance(data, dict) and list(data) == ['length']
 
     def to_internal_value(self, data):
-        return super(BinaryField, self).to_internal_value(smart_str(data))
+        if self.is_placeholder(data):
+            #the value was left out of what the client read, keep it
+            raise SkipField()
+        if isinstance(data, Binary) or (six.PY3 and isinstance(data, six.binary_type)):
+            #raw, from renderers.BSONParser
+            value = bytes(data)
+        elif isinstance(data, six.string_types):
+            if self.max_bytes is not None and self.min_decoded_length(data) > self.max_bytes:
+                self.fail('max_bytes', max_bytes=self.max_bytes)
+            try:
+                if self.encoding == 'base85':
+                    value = base64.b85decode(data)
+                elif six.PY3:
+                    value = base64.b64decode(data, validate=True)
+                else:
+                    value = base64.b64decode(data)
+            except (TypeError, ValueError):
+                self.fail('invalid', encoding=self.encoding)
+        else:
+            self.fail('invalid', encoding=self.encoding)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            self.fail('max_bytes', max_bytes=self.max_bytes)
+        return value
 
 
 class BaseGeoField(DocumentField):
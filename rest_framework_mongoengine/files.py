@@ -0,0 +1,149 @@
+from __future__ import unicode_literals
+
+import re
+
+import gridfs
+from mongoengine.connection import get_db
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The file is too large.'
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    Raised for a Range header pointing past the end of the file, to be answered with 416.
+    """
+
+    def __init__(self, length):
+        self.length = length
+
+
+def get_grid_fs(model_field):
+    """
+    The GridFS bucket the files of a mongoengine FileField/ImageField are stored in.
+    """
+    return gridfs.GridFS(get_db(model_field.db_alias), model_field.collection_name)
+
+
+def get_file_etag(grid_out):
+    #GridFS files are never changed in place, a new upload gets a new id
+    return '"%s"' % grid_out._id
+
+
+def etag_matches(header, etag):
+    """
+    True when an If-None-Match header value holds `etag`, weak tags compared weakly.
+    """
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+
+def parse_range(header, length):
+    """
+    Returns the (start, end) bytes, end excluded, of a single `bytes=` range of a file of
+    `length` bytes. None when the whole file is to be sent: no header, one that is malformed,
+    or one asking for several ranges. Raises RangeNotSatisfiable when the range starts past
+    the end of the file.
+    """
+    match = _range_re.match(header.strip()) if header else None
+    if match is None or length == 0:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        #the last bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable(length)
+        return max(0, length - int(last)), length
+    start = int(first)
+    end = int(last) + 1 if last else length
+    if end <= start:
+        return None
+    if start >= length:
+        raise RangeNotSatisfiable(length)
+    return start, min(end, length)
+
+
+def iter_file(grid_out, start, end, chunk_size=None):
+    """
+    Reads bytes `start` to `end` of a GridOut, `chunk_size` (by default the GridFS chunk
+    size, to read a chunk document at a time) bytes at a time.
+    """
+    chunk_size = chunk_size or grid_out.chunk_size
+    grid_out.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = grid_out.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def check_length(length, expected_bytes):
+    if expected_bytes is not None and length < expected_bytes:
+        raise ParseError('The body is shorter than its Content-Length (%d of %d bytes).' % (length, expected_bytes))
+
+
+def write_file(fs, stream, max_bytes=None, expected_bytes=None, **kwargs):
+    """
+    Writes what `stream` reads into a new GridFS file, a GridFS chunk at a time, and returns
+    the closed GridIn. `kwargs` are the file's attributes (`filename`, `content_type`...).
+    Raises FileTooLarge past `max_bytes`, and ParseError when the stream ends before
+    `expected_bytes` (a truncated upload); nothing is stored then, nor on other errors.
+    """
+    grid_in = fs.new_file(**kwargs)
+    length = 0
+    try:
+        while stream is not None:
+            data = stream.read(grid_in.chunk_size)
+            if not data:
+                break
+            length += len(data)
+            if max_bytes is not None and length > max_bytes:
+                raise FileTooLarge('The file is larger than %d bytes.' % max_bytes)
+            grid_in.write(data)
+        check_length(length, expected_bytes)
+    except Exception:
+        grid_in.abort()
+        raise
+    grid_in.close()
+    return grid_in
+
+
+def iter_bytes(value, start, end, chunk_size):
+    """
+    Bytes `start` to `end` of `value`, `chunk_size` bytes at a time, sliced off a memoryview.
+    """
+    view = memoryview(value)
+    for position in range(start, end, chunk_size):
+        yield bytes(view[position:min(position + chunk_size, end)])
+
+
+def read_bytes(stream, chunk_size, max_bytes=None, expected_bytes=None):
+    """
+    Reads `stream` to its end, `chunk_size` bytes at a time. Raises FileTooLarge as soon as
+    more than `max_bytes` were read, and ParseError when fewer than `expected_bytes` were.
+    """
+    data = bytearray()
+    while stream is not None:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if max_bytes is not None and len(data) + len(chunk) > max_bytes:
+            raise FileTooLarge('The body is larger than %d bytes.' % max_bytes)
+        data.extend(chunk)
+    check_length(len(data), expected_bytes)
+    return bytes(data)
@@ -0,0 +1,198 @@
+from __future__ import unicode_literals
+
+import logging
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.core.exceptions import ImproperlyConfigured, ValidationError as DjangoValidationError
+from django.utils import timezone
+from mongoengine import fields as me_fields
+from rest_framework import fields as drf_fields
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from rest_framework_mongoengine.fields import ListField
+from rest_framework_mongoengine.utils import get_db_field, get_indexed_fields
+
+logger = logging.getLogger('rest_framework_mongoengine')
+
+
+class MongoFilterBackend(BaseFilterBackend):
+    """
+    Filters the queryset from query params declared in the view's `filter_fields`.
+
+        class BlogList(ListAPIView):
+            filter_backends = (MongoFilterBackend,)
+            filter_fields = {
+                'title': ['exact', 'in'],
+                'owner': ['exact'],
+                'tags': ['exact', 'all', 'exists'],
+            }
+
+    Params are `<field>` or `<field>__<lookup>`, list lookups take comma separated values,
+    e.g. `?title__in=a,b`. Values are coerced through the serializer field of that name,
+    so every name of `filter_fields` has to be a field of the view's serializer.
+
+    When none of the filters of a request is backed by a leading index key (from the
+    document's `Meta.indexes`, `unique` fields or `_id`), the request would trigger a
+    collection scan. The view's `unindexed_filter_policy` decides what happens then:
+    'reject' (400, default), 'warn' (log a warning and run the query) or 'allow'.
+    """
+
+    lookups = ('exact', 'ne', 'lt', 'lte', 'gt', 'gte', 'in', 'nin', 'all', 'size', 'exists')
+    list_lookups = ('in', 'nin', 'all')
+    # lookups that can select documents through an index
+    indexable_lookups = ('exact', 'lt', 'lte', 'gt', 'gte', 'in', 'all')
+    list_separator = ','
+    unindexed_filter_policy = 'reject'
+
+    def get_filter_fields(self, view):
+        filter_fields = getattr(view, 'filter_fields', None) or {}
+        if isinstance(filter_fields, (list, tuple)):
+            filter_fields = dict((name, ['exact']) for name in filter_fields)
+        return filter_fields
+
+    def parse_param(self, param):
+        name, sep, lookup = param.rpartition('__')
+        if sep and lookup in self.lookups:
+            return name, lookup
+        return param, 'exact'
+
+    def get_filters(self, request, view):
+        """
+        Returns a list of (source, lookup, value) for the filter params of the request.
+        """
+        filter_fields = self.get_filter_fields(view)
+        if not filter_fields:
+            return []
+
+        serializer_fields = view.get_serializer().fields
+        missing = [name for name in filter_fields if name not in serializer_fields]
+        if missing:
+            raise ImproperlyConfigured('%s.filter_fields names %s, which are not fields of its serializer.' %
+                                       (view.__class__.__name__, ', '.join(sorted(missing))))
+        filters = []
+        errors = {}
+        for param, value in request.query_params.items():
+            name, lookup = self.parse_param(param)
+            if name not in filter_fields:
+                continue
+            if lookup not in filter_fields[name]:
+                errors[param] = ['Lookup "%s" is not allowed on "%s".' % (lookup, name)]
+                continue
+
+            field = serializer_fields[name]
+            try:
+                value = self.coerce(field, lookup, value)
+            except ValidationError as exc:
+                errors[param] = exc.detail
+            except DjangoValidationError as exc:
+                errors[param] = list(exc.messages)
+            except (InvalidId, TypeError, ValueError):
+                errors[param] = ['Invalid value.']
+            else:
+                filters.append((field.source or name, lookup, value))
+
+        if errors:
+            raise ValidationError(errors)
+        return filters
+
+    def coerce(self, field, lookup, value):
+        if lookup == 'exists':
+            return drf_fields.BooleanField().to_internal_value(value)
+        if lookup == 'size':
+            return drf_fields.IntegerField().to_internal_value(value)
+
+        if isinstance(field, ListField):
+            #filter on list elements
+            field = field.fields[field.model_field.name]
+
+        if lookup in self.list_lookups:
+            return [field.to_internal_value(v) for v in value.split(self.list_separator)]
+        return field.to_internal_value(value)
+
+    def check_indexes(self, request, view, document, filters):
+        indexed = get_indexed_fields(document)
+        sources = [source for source, lookup, value in filters]
+        if any(get_db_field(document, source) in indexed
+               for source, lookup, value in filters if lookup in self.indexable_lookups):
+            return
+
+        policy = getattr(view, 'unindexed_filter_policy', self.unindexed_filter_policy)
+        message = 'Filtering on %s is not backed by an index of %s.' % (', '.join(sources), document.__name__)
+        if policy == 'reject':
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+        elif policy == 'warn':
+            logger.warning(message, extra={
+                'view': view.__class__.__name__,
+                'path': request.path,
+                'filters': sources,
+            })
+
+    def filter_queryset(self, request, queryset, view):
+        filters = self.get_filters(request, view)
+        if not filters:
+            return queryset
+
+        self.check_indexes(request, view, queryset._document, filters)
+
+        kwargs = {}
+        for source, lookup, value in filters:
+            key = source if lookup == 'exact' else '%s__%s' % (source, lookup)
+            kwargs[key] = value
+        return queryset.filter(**kwargs)
+
+
+def objectid_time_bounds(after=None, before=None):
+    """
+    Returns queryset filter kwargs selecting documents whose ObjectId `_id` was
+    generated at or after `after` and before `before`. ObjectIds carry seconds,
+    so bounds are truncated to the second. Naive datetimes are taken to be in
+    the default timezone, like DRF's DateTimeField returns them.
+    """
+    kwargs = {}
+    for name, value in (('pk__gte', after), ('pk__lt', before)):
+        if value is None:
+            continue
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.get_default_timezone())
+        kwargs[name] = ObjectId.from_datetime(value)
+    return kwargs
+
+
+class ObjectIdTimeRangeFilter(BaseFilterBackend):
+    """
+    Filters on creation time through the timestamp encoded in default ObjectId `_id`s:
+    `?created_after=2015-06-01T00:00:00Z&created_before=2015-07-01T00:00:00Z`.
+
+    The bounds become an `_id` range, so the query is served by the `_id` index and no
+    separate `created_at` field (or index) is needed. Since the range is on `_id`, the
+    planner intersects it with the cursor bound of `KeysetPagination` into a single `_id`
+    index range scan.
+    """
+
+    after_query_param = 'created_after'
+    before_query_param = 'created_before'
+
+    def parse_datetime(self, request, param):
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        try:
+            return drf_fields.DateTimeField().to_internal_value(value)
+        except ValidationError as exc:
+            raise ValidationError({param: exc.detail})
+
+    def filter_queryset(self, request, queryset, view):
+        after = self.parse_datetime(request, self.after_query_param)
+        before = self.parse_datetime(request, self.before_query_param)
+        if after is None and before is None:
+            return queryset
+
+        document = queryset._document
+        if not isinstance(document._fields[document._meta['id_field']], me_fields.ObjectIdField):
+            raise ImproperlyConfigured(
+                '%s requires %s to use ObjectId primary keys.' % (self.__class__.__name__, document.__name__))
+
+        return queryset.filter(**objectid_time_bounds(after, before))
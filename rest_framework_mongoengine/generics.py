@@ -1,7 +1,13 @@
+from django.http import Http404
+from mongoengine.errors import InvalidQueryError, ValidationError
 from rest_framework import mixins
 from rest_framework import generics as drf_generics
+from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 from .shortcuts import get_document_or_404
+from .mixins import EmbeddedListItemMixin, GridFSFileMixin, BinaryFieldMixin
+from .updates import VersionPreconditionFailed
+from .debug import start_inspection, stop_inspection, is_inspecting, record_queryset, report
 from mongoengine.queryset.base import BaseQuerySet
 
 
@@ -11,6 +17,41 @@ class GenericAPIView(drf_generics.GenericAPIView):
     """
     lookup_field = 'id'
 
+    # QueryOptions (max_time_ms, hint, batch_size, comment, read_concern) applied to
+    # the view's queryset and to dereference queries of its serializers.
+    query_options = None
+
+    # request.META key holding the request id put into query comments.
+    request_id_header = 'HTTP_X_REQUEST_ID'
+
+    # Development aid: record the queries of each request, explain them and report
+    # collection scans, in-memory sorts and poor examined/returned ratios through the
+    # `X-Query-Plan` header and warnings on the `rest_framework_mongoengine.debug` logger.
+    # Register a debug.QueryListener to record every query as it was sent.
+    query_debug = False
+    query_debug_options = {}
+    query_inspector = None
+
+    # Model field holding the version of the documents, for views without a serializer
+    # naming it in `Meta.version_field` (e.g. views writing list items or files in place).
+    version_field = None
+
+    def get_query_options(self):
+        """
+        Returns `query_options` for this request, with `comment` tagged with
+        the view name and request id so queries can be traced in the profiler.
+        """
+        if self.query_options is None:
+            return None
+
+        tags = [self.query_options.comment, self.__class__.__name__]
+        request = getattr(self, 'request', None)
+        if request is not None:
+            tags.append(request.META.get(self.request_id_header))
+        comment = ' '.join(tag for tag in tags if tag)
+
+        return self.query_options.copy(comment=comment)
+
     def get_queryset(self):
         """
         Re evaluate queryset, fixes #63
@@ -20,8 +61,73 @@ class GenericAPIView(drf_generics.GenericAPIView):
         if isinstance(queryset, BaseQuerySet):
             queryset = queryset.all()
 
+            query_options = self.get_query_options()
+            if query_options is not None:
+                queryset = query_options.apply(queryset)
+
         return queryset
 
+    def initial(self, request, *args, **kwargs):
+        if self.query_debug:
+            self.query_inspector = start_inspection(**self.query_debug_options)
+        super(GenericAPIView, self).initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(GenericAPIView, self).finalize_response(request, response, *args, **kwargs)
+        inspector = stop_inspection() if self.query_debug else None
+        if inspector is not None:
+            response = report(inspector, self, request, response)
+
+        # version of a single document as ETag, to be sent back in If-Match
+        version_field = self.get_version_field()
+        data = getattr(response, 'data', None)
+        if (version_field is not None and isinstance(data, dict) and data.get(version_field) is not None and
+                200 <= response.status_code < 300 and not response.has_header('ETag')):
+            response['ETag'] = '"%s"' % data[version_field]
+        return response
+
+    def paginate_queryset(self, queryset):
+        page = super(GenericAPIView, self).paginate_queryset(queryset)
+        if is_inspecting() and isinstance(queryset, BaseQuerySet):
+            #explained bounded to the page, as it ran
+            record_queryset(queryset.limit(max(len(page), 1)) if page is not None else queryset, 'list')
+        return page
+
+    def get_serializer_context(self):
+        context = super(GenericAPIView, self).get_serializer_context()
+        context['query_options'] = self.get_query_options()
+        #values of these types are left to the renderer, see renderers.FastJSONRenderer
+        renderer = getattr(getattr(self, 'request', None), 'accepted_renderer', None)
+        context['native_types'] = getattr(renderer, 'native_types', ())
+        if getattr(self, 'request', None) is not None and self.request.method not in SAFE_METHODS:
+            context['if_match_version'] = self.get_if_match_version()
+        return context
+
+    def get_version_field(self):
+        #`Meta.version_field` of the serializer, see DocumentSerializer.pop_expected_version()
+        if self.version_field is not None:
+            return self.version_field
+        try:
+            serializer_class = self.get_serializer_class()
+        except AssertionError:
+            return None
+        return getattr(getattr(serializer_class, 'Meta', None), 'version_field', None)
+
+    def get_if_match_version(self):
+        """
+        The document version required by the request's If-Match header, as sent in
+        ETags: `"3"` (or `W/"3"`). None without the header, or for `*`.
+        """
+        value = self.request.META.get('HTTP_IF_MATCH', '').strip()
+        if not value or value == '*' or self.get_version_field() is None:
+            return None
+        if value.startswith('W/'):
+            value = value[2:]
+        try:
+            return int(value.strip('"'))
+        except ValueError:
+            raise VersionPreconditionFailed()
+
     def get_object(self):
         """
         *** Inherited from DRF 3 GenericAPIView, swapped get_object_or_404() with get_document_or_404() ***
@@ -45,6 +151,9 @@ class GenericAPIView(drf_generics.GenericAPIView):
         )
 
         filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        if is_inspecting() and isinstance(queryset, BaseQuerySet):
+            #the filtered clone is only built to be recorded
+            record_queryset(queryset.filter(**filter_kwargs), 'get_object')
         obj = get_document_or_404(queryset, **filter_kwargs)
 
         # May raise a permission denied
@@ -52,6 +161,41 @@ class GenericAPIView(drf_generics.GenericAPIView):
 
         return obj
 
+    def get_lookup_query(self):
+        """
+        Returns the raw filter document `get_object()` would query with, for writes
+        that go to the collection without loading the document first.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            return queryset.filter(**filter_kwargs)._query
+        except (ValidationError, InvalidQueryError):
+            raise Http404('No %s matches the given query.' % queryset._document._class_name)
+
+    def get_document_query(self):
+        """
+        `get_lookup_query()`, once object permissions (if any) are checked on the loaded
+        document. For views writing parts of a document (list items, files...) in place.
+        """
+        if self.has_object_permission_checks():
+            # May raise a permission denied
+            self.get_object()
+        return self.get_lookup_query()
+
+    def has_object_permission_checks(self):
+        """
+        True when a permission class implements `has_object_permission`, in which case
+        the object has to be loaded before writing to it.
+        """
+        base = getattr(BasePermission.has_object_permission, '__func__', BasePermission.has_object_permission)
+        for permission in self.get_permissions():
+            method = type(permission).has_object_permission
+            if getattr(method, '__func__', method) is not base:
+                return True
+        return False
+
 
 class CreateAPIView(mixins.CreateModelMixin,
                     GenericAPIView):
@@ -153,4 +297,84 @@ class RetrieveUpdateDestroyAPIView(mixins.RetrieveModelMixin,
         return self.partial_update(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
-        return self.destroy(request, *args, **kwargs)
\ No newline at end of file
+        return self.destroy(request, *args, **kwargs)
+
+
+class EmbeddedListItemAPIView(EmbeddedListItemMixin,
+                              GenericAPIView):
+    """
+    Concrete view for the elements of a list of embedded documents. Routed without the
+    `item_url_kwarg` it lists (GET) and appends (POST) elements, routed with it it
+    retrieves, updates or deletes one element.
+
+        class BlogExtensions(EmbeddedListItemAPIView):
+            queryset = Blog.objects
+            list_field = 'extensions'
+            item_key = 'name'
+
+        url(r'^blogs/(?P<id>[^/.]+)/extensions/$', BlogExtensions.as_view()),
+        url(r'^blogs/(?P<id>[^/.]+)/extensions/(?P<item>[^/.]+)/$', BlogExtensions.as_view()),
+    """
+    def get(self, request, *args, **kwargs):
+        if self.item_url_kwarg in kwargs:
+            return self.retrieve_item(request, *args, **kwargs)
+        return self.list_items(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        return self.append_item(request, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        if self.item_url_kwarg not in kwargs:
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        return self.update_item(request, *args, **kwargs)
+
+    def patch(self, request, *args, **kwargs):
+        if self.item_url_kwarg not in kwargs:
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        return self.partial_update_item(request, *args, **kwargs)
+
+    def delete(self, request, *args, **kwargs):
+        if self.item_url_kwarg not in kwargs:
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        return self.destroy_item(request, *args, **kwargs)
+
+
+class GridFSFileAPIView(GridFSFileMixin,
+                        GenericAPIView):
+    """
+    Concrete view for the file of a document's FileField: downloads (GET), uploads (PUT)
+    or deletes it.
+
+        class ReportFile(GridFSFileAPIView):
+            queryset = Report.objects
+            file_field = 'pdf'
+
+        url(r'^reports/(?P<id>[^/.]+)/pdf/$', ReportFile.as_view()),
+    """
+    def get(self, request, *args, **kwargs):
+        return self.retrieve_file(request, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        return self.upload_file(request, *args, **kwargs)
+
+    def delete(self, request, *args, **kwargs):
+        return self.destroy_file(request, *args, **kwargs)
+
+
+class BinaryFieldAPIView(BinaryFieldMixin,
+                         GenericAPIView):
+    """
+    Concrete view for the raw bytes of a document's BinaryField: reads (GET) or
+    writes (PUT) them.
+
+        class SamplePayload(BinaryFieldAPIView):
+            queryset = Sample.objects
+            binary_field = 'payload'
+
+        url(r'^samples/(?P<id>[^/.]+)/payload/$', SamplePayload.as_view()),
+    """
+    def get(self, request, *args, **kwargs):
+        return self.retrieve_binary(request, *args, **kwargs)
+
+    def put(self, request, *args, **kwargs):
+        return self.upload_binary(request, *args, **kwargs)
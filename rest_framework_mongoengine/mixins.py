@@ -0,0 +1,1281 @@
+from __future__ import unicode_literals
+
+import json
+
+import gridfs
+from bson import Binary, ObjectId
+from bson.son import SON
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import six
+from mongoengine import fields as me_fields, signals
+from mongoengine.errors import InvalidQueryError, ValidationError as me_ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from rest_framework import fields as drf_fields, mixins, status, validators
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FileUploadParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from rest_framework_mongoengine.buffering import get_write_buffer
+from rest_framework_mongoengine.debug import record_find, record_queryset
+from rest_framework_mongoengine.export import (get_split_points, get_ranges, load_checkpoint, get_executor,
+                                               run_export)
+from rest_framework_mongoengine.fields import (ObjectIdField, BinaryField, ReferenceField, ListField, MapField,
+                                               DictField, DynamicField, EmbeddedDocumentField)
+from rest_framework_mongoengine.files import (FileTooLarge, RangeNotSatisfiable, get_grid_fs, get_file_etag,
+                                              etag_matches, parse_range, iter_file, write_file, iter_bytes,
+                                              read_bytes)
+from rest_framework_mongoengine.parsers import NDJSONParser, NDJSONStream, InvalidLine
+from rest_framework_mongoengine.renderers import BSONRenderer, CodecOptions, RawBSONDocument
+from rest_framework_mongoengine.updates import (OperatorUpdateBuilder, ListItemSelector, add_version_increment,
+                                                add_version_update, get_version_condition, next_version,
+                                                get_set_document, prefix_update_document, version_conflict)
+from rest_framework_mongoengine.utils import get_db_field, get_indexed_fields
+
+#pymongo's find() options, as aggregate command options
+AGGREGATE_OPTIONS = {'max_time_ms': 'maxTimeMS', 'batch_size': 'batchSize'}
+
+
+def needs_documents(document, *signal_names):
+    """
+    True when writes to `document` have to go through loaded documents: delete rules
+    (CASCADE, NULLIFY...) or receivers of the given mongoengine signals.
+    """
+    if 'pre_delete' in signal_names and document._meta.get('delete_rules'):
+        return True
+    return signals.signals_available and any(
+        getattr(signals, name).has_receivers_for(document) for name in signal_names)
+
+
+def has_unique_validators(serializer):
+    return any(isinstance(validator, validators.UniqueValidator)
+               for field in serializer.fields.values() for validator in field.validators)
+
+
+def nests_references(fields):
+    """
+    True when serializer `fields` (or those nested in them) render referenced documents,
+    rather than their ids.
+    """
+    for field in fields.values():
+        if isinstance(field, ListSerializer):
+            field = field.child
+        if isinstance(field, (ReferenceField, DictField, DynamicField)):
+            if field.go_deeper(is_ref=True):
+                return True
+        elif isinstance(field, (ListField, EmbeddedDocumentField, BaseSerializer)):
+            if nests_references(field.fields):
+                return True
+    return False
+
+
+class VersionedWrite(object):
+    """
+    Version handling of the in-place writes of a view (list items, files...), when it has a
+    version field (see `GenericAPIView.get_version_field()`). Writes are conditioned on the
+    version of the request's If-Match header, when given, and move the version on either
+    way, so the ETags clients hold stop matching.
+    """
+
+    def __init__(self, view, document):
+        version_field = view.get_version_field()
+        self.model_field = document._fields[version_field] if version_field is not None else None
+        self.expected = view.get_if_match_version() if self.model_field is not None else None
+
+    def select(self, select):
+        if self.expected is None:
+            return select
+        return dict(select, **{self.model_field.db_field: get_version_condition(self.model_field, self.expected)})
+
+    def update(self, update):
+        if self.model_field is None or not update:
+            return update
+        if self.expected is None:
+            return add_version_increment(update, self.model_field.db_field)
+        return add_version_update(update, self.model_field.db_field, self.expected)
+
+    def projection(self, projection):
+        if self.model_field is None:
+            return projection
+        return dict(projection, **{self.model_field.db_field: 1})
+
+    def check(self, collection, select):
+        """
+        Raises a 412 when the write on `select` (without the version condition) matched
+        nothing because the document has another version than If-Match.
+        """
+        if self.expected is not None and collection.find_one(select, projection={'_id': 1}) is not None and \
+                collection.find_one(self.select(select), projection={'_id': 1}) is None:
+            raise version_conflict(if_match=True)
+
+    def set_etag(self, response, son, before=False):
+        """
+        Sets the version after the write as ETag of `response`: the one after If-Match, or
+        else the one read back in `son`, the document as it was `before` the write or after.
+        """
+        if self.model_field is None:
+            return response
+        if self.expected is not None:
+            version = next_version(self.expected)
+        else:
+            version = son.get(self.model_field.db_field)
+            if before:
+                version = next_version(version)
+        if version is not None:
+            response['ETag'] = '"%s"' % version
+        return response
+
+
+class OperatorPartialUpdateMixin(object):
+    """
+    PATCH without loading the document first. The body is validated field by field and
+    translated into update operators (see `updates.OperatorUpdateBuilder`): a JSON merge
+    patch plus `$inc`, `$push`, `$addToSet` and `$pull`. It is applied atomically with
+    `find_one_and_update`, and the updated document is returned.
+
+        class PostDetails(OperatorPartialUpdateMixin, RetrieveUpdateAPIView):
+            ...
+
+        PATCH {"text": "edited", "$inc": {"views": 1}, "$addToSet": {"tags": "mongodb"}}
+
+    When a permission class implements `has_object_permission`, the document is still
+    loaded to check it. Mongoengine save signals are not sent. `$inc` is applied only while
+    the result stays within the `min_value`/`max_value` of the model field, else it is a 400.
+
+    With the serializer's `Meta.version_field`, the version is incremented, and the update
+    only applies to the version given by If-Match or by the version field of the body.
+    """
+
+    def partial_update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(partial=True)
+        data = request.data
+        version_field = serializer.version_field
+        if version_field is not None and isinstance(data, dict):
+            data = dict(data)
+            expected, if_match = serializer.pop_expected_version(data)
+            if expected is not None and not if_match:
+                expected = serializer.fields[version_field].run_validation(expected)
+
+        Model = serializer.Meta.model
+        collection = Model._get_collection()
+        if self.has_object_permission_checks():
+            # May raise a permission denied
+            serializer.instance = self.get_object()
+        select = self.get_lookup_query()
+        if serializer.instance is None and has_unique_validators(serializer):
+            #unique validators leave out the updated document, by its pk
+            serializer.instance = self.get_lookup_stand_in(Model, select)
+        builder = OperatorUpdateBuilder(serializer)
+        update = builder.build(data)
+
+        if version_field is not None:
+            version_db_field = Model._fields[version_field].db_field
+            if expected is not None:
+                select = dict(select, **{version_db_field: get_version_condition(Model._fields[version_field],
+                                                                                 expected)})
+                if update:
+                    update = add_version_update(update, version_db_field, expected)
+            elif update:
+                update = add_version_increment(update, version_db_field)
+        if update:
+            try:
+                son = collection.find_one_and_update(builder.get_query(select), update,
+                                                     return_document=ReturnDocument.AFTER)
+            except DuplicateKeyError as exc:
+                raise serializer.duplicate_key_error(exc)
+        else:
+            son = collection.find_one(select)
+        if son is None:
+            if builder.conditions and collection.find_one(select, projection={'_id': 1}) is not None:
+                raise builder.bounds_error()
+            if version_field is not None and expected is not None and \
+                    collection.find_one(self.get_lookup_query(), projection={'_id': 1}) is not None:
+                raise version_conflict(if_match)
+            raise Http404('No %s matches the given query.' % Model._class_name)
+
+        instance = Model._from_son(son)
+        return Response(self.get_serializer(instance).data)
+
+    def get_lookup_stand_in(self, Model, select):
+        """
+        A `Model` instance with only the pk of the document `select` matches.
+        """
+        pk = select.get('_id')
+        if pk is None or isinstance(pk, dict):
+            son = Model._get_collection().find_one(select, projection={'_id': 1})
+            if son is None:
+                raise Http404('No %s matches the given query.' % Model._class_name)
+            pk = son['_id']
+        instance = Model()
+        instance.pk = pk
+        return instance
+
+
+class FetchFreeDestroyModelMixin(mixins.DestroyModelMixin):
+    """
+    DELETE with a single `delete_one` on the lookup filter, without loading the document.
+    404 is returned when nothing was deleted.
+
+    The document is still loaded (and `perform_destroy()` called) when a permission class
+    implements `has_object_permission`, or when delete rules or delete signal receivers
+    need it.
+    """
+
+    def destroy(self, request, *args, **kwargs):
+        document = self.get_queryset()._document
+        if self.has_object_permission_checks() or needs_documents(document, 'pre_delete', 'post_delete'):
+            return super(FetchFreeDestroyModelMixin, self).destroy(request, *args, **kwargs)
+
+        result = document._get_collection().delete_one(self.get_lookup_query())
+        if not result.deleted_count:
+            raise Http404('No %s matches the given query.' % document._class_name)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FetchFreeUpdateModelMixin(mixins.UpdateModelMixin):
+    """
+    PUT with a single `update_one` of the validated payload on the lookup filter, without
+    loading the document. Every serializer field is written, fields validated to None are
+    unset. 404 is returned when no document matched.
+
+    The regular, loading update is used for PATCH, when `lookup_field` is not the primary
+    key (uniqueness validators exclude the document through its id), when a permission
+    class implements `has_object_permission` or when save signal receivers exist.
+
+    With the serializer's `Meta.version_field`, the version is incremented, and the update
+    only applies to the version given by If-Match or by the version field of the body.
+    """
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.get('partial', False)
+        document = self.get_queryset()._document
+        pk_name = document._meta['id_field']
+        if (partial or self.lookup_field not in ('pk', pk_name) or self.has_object_permission_checks() or
+                needs_documents(document, 'pre_save', 'post_save')):
+            return super(FetchFreeUpdateModelMixin, self).update(request, *args, **kwargs)
+
+        select = self.get_lookup_query()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        pk = document._fields[pk_name].to_python(self.kwargs[lookup_url_kwarg])
+
+        # unsaved stand-in, so validators can exclude the document being updated
+        serializer = self.get_serializer(document(**{pk_name: pk}), data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        validated_data = dict(serializer.validated_data)
+        version_field = serializer.version_field
+        if version_field is not None:
+            expected, if_match = serializer.pop_expected_version(validated_data)
+        names = list(validated_data) + [field.field_name for field in serializer.embedded_document_serializer_fields]
+        validated_data[pk_name] = pk
+        instance = serializer.build_instance(validated_data)
+        if not serializer.trust_validation:
+            instance.validate()
+
+        update = get_set_document(instance, names)
+        collection = document._get_collection()
+        if version_field is not None:
+            version_db_field = document._fields[version_field].db_field
+            if expected is None:
+                versioned_select, versioned_update = select, add_version_increment(update, version_db_field)
+            else:
+                condition = get_version_condition(document._fields[version_field], expected)
+                versioned_select = dict(select, **{version_db_field: condition})
+                versioned_update = add_version_update(update, version_db_field, expected)
+            try:
+                son = collection.find_one_and_update(versioned_select, versioned_update,
+                                                     projection={version_db_field: 1},
+                                                     return_document=ReturnDocument.AFTER)
+            except DuplicateKeyError as exc:
+                raise serializer.duplicate_key_error(exc)
+            if son is None and expected is not None and \
+                    collection.find_one(select, projection={'_id': 1}) is not None:
+                raise version_conflict(if_match)
+            matched = son is not None
+            if matched:
+                setattr(instance, version_field, son.get(version_db_field))
+        elif update:
+            try:
+                result = collection.update_one(select, update)
+            except DuplicateKeyError as exc:
+                raise serializer.duplicate_key_error(exc)
+            matched = result.matched_count
+        else:
+            matched = collection.find_one(select, projection={'_id': 1}) is not None
+        if not matched:
+            raise Http404('No %s matches the given query.' % document._class_name)
+
+        instance._created = False
+        instance._clear_changed_fields()
+        return Response(self.get_serializer(instance).data)
+
+
+class BulkDestroyMixin(object):
+    """
+    Viewset action deleting many documents with a single `delete_many`:
+    `POST <prefix>/bulk_destroy/` (or DELETE) with `{"ids": [...]}`, and/or filter query
+    params handled by the view's filter backends. Requests that would delete every
+    document of the queryset are refused. Responds with `{"deleted": <count>}`.
+
+    With a version field, ids may be given with the version the document must still have,
+    as `{"id": ..., "version": 3}`. Documents changed meanwhile are not deleted, and are
+    reported per index with a 409, the other documents are deleted.
+
+    Documents are loaded when object permissions, delete rules or delete signal
+    receivers need them.
+    """
+    bulk_destroy_ids_key = 'ids'
+    version_conflict_message = 'The document was changed meanwhile, reload it and try again.'
+
+    def get_bulk_destroy_queryset(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        document = queryset._document
+        filtered = queryset._query != self.get_queryset()._query
+        #(index, pk) of the ids given with a version
+        self.versioned_ids = []
+
+        ids = request.data.get(self.bulk_destroy_ids_key) if hasattr(request.data, 'get') else None
+        if ids is not None:
+            if not isinstance(ids, list):
+                raise ValidationError({self.bulk_destroy_ids_key: ['Expected a list of ids.']})
+            pk_name = document._meta['id_field']
+            pk_field = document._fields[pk_name]
+            version_field = self.get_version_field()
+            plain = []
+            versioned = []
+            try:
+                for index, pk in enumerate(ids):
+                    if isinstance(pk, dict) and version_field is not None:
+                        version_model_field = document._fields[version_field]
+                        version = version_model_field.to_python(pk.get(version_field))
+                        if version is None:
+                            raise ValueError(version_field)
+                        version_model_field.validate(version)
+                        pk = pk_field.to_python(pk.get(pk_name))
+                        versioned.append({'_id': pk_field.to_mongo(pk), version_model_field.db_field:
+                                          get_version_condition(version_model_field, version)})
+                        self.versioned_ids.append((index, pk))
+                    else:
+                        plain.append(pk_field.to_mongo(pk_field.to_python(pk)))
+                if plain:
+                    versioned.append({'_id': {'$in': plain}})
+                queryset = queryset.filter(__raw__={'$or': versioned} if versioned else {'_id': {'$in': []}})
+                queryset._query
+            except (me_ValidationError, InvalidQueryError, TypeError, ValueError):
+                raise ValidationError({self.bulk_destroy_ids_key: ['Invalid id.']})
+        elif not filtered:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Give ids or filters, deleting every document is not allowed.']})
+        return queryset
+
+    @list_route(methods=['post', 'delete'])
+    def bulk_destroy(self, request, *args, **kwargs):
+        queryset = self.get_bulk_destroy_queryset(request)
+        document = queryset._document
+
+        if self.has_object_permission_checks():
+            for obj in queryset:
+                # May raise a permission denied
+                self.check_object_permissions(request, obj)
+
+        if needs_documents(document, 'pre_delete', 'post_delete'):
+            deleted = queryset.delete()
+        else:
+            deleted = document._get_collection().delete_many(queryset._query).deleted_count
+
+        if self.versioned_ids:
+            #documents given with a version and still there changed meanwhile
+            remaining = set(obj.pk for obj in self.filter_queryset(self.get_queryset()).filter(
+                pk__in=[pk for index, pk in self.versioned_ids]).only(document._meta['id_field']))
+            if remaining:
+                errors = [{} for pk in request.data[self.bulk_destroy_ids_key]]
+                for index, pk in self.versioned_ids:
+                    if pk in remaining:
+                        errors[index] = {self.get_version_field(): [self.version_conflict_message]}
+                return Response({'deleted': deleted, self.bulk_destroy_ids_key: errors},
+                                status=status.HTTP_409_CONFLICT)
+        return Response({'deleted': deleted})
+
+
+class BufferedCreateModelMixin(mixins.CreateModelMixin):
+    """
+    POST that queues the validated document in a `buffering.WriteBuffer`, which writes
+    queued documents with `insert_many`, in batches. The document's ObjectId is generated
+    up front, and the response is a 202 holding the serialized document.
+
+    With `buffered_create_ack = True` the request waits until its batch was written
+    and responds with 201, or with the write error (e.g. a duplicate key) as a 400, or
+    504 when that takes longer than `buffered_create_ack_timeout` seconds.
+
+        class EventCreate(BufferedCreateModelMixin, CreateAPIView):
+            serializer_class = EventSerializer
+            write_buffer_options = {'batch_size': 1000, 'flush_interval': 0.2}
+
+    A full buffer responds with 503 and a Retry-After header. The regular create is used
+    for documents without ObjectId primary keys, or when save signal receivers exist.
+    """
+    write_buffer_options = {}
+    buffered_create_ack = False
+    buffered_create_ack_timeout = 10
+
+    def get_write_buffer(self, document):
+        return get_write_buffer(document, **self.write_buffer_options)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        document = serializer.Meta.model
+        pk_name = document._meta['id_field']
+        if (not isinstance(document._fields[pk_name], me_fields.ObjectIdField) or
+                needs_documents(document, 'pre_save', 'post_save')):
+            self.perform_create(serializer)
+            headers = self.get_success_headers(serializer.data)
+            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+        instance = serializer.build_instance(dict(serializer.validated_data))
+        if not serializer.trust_validation:
+            try:
+                instance.validate()
+            except me_ValidationError as exc:
+                raise ValidationError(exc.to_dict() or {api_settings.NON_FIELD_ERRORS_KEY: [exc.message]})
+        if instance.pk is None:
+            instance.pk = ObjectId()
+
+        pending = self.get_write_buffer(document).put(instance.to_mongo())
+        response_status = status.HTTP_202_ACCEPTED
+        if self.buffered_create_ack:
+            error = pending.wait(self.buffered_create_ack_timeout)
+            if error is not None:
+                raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [error['errmsg']]})
+            response_status = status.HTTP_201_CREATED
+
+        instance._created = False
+        instance._clear_changed_fields()
+        data = self.get_serializer(instance).data
+        return Response(data, status=response_status, headers=self.get_success_headers(data))
+
+
+class StreamingListMixin(mixins.ListModelMixin):
+    """
+    Unpaginated lists streamed with a StreamingHttpResponse: the queryset is iterated
+    without caching, `stream_chunk_size` documents at a time, and every chunk is
+    serialized (`many=True`) and rendered on its own, then dropped. Memory use depends
+    on the chunk size, not on the number of documents.
+
+    With `stream_select_related = True`, the references of each chunk are fetched with one
+    query per referenced collection, as `select_related()` would for the whole queryset.
+    That is skipped when the serializer renders no referenced documents (see
+    `Meta.dereference_refs` and `depth`).
+
+    Renderers stream chunks through `render_stream(chunks, accepted_media_type,
+    renderer_context)`, an iterable of byte strings. Chunks are serialized data, or the
+    unevaluated `many=True` serializers for renderers setting `renders_documents` (which
+    read the documents themselves). JSON renderers without it write the array piecewise.
+    Other renderers (e.g. the browsable API) and paginated lists get the regular response.
+    Since the status is sent first, errors past the first chunk cut the body short.
+    """
+    stream_chunk_size = 500
+    stream_select_related = False
+
+    def can_stream(self, renderer):
+        return hasattr(renderer, 'render_stream') or isinstance(renderer, JSONRenderer)
+
+    def list(self, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        if self.paginator is not None or not self.can_stream(renderer):
+            return super(StreamingListMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        record_queryset(queryset, 'list')
+        context = self.get_renderer_context()
+        media_type = request.accepted_media_type
+        if hasattr(renderer, 'render_stream'):
+            content = renderer.render_stream(self.get_chunks(queryset), media_type, context)
+        else:
+            content = self.render_json_array(renderer, self.get_chunks(queryset), media_type, context)
+
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = '%s; charset=%s' % (content_type, renderer.charset)
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    def get_chunks(self, queryset):
+        """
+        Serialized data of the documents of `queryset`, a list per `stream_chunk_size` documents.
+        """
+        queryset = queryset.no_cache()
+        if queryset._batch_size is None:
+            queryset = queryset.batch_size(self.stream_chunk_size)
+        chunk = []
+        for document in queryset:
+            chunk.append(document)
+            if len(chunk) >= self.stream_chunk_size:
+                yield self.serialize_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield self.serialize_chunk(chunk)
+
+    def needs_select_related(self):
+        if not hasattr(self, '_needs_select_related'):
+            self._needs_select_related = (self.stream_select_related and
+                                          nests_references(self.get_serializer().fields))
+        return self._needs_select_related
+
+    def serialize_chunk(self, documents):
+        if self.needs_select_related():
+            from mongoengine.dereference import DeReference
+            depth = getattr(getattr(self.get_serializer_class(), 'Meta', None), 'depth', 1)
+            documents = DeReference()(documents, max_depth=depth or 1)
+        serializer = self.get_serializer(documents, many=True)
+        if getattr(self.request.accepted_renderer, 'renders_documents', False):
+            return serializer
+        return serializer.data
+
+    def render_json_array(self, renderer, chunks, media_type, context):
+        """
+        Render each chunk with a JSON renderer, and join them into one array.
+        """
+        yield b'['
+        first = True
+        for chunk in chunks:
+            if not chunk:
+                continue
+            #the items, without the brackets of the chunk's array
+            items = renderer.render(chunk, media_type, context).strip()[1:-1].strip()
+            yield items if first else b',' + items
+            first = False
+        yield b']'
+
+
+class StreamingBulkCreateMixin(mixins.CreateModelMixin):
+    """
+    POST of an `application/x-ndjson` body creates a document per line. Lines are read off
+    the request as they are needed, and handled in chunks of `ingest_chunk_size`: validated
+    by the serializer with `many=True` (so unique validators query once per chunk), and
+    written with `insert_many`. Memory use depends on the chunk size, not on the body size.
+
+    The response is NDJSON too, streamed as chunks are written: a result per input line,
+    `{"line": 3, "id": "..."}` or `{"line": 4, "errors": {...}}`, then a last line
+    `{"written": 9998, "failed": 2}`. Since the status goes out first, it is 200 whatever
+    happens to the lines. Chunks are inserted unordered; with `ingest_ordered = True`
+    they are inserted in order, and nothing is read after a chunk with failed lines.
+
+    Other bodies are created as usual. `perform_create()` is not called and save signals
+    are not sent for streamed documents.
+
+        class EventList(StreamingBulkCreateMixin, ListCreateAPIView):
+            serializer_class = EventSerializer
+            ingest_chunk_size = 5000
+    """
+    ingest_chunk_size = 1000
+    ingest_ordered = False
+
+    def get_parsers(self):
+        parsers = super(StreamingBulkCreateMixin, self).get_parsers()
+        if not any(isinstance(parser, NDJSONParser) for parser in parsers):
+            parsers.append(NDJSONParser())
+        return parsers
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, NDJSONStream):
+            return super(StreamingBulkCreateMixin, self).create(request, *args, **kwargs)
+        return StreamingHttpResponse(self.ingest(request.data), content_type=NDJSONParser.media_type)
+
+    def get_chunks(self, stream):
+        """
+        Lists of (line number, record) pairs of an NDJSONStream, `ingest_chunk_size` long.
+        """
+        chunk = []
+        for record in stream:
+            #still on the line of the record
+            chunk.append((stream.line_number, record))
+            if len(chunk) >= self.ingest_chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def ingest(self, stream):
+        """
+        Yield the NDJSON result lines for the records of an NDJSONStream.
+        """
+        written = failed = 0
+        for chunk in self.get_chunks(stream):
+            results = self.ingest_chunk(chunk)
+            for result in results:
+                if 'errors' in result:
+                    failed += 1
+                else:
+                    written += 1
+                yield json.dumps(result, cls=encoders.JSONEncoder) + '\n'
+            if self.ingest_ordered and any('errors' in result for result in results):
+                break
+        yield json.dumps({'written': written, 'failed': failed}) + '\n'
+
+    def ingest_chunk(self, chunk):
+        """
+        Validate and insert a chunk of (line number, record) pairs, returns a result per line.
+        """
+        serializer = self.get_serializer(data=[record for line, record in chunk], many=True)
+        child = serializer.child
+        validated = iter(serializer.validate_items(
+            [record for line, record in chunk if not isinstance(record, InvalidLine)]))
+
+        results = []
+        pending = []
+        for line, record in chunk:
+            result = {'line': line}
+            results.append(result)
+            if isinstance(record, InvalidLine):
+                result['errors'] = {api_settings.NON_FIELD_ERRORS_KEY: [record.message]}
+                continue
+            attrs, errors = next(validated)
+            if errors:
+                result['errors'] = errors
+            else:
+                pending.append((result, child.build_instance(attrs)))
+
+        if not child.trust_validation:
+            errors = serializer.validate_instances([instance for result, instance in pending])
+            for (result, instance), error in zip(pending, errors):
+                if error:
+                    result['errors'] = error
+            pending = [(result, instance) for result, instance in pending if 'errors' not in result]
+
+        errors = serializer.insert([instance for result, instance in pending], ordered=self.ingest_ordered)
+        for (result, instance), error in zip(pending, errors):
+            if error:
+                result['errors'] = error
+            else:
+                result['id'] = six.text_type(instance.pk)
+        return results
+
+
+class BSONPassthroughMixin(object):
+    """
+    When `renderers.BSONRenderer` is negotiated, retrieve and (unpaginated) list send the
+    raw BSON of the stored documents, without decoding, serializing and encoding them
+    again. That only happens when the serializer outputs the stored fields as they are
+    (see `get_passthrough_projection()`); stored fields it lacks are projected out. Fields
+    named unlike their db field, such as `id`, are renamed by the server, in an aggregation.
+    Fields missing from a stored document are left out rather than sent as defaults, so
+    fields with a default are only passed through when `passthrough_defaults_stored` says
+    every stored document has them. List ordering is the queryset's, or the document's
+    `meta['ordering']`.
+
+    The regular path is used when a permission class implements `has_object_permission`.
+    Requires pymongo >= 3.2.
+    """
+    passthrough_field_types = (drf_fields.CharField, drf_fields.IntegerField, drf_fields.FloatField,
+                               drf_fields.BooleanField, ObjectIdField, BinaryField)
+    passthrough_defaults_stored = False
+
+    def use_passthrough(self, request):
+        return (RawBSONDocument is not None and isinstance(getattr(request, 'accepted_renderer', None), BSONRenderer)
+                and not self.has_object_permission_checks())
+
+    def is_passthrough_field(self, field, model_field):
+        """
+        True when `field` outputs the values of `model_field` as they are stored.
+        """
+        if isinstance(field, ListField) and not isinstance(field, MapField):
+            return self.is_passthrough_field(field.fields[model_field.name], model_field.field)
+        if isinstance(field, ReferenceField):
+            return not field.go_deeper(is_ref=True) and not model_field.dbref
+        if isinstance(field, drf_fields.DateTimeField):
+            return getattr(field, 'format', api_settings.DATETIME_FORMAT) is None
+        if isinstance(field, BinaryField):
+            return field.out_of_band_bytes is None
+        return isinstance(field, self.passthrough_field_types)
+
+    def get_passthrough_projection(self, serializer):
+        """
+        Projection of the stored fields the serializer outputs, or None when it would change them.
+        Fields named unlike their db field are projected as `{field_name: '$<db_field>'}`.
+        """
+        document = serializer.Meta.model
+        projection = {'_id': 0}
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            model_field = document._fields.get(field.source)
+            if model_field is None or not self.is_passthrough_field(field, model_field):
+                return None
+            if model_field.default is not None and not self.passthrough_defaults_stored:
+                return None
+            if field.field_name == model_field.db_field:
+                projection[model_field.db_field] = 1
+            else:
+                projection[field.field_name] = '$' + model_field.db_field
+        if len(projection) == 1:
+            #an `_id: 0` projection alone would send every other field
+            return None
+        return projection
+
+    def get_raw_collection(self, document):
+        return document._get_collection().with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+
+    def find_raw(self, document, query, projection, **kwargs):
+        """
+        The raw documents matching `query`, read with `find(query, projection, **kwargs)`,
+        or with an aggregation when the projection renames fields (which `find()` only
+        supports from MongoDB 4.4).
+        """
+        collection = self.get_raw_collection(document)
+        if not any(isinstance(value, six.string_types) for value in projection.values()):
+            return collection.find(query, projection=projection, **kwargs)
+
+        pipeline = [{'$match': query}]
+        if kwargs.get('sort'):
+            pipeline.append({'$sort': SON(kwargs.pop('sort'))})
+        for key in ('skip', 'limit'):
+            if kwargs.get(key):
+                pipeline.append({'$' + key: kwargs.pop(key)})
+        pipeline.append({'$project': projection})
+        options = dict((AGGREGATE_OPTIONS.get(key, key), value) for key, value in kwargs.items())
+        return collection.aggregate(pipeline, **options)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        projection = self.get_passthrough_projection(serializer) if self.use_passthrough(request) else None
+        if projection is None:
+            return super(BSONPassthroughMixin, self).retrieve(request, *args, **kwargs)
+
+        document = serializer.Meta.model
+        son = next(iter(self.find_raw(document, self.get_lookup_query(), projection, limit=1)), None)
+        if son is None:
+            raise Http404('No %s matches the given query.' % document._class_name)
+        return Response(son)
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        projection = None
+        if self.paginator is None and self.use_passthrough(request):
+            projection = self.get_passthrough_projection(serializer)
+        if projection is None:
+            return super(BSONPassthroughMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        query_options = self.get_query_options()
+        find_kwargs = query_options.find_kwargs() if query_options is not None else {}
+        ordering = queryset._ordering
+        if ordering is None and queryset._document._meta.get('ordering'):
+            #as mongoengine sorts the queryset's own cursor
+            ordering = queryset._get_order_by(queryset._document._meta['ordering'])
+        if ordering:
+            find_kwargs['sort'] = ordering
+        if queryset._skip:
+            find_kwargs['skip'] = queryset._skip
+        if queryset._limit:
+            find_kwargs['limit'] = queryset._limit
+        if not any(isinstance(value, six.string_types) for value in projection.values()):
+            find_kwargs['projection'] = projection
+        record_find(queryset._document._get_collection(), queryset._query, 'list', **find_kwargs)
+        find_kwargs.pop('projection', None)
+        return Response(list(self.find_raw(queryset._document, queryset._query, projection, **find_kwargs)))
+
+
+class ParallelExportMixin(object):
+    """
+    Viewset action exporting the filtered queryset as NDJSON, `GET <prefix>/export/`,
+    scanning it in parallel. The values of `export_key` (`_id` by default, else a field
+    leading an index) are split into `export_partitions` ranges at quantiles of a `$sample`
+    of the documents, and the ranges are scanned on a pool of `export_workers` threads, or
+    processes with `export_executor = 'process'`, `export_batch_size` documents at a time.
+
+    Batches are written as they complete, so documents come in no particular order; with
+    `export_ordered = True` they are sorted on the export key, then `_id`. Every batch is
+    followed by a checkpoint line, `{"__checkpoint__": "<token>"}`: repeating the request
+    with `?checkpoint=<token>` (and the same filters) resumes the export after that batch.
+
+        class EventViewSet(ParallelExportMixin, ModelViewSet):
+            serializer_class = EventSerializer
+            export_key = 'created'
+            export_executor = 'process'
+
+    Process pools must be started by forking (the default on Unix); their serializers have
+    no request in context. Object permissions are checked on thread pools only, documents
+    failing them are left out.
+    """
+    export_key = 'id'
+    export_partitions = 8
+    export_workers = 4
+    export_executor = 'thread'
+    export_ordered = False
+    export_batch_size = 1000
+    export_sample_size = 100
+    export_checkpoint_param = 'checkpoint'
+    export_checkpoint_key = '__checkpoint__'
+
+    def get_export_key(self, document):
+        db_key = get_db_field(document, self.export_key)
+        if db_key not in get_indexed_fields(document):
+            raise ImproperlyConfigured('Export key %r of %s is not indexed.' % (self.export_key, self.__class__.__name__))
+        return db_key
+
+    def get_export_ranges(self, request, queryset, db_key):
+        token = request.query_params.get(self.export_checkpoint_param)
+        if token:
+            return load_checkpoint(token)
+        points = get_split_points(queryset._document._get_collection(), queryset._query, db_key,
+                                  self.export_partitions, self.export_sample_size * self.export_partitions)
+        return get_ranges(points)
+
+    def get_export_task(self, queryset, db_key):
+        """
+        Returns a function building the worker task (see `export.export_batch()`) of a range.
+        """
+        query_options = self.get_query_options()
+        task = {
+            'document': queryset._document,
+            'db_key': db_key,
+            'query': queryset._query,
+            'find_kwargs': query_options.find_kwargs() if query_options is not None else {},
+            'batch_size': self.export_batch_size,
+            'serializer_class': self.get_serializer_class(),
+            'context': {},
+        }
+        if self.export_executor != 'process':
+            task['context'] = dict(self.get_serializer_context(), native_types=())
+            if self.has_object_permission_checks():
+                task['filter_documents'] = self.filter_export_documents
+        elif self.has_object_permission_checks():
+            raise ImproperlyConfigured('Object permissions can not be checked on process pools, '
+                                       'use export_executor = "thread".')
+        return lambda export_range: dict(task, range=export_range)
+
+    def filter_export_documents(self, documents):
+        allowed = []
+        for document in documents:
+            if all(permission.has_object_permission(self.request, self, document)
+                   for permission in self.get_permissions()):
+                allowed.append(document)
+        return allowed
+
+    @list_route(methods=['get'])
+    def export(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        record_queryset(queryset, 'export')
+        db_key = self.get_export_key(queryset._document)
+        ranges = self.get_export_ranges(request, queryset, db_key)
+        make_task = self.get_export_task(queryset, db_key)
+        executor = get_executor(self.export_executor, self.export_workers)
+        content = run_export(ranges, make_task, executor, self.export_batch_size,
+                             ordered=self.export_ordered, checkpoint_key=self.export_checkpoint_key)
+        return StreamingHttpResponse(content, content_type=NDJSONParser.media_type)
+
+
+class EmbeddedListItemMixin(object):
+    """
+    Reads and writes single elements of a `ListField(EmbeddedDocumentField(...))` in place,
+    without loading or rewriting the whole list. Elements are addressed by their index, or
+    by the value of their `item_key` field.
+
+    - list: the elements, read with a projection of the list field only.
+    - append: `$push` of a new element. With `item_key`, 400 when the key is taken.
+    - retrieve: the element, read with a `$slice`/`$elemMatch` projection.
+    - update: `$set` of the element (PUT), or of the given element fields only (PATCH),
+      through `<list>.<index>` or `<list>.$[item]` with arrayFilters. With `item_key`, 400
+      when the new key is taken by another element.
+    - destroy: `$pull` by key. By index, `$unset` of the element then `$pull` of the null
+      left in its place; a read in between sees that null.
+
+    Elements are validated with `item_serializer_class`, an `EmbeddedDocumentSerializer`
+    for the element's document (generated when not set). 404 is returned when the document
+    or the element does not exist. With a version field, writes apply to the If-Match
+    version only (412 otherwise) and move it on, see `VersionedWrite`.
+    """
+    list_field = None
+    item_key = None
+    item_url_kwarg = 'item'
+    item_serializer_class = None
+
+    def get_list_model_field(self):
+        document = self.get_queryset()._document
+        model_field = document._fields.get(self.list_field)
+        assert (isinstance(model_field, me_fields.ListField) and
+                isinstance(model_field.field, me_fields.EmbeddedDocumentField)), (
+            '%s.list_field must name a ListField of EmbeddedDocumentFields of %s.' %
+            (self.__class__.__name__, document.__name__))
+        return model_field
+
+    def get_item_serializer_class(self):
+        if self.item_serializer_class is not None:
+            return self.item_serializer_class
+        from rest_framework_mongoengine.serializers import EmbeddedDocumentSerializer
+        item_document = self.get_list_model_field().field.document_type
+        meta = type(str('Meta'), (object,), {'model': item_document})
+        return type(str('%sSerializer' % item_document.__name__), (EmbeddedDocumentSerializer,), {'Meta': meta})
+
+    def get_item_serializer(self, *args, **kwargs):
+        kwargs['context'] = self.get_serializer_context()
+        return self.get_item_serializer_class()(*args, **kwargs)
+
+    def get_item_selector(self, value=None):
+        """
+        ListItemSelector of the requested element, or of the element keyed `value`.
+        """
+        model_field = self.get_list_model_field()
+        not_found = Http404('No %s matches the given query.' % model_field.field.document_type.__name__)
+
+        if self.item_key is None:
+            try:
+                index = int(self.kwargs[self.item_url_kwarg])
+            except ValueError:
+                raise not_found
+            if index < 0:
+                raise not_found
+            return ListItemSelector(model_field.db_field, index=index)
+
+        key_field = model_field.field.document_type._fields[self.item_key]
+        if value is None:
+            try:
+                value = key_field.to_python(self.kwargs[self.item_url_kwarg])
+            except (TypeError, ValueError):
+                raise not_found
+        return ListItemSelector(model_field.db_field, key=key_field.db_field, value=key_field.to_mongo(value))
+
+    def get_collection(self):
+        return self.get_queryset()._document._get_collection()
+
+    def get_items(self, son):
+        document = self.get_queryset()._document
+        if son is None:
+            raise Http404('No %s matches the given query.' % document._class_name)
+        return getattr(document._from_son(son), self.list_field) or []
+
+    def get_item(self, son):
+        items = self.get_items(son)
+        if not items:
+            raise Http404('No %s matches the given query.' % self.get_list_model_field().field.document_type.__name__)
+        return items[0]
+
+    def validate_item(self, serializer, item, names=None):
+        if serializer.trust_validation:
+            return
+        try:
+            if names is None:
+                item.validate()
+            else:
+                for name in names:
+                    value = getattr(item, name)
+                    if value is not None:
+                        item._fields[name].validate(value)
+        except me_ValidationError as exc:
+            raise ValidationError(exc.to_dict() or {api_settings.NON_FIELD_ERRORS_KEY: [exc.message]})
+
+    def list_items(self, request, *args, **kwargs):
+        db_field = self.get_list_model_field().db_field
+        son = self.get_collection().find_one(self.get_document_query(), projection={db_field: 1})
+        return Response(self.get_item_serializer(self.get_items(son), many=True).data)
+
+    def append_item(self, request, *args, **kwargs):
+        serializer = self.get_item_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        item = serializer.build_instance(dict(serializer.validated_data))
+        self.validate_item(serializer, item)
+
+        document = self.get_queryset()._document
+        versioned = VersionedWrite(self, document)
+        document_select = self.get_document_query()
+        select = versioned.select(document_select)
+        model_field = self.get_list_model_field()
+        if self.item_key is not None:
+            selector = self.get_item_selector(getattr(item, self.item_key))
+            select = dict(select, **{'%s.%s' % (selector.db_field, selector.key): {'$ne': selector.value}})
+
+        collection = self.get_collection()
+        update = versioned.update({'$push': {model_field.db_field: item.to_mongo()}})
+        son = collection.find_one_and_update(select, update, projection=versioned.projection({'_id': 1}),
+                                             return_document=ReturnDocument.AFTER)
+        if son is None:
+            versioned.check(collection, document_select)
+            if collection.find_one(document_select, projection={'_id': 1}) is None:
+                raise Http404('No %s matches the given query.' % document._class_name)
+            raise ValidationError({self.item_key: ['An item with this %s already exists.' % self.item_key]})
+        return versioned.set_etag(Response(serializer.to_representation(item), status=status.HTTP_201_CREATED), son)
+
+    def retrieve_item(self, request, *args, **kwargs):
+        selector = self.get_item_selector()
+        select = dict(self.get_document_query(), **selector.query)
+        son = self.get_collection().find_one(select, projection=selector.projection)
+        return Response(self.get_item_serializer(self.get_item(son)).data)
+
+    def update_item(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_item_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        validated_data = dict(serializer.validated_data)
+        names = list(validated_data) + [field.field_name for field in serializer.embedded_document_serializer_fields]
+        item = serializer.build_instance(validated_data)
+
+        selector = self.get_item_selector()
+        if partial:
+            self.validate_item(serializer, item, names)
+            update = prefix_update_document(get_set_document(item, names), selector.path)
+        else:
+            self.validate_item(serializer, item)
+            update = {'$set': {selector.path: item.to_mongo()}}
+
+        versioned = VersionedWrite(self, self.get_queryset()._document)
+        document_select = self.get_document_query()
+        select = dict(versioned.select(document_select), **selector.query)
+        projection = selector.projection
+        renamed = False
+        if self.item_key is not None and self.item_key in names:
+            # the element may have a new key now
+            new_selector = self.get_item_selector(getattr(item, self.item_key))
+            projection = new_selector.projection
+            if new_selector.value != selector.value:
+                # which no other element may hold
+                renamed = True
+                select['%s.%s' % (selector.db_field, selector.key)] = {'$eq': selector.value,
+                                                                      '$ne': new_selector.value}
+
+        collection = self.get_collection()
+        if update:
+            options = {'projection': versioned.projection(projection), 'return_document': ReturnDocument.AFTER}
+            if selector.array_filters:
+                options['array_filters'] = selector.array_filters
+            son = collection.find_one_and_update(select, versioned.update(update), **options)
+        else:
+            son = collection.find_one(select, projection=projection)
+        if son is None:
+            versioned.check(collection, dict(document_select, **selector.query))
+            if renamed and collection.find_one(dict(document_select, **selector.query), projection={'_id': 1}):
+                raise ValidationError({self.item_key: ['An item with this %s already exists.' % self.item_key]})
+        response = Response(self.get_item_serializer(self.get_item(son)).data)
+        return versioned.set_etag(response, son) if update else response
+
+    def partial_update_item(self, request, *args, **kwargs):
+        kwargs['partial'] = True
+        return self.update_item(request, *args, **kwargs)
+
+    def destroy_item(self, request, *args, **kwargs):
+        selector = self.get_item_selector()
+        versioned = VersionedWrite(self, self.get_queryset()._document)
+        document_select = self.get_document_query()
+        removal = selector.removal()
+        collection = self.get_collection()
+        son = collection.find_one_and_update(dict(versioned.select(document_select), **selector.query),
+                                             versioned.update(removal[0]), projection=versioned.projection({'_id': 1}),
+                                             return_document=ReturnDocument.AFTER)
+        if son is None:
+            versioned.check(collection, dict(document_select, **selector.query))
+            raise Http404('No %s matches the given query.' % self.get_list_model_field().field.document_type.__name__)
+        for update in removal[1:]:
+            collection.update_one(document_select, update)
+        return versioned.set_etag(Response(status=status.HTTP_204_NO_CONTENT), son)
+
+
+class GridFSFileMixin(object):
+    """
+    The file of a document's `FileField`/`ImageField`, `file_field`, as a sub-resource
+    streamed to and from GridFS without holding it in memory.
+
+    - retrieve: the file's bytes, streamed a GridFS chunk at a time. A single `Range` is
+      answered with 206 (416 past the end), `If-Range` is honoured. The ETag is the file's
+      id, since uploads make new files: `If-None-Match` is answered with 304.
+    - upload: the request body (PUT) becomes the new file, streamed into GridFS with the
+      request's content type and the filename of `Content-Disposition` or a `filename` URL
+      kwarg. 413 past `file_max_bytes`, 400 when the body is shorter than its Content-Length.
+      The document is pointed at the new file, and the old file deleted.
+    - destroy: unsets the field and deletes the file.
+
+    404 is returned when the document, or its file, does not exist. Uploads are stored as
+    they are: ImageField sizes and thumbnails are not applied. With a version field, uploads
+    and deletions apply to the If-Match version of the document only (412 otherwise) and
+    move it on, see `VersionedWrite`; the file's own ETag is not a document version.
+    """
+    file_field = None
+    file_max_bytes = None
+    file_chunk_size = None
+
+    def get_file_model_field(self):
+        document = self.get_queryset()._document
+        model_field = document._fields.get(self.file_field)
+        assert isinstance(model_field, me_fields.FileField), (
+            '%s.file_field must name a FileField of %s.' % (self.__class__.__name__, document.__name__))
+        return model_field
+
+    def perform_content_negotiation(self, request, force=False):
+        #files go out in their own content type, whatever the renderers
+        return super(GridFSFileMixin, self).perform_content_negotiation(request, force=True)
+
+    def get_grid_out(self):
+        model_field = self.get_file_model_field()
+        document = self.get_queryset()._document
+        son = document._get_collection().find_one(self.get_document_query(), projection={model_field.db_field: 1})
+        if son is None:
+            raise Http404('No %s matches the given query.' % document._class_name)
+        grid_id = son.get(model_field.db_field)
+        try:
+            if grid_id is None:
+                raise gridfs.NoFile()
+            return get_grid_fs(model_field).get(grid_id)
+        except gridfs.NoFile:
+            raise Http404('No file matches the given query.')
+
+    def retrieve_file(self, request, *args, **kwargs):
+        grid_out = self.get_grid_out()
+        etag = get_file_etag(grid_out)
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        length = grid_out.length
+        if_range = request.META.get('HTTP_IF_RANGE')
+        try:
+            byte_range = None
+            if not if_range or if_range.strip() == etag:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), length)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */%d' % length
+            return response
+
+        start, end = byte_range or (0, length)
+        response = StreamingHttpResponse(iter_file(grid_out, start, end, self.file_chunk_size),
+                                         content_type=grid_out.content_type or 'application/octet-stream')
+        if byte_range is not None:
+            response.status_code = status.HTTP_206_PARTIAL_CONTENT
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end - 1, length)
+        response['Content-Length'] = str(end - start)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        if grid_out.filename:
+            response['Content-Disposition'] = 'inline; filename="%s"' % grid_out.filename.replace('"', '')
+        return response
+
+    def upload_file(self, request, *args, **kwargs):
+        model_field = self.get_file_model_field()
+        select = self.get_document_query()
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if not length:
+            raise ValidationError({self.file_field: ['No file was submitted.']})
+        if self.file_max_bytes is not None and length > self.file_max_bytes:
+            raise FileTooLarge('The file is larger than %d bytes.' % self.file_max_bytes)
+
+        filename = FileUploadParser().get_filename(None, None, {'request': request, 'kwargs': kwargs})
+        fs = get_grid_fs(model_field)
+        grid_in = write_file(fs, request.stream, self.file_max_bytes, length, filename=filename,
+                             content_type=request.content_type.split(';')[0].strip() or None)
+
+        document = self.get_queryset()._document
+        versioned = VersionedWrite(self, document)
+        collection = document._get_collection()
+        son = collection.find_one_and_update(
+            versioned.select(select), versioned.update({'$set': {model_field.db_field: grid_in._id}}),
+            projection={model_field.db_field: 1})
+        if son is None:
+            fs.delete(grid_in._id)
+            versioned.check(collection, select)
+            raise Http404('No %s matches the given query.' % document._class_name)
+        if son.get(model_field.db_field) is not None:
+            fs.delete(son[model_field.db_field])
+
+        response = Response({'id': six.text_type(grid_in._id), 'filename': grid_in.filename,
+                             'content_type': grid_in.content_type, 'length': grid_in.length})
+        response['ETag'] = '"%s"' % grid_in._id
+        return response
+
+    def destroy_file(self, request, *args, **kwargs):
+        model_field = self.get_file_model_field()
+        document = self.get_queryset()._document
+        versioned = VersionedWrite(self, document)
+        select = self.get_document_query()
+        collection = document._get_collection()
+        son = collection.find_one_and_update(
+            versioned.select(select), versioned.update({'$unset': {model_field.db_field: 1}}),
+            projection=versioned.projection({model_field.db_field: 1}))
+        if son is None:
+            versioned.check(collection, select)
+            raise Http404('No %s matches the given query.' % document._class_name)
+        if son.get(model_field.db_field) is not None:
+            get_grid_fs(model_field).delete(son[model_field.db_field])
+        return versioned.set_etag(Response(status=status.HTTP_204_NO_CONTENT), son, before=True)
+
+
+class BinaryFieldMixin(object):
+    """
+    The value of a document's `BinaryField`, `binary_field`, as a sub-resource of raw bytes,
+    for values too large to go through JSON (see `out_of_band_bytes` of fields.BinaryField).
+
+    - retrieve: the bytes, read with a projection of the field only and streamed
+      `binary_chunk_size` bytes at a time. A single `Range` is answered with 206.
+    - upload: the request body (PUT) is read `binary_chunk_size` bytes at a time, and refused
+      with 413 as soon as it passes the field's `max_bytes`, or with 400 when it is shorter
+      than its Content-Length. Then the field is `$set`.
+
+    404 is returned when the document does not exist, or has no value. With a version field,
+    uploads apply to the If-Match version only (412 otherwise) and move it on, see
+    `VersionedWrite`.
+    """
+    binary_field = None
+    binary_content_type = 'application/octet-stream'
+    binary_chunk_size = 64 * 1024
+
+    def get_binary_model_field(self):
+        document = self.get_queryset()._document
+        model_field = document._fields.get(self.binary_field)
+        assert isinstance(model_field, me_fields.BinaryField), (
+            '%s.binary_field must name a BinaryField of %s.' % (self.__class__.__name__, document.__name__))
+        return model_field
+
+    def perform_content_negotiation(self, request, force=False):
+        #bytes go out as they are, whatever the renderers
+        return super(BinaryFieldMixin, self).perform_content_negotiation(request, force=True)
+
+    def retrieve_binary(self, request, *args, **kwargs):
+        model_field = self.get_binary_model_field()
+        document = self.get_queryset()._document
+        son = document._get_collection().find_one(self.get_document_query(), projection={model_field.db_field: 1})
+        if son is None or son.get(model_field.db_field) is None:
+            raise Http404('No %s matches the given query.' % document._class_name)
+        value = son[model_field.db_field]
+
+        length = len(value)
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), length)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */%d' % length
+            return response
+
+        start, end = byte_range or (0, length)
+        response = StreamingHttpResponse(iter_bytes(value, start, end, self.binary_chunk_size),
+                                         content_type=self.binary_content_type)
+        if byte_range is not None:
+            response.status_code = status.HTTP_206_PARTIAL_CONTENT
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end - 1, length)
+        response['Content-Length'] = str(end - start)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def upload_binary(self, request, *args, **kwargs):
+        model_field = self.get_binary_model_field()
+        select = self.get_document_query()
+        max_bytes = model_field.max_bytes
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if max_bytes is not None and length > max_bytes:
+            raise FileTooLarge('The body is larger than %d bytes.' % max_bytes)
+
+        value = read_bytes(request.stream, self.binary_chunk_size, max_bytes, length or None)
+        document = self.get_queryset()._document
+        versioned = VersionedWrite(self, document)
+        collection = document._get_collection()
+        son = collection.find_one_and_update(
+            versioned.select(select), versioned.update({'$set': {model_field.db_field: Binary(value)}}),
+            projection=versioned.projection({'_id': 1}), return_document=ReturnDocument.AFTER)
+        if son is None:
+            versioned.check(collection, select)
+            raise Http404('No %s matches the given query.' % document._class_name)
+        return versioned.set_etag(Response({'length': len(value)}), son)
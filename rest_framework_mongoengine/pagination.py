@@ -0,0 +1,280 @@
+from __future__ import unicode_literals
+
+import hashlib
+import uuid
+from collections import OrderedDict
+from functools import partial
+
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from django.core.cache import caches
+from django.core.paginator import Paginator as DjangoPaginator
+from mongoengine import signals
+from mongoengine.base import get_document
+from mongoengine.queryset.base import BaseQuerySet
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def normalize_query(query):
+    """
+    Returns a canonical form of a mongo filter document, so that equivalent
+    filters (differing only in key order or `$in` order) share a cache key.
+    """
+    if isinstance(query, dict):
+        ret = {}
+        for key, value in query.items():
+            value = normalize_query(value)
+            if key in ('$in', '$nin', '$all') and isinstance(value, list):
+                value = sorted(value, key=lambda v: json_util.dumps(v, sort_keys=True))
+            ret[key] = value
+        return ret
+    elif isinstance(query, (list, tuple)):
+        return [normalize_query(item) for item in query]
+    return query
+
+
+class CountCache(object):
+    """
+    Caches `count()` of listing querysets, keyed by (collection, normalized filter).
+
+    Entries expire after `timeout` seconds, and every entry of a collection is dropped
+    when a document of that collection fires `post_save` or `post_delete`. Invalidation
+    bumps a per-collection generation stored next to the counts, so it works on any Django
+    cache backend and across processes sharing that backend. Receivers are connected when
+    the cache is created (usually on import, as a pagination class attribute), so processes
+    that only write invalidate too. They are weak: a cache that is no longer referenced, or
+    that was `close()`d, stops listening.
+
+    Pass `documents` to only listen to the signals of those documents (and of their
+    subclasses defined by then). Without it every document is watched, and since
+    receivers of `post_save`/`post_delete` make the fetch-free mixins load documents
+    before writing (see `mixins.needs_documents`), that holds for every document too.
+
+    Note that `QuerySet.update()` and raw pymongo writes do not fire signals; counts
+    affected by those are only refreshed when the timeout expires.
+    """
+
+    timeout = 60
+    cache_alias = 'default'
+    key_prefix = 'drfme:count'
+
+    def __init__(self, timeout=None, cache_alias=None, key_prefix=None, documents=None):
+        if timeout is not None:
+            self.timeout = timeout
+        if cache_alias is not None:
+            self.cache_alias = cache_alias
+        if key_prefix is not None:
+            self.key_prefix = key_prefix
+        #one receiver for any sender, or one per watched document class
+        self._senders = [{}]
+        if documents is not None:
+            self._senders = [{'sender': get_document(name)}
+                             for document in documents for name in document._subclasses]
+        for kwargs in self._senders:
+            signals.post_save.connect(self._on_write, **kwargs)
+            signals.post_delete.connect(self._on_write, **kwargs)
+
+    def close(self):
+        """
+        Disconnects the invalidation receivers.
+        """
+        for kwargs in self._senders:
+            signals.post_save.disconnect(self._on_write, **kwargs)
+            signals.post_delete.disconnect(self._on_write, **kwargs)
+        self._senders = []
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_collection_name(self, document):
+        return document._get_collection_name()
+
+    def get_generation(self, collection):
+        key = '%s:gen:%s' % (self.key_prefix, collection)
+        generation = self.cache.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.cache.set(key, generation, None)
+        return generation
+
+    def make_key(self, queryset):
+        collection = self.get_collection_name(queryset._document)
+        query = json_util.dumps(normalize_query(queryset._query), sort_keys=True)
+        digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+        return '%s:%s:%s:%s' % (self.key_prefix, collection, self.get_generation(collection), digest)
+
+    def count(self, queryset):
+        if not isinstance(queryset, BaseQuerySet):
+            return len(queryset)
+
+        key = self.make_key(queryset)
+        count = self.cache.get(key)
+        if count is None:
+            count = queryset.count()
+            self.cache.set(key, count, self.timeout)
+        return count
+
+    def invalidate(self, document):
+        collection = self.get_collection_name(document)
+        self.cache.set('%s:gen:%s' % (self.key_prefix, collection), uuid.uuid4().hex, None)
+
+    def _on_write(self, sender, document=None, **kwargs):
+        if getattr(sender, '_meta', {}).get('collection') is not None:
+            self.invalidate(sender)
+
+
+class CachedCountPaginator(DjangoPaginator):
+    """
+    Django paginator that takes its `count` from a `CountCache`.
+    """
+
+    def __init__(self, object_list, per_page, count_cache=None, **kwargs):
+        super(CachedCountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.count_cache = count_cache
+
+    @property
+    def count(self):
+        if not hasattr(self, '_cached_count'):
+            if self.count_cache is None:
+                self._cached_count = super(CachedCountPaginator, self).count
+            else:
+                self._cached_count = self.count_cache.count(self.object_list)
+        return self._cached_count
+
+
+class PageNumberPagination(pagination.PageNumberPagination):
+    """
+    PageNumberPagination that uses `count_cache` (a `CountCache`) for page totals.
+
+    Example:
+        class CachedPagination(PageNumberPagination):
+            count_cache = CountCache(timeout=30)
+    """
+    count_cache = None
+
+    @property
+    def django_paginator_class(self):
+        return partial(CachedCountPaginator, count_cache=self.count_cache)
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    """
+    LimitOffsetPagination that uses `count_cache` (a `CountCache`) for totals.
+    """
+    count_cache = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.count_cache is None:
+            return super(LimitOffsetPagination, self).paginate_queryset(queryset, request, view=view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.count = self.count_cache.count(queryset)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return list(queryset[self.offset:self.offset + self.limit])
+
+
+def filter_id_bound(queryset, operator, value):
+    """
+    Filters `queryset` on `_id` `operator` (`$gt`, `$lt`...) `value`. Another `_id` bound of
+    the queryset (e.g. from filters.ObjectIdTimeRangeFilter) ends up in an `$and` with it,
+    which the query planner intersects into a single `_id` index range.
+    """
+    return queryset.filter(**{'pk__%s' % operator[1:]: value})
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Paginates on `_id`: each page continues after the last id of the previous one
+    (`?after=<id>`), or ends before the first id of the next one (`?before=<id>`), so deep
+    pages cost the same as the first and no count is needed. Set `ordering = '-id'` to
+    walk from newest to oldest. The cursor's bound is merged into the `_id` bounds of
+    the queryset, see `filter_id_bound()`. Invalid cursors are answered with 404.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = None
+    max_page_size = None
+    cursor_query_param = 'after'
+    previous_cursor_query_param = 'before'
+    ordering = 'id'
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+                if page_size > 0:
+                    if self.max_page_size:
+                        return min(page_size, self.max_page_size)
+                    return page_size
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_cursor(self, request, param):
+        cursor = request.query_params.get(param)
+        if not cursor:
+            return None
+        try:
+            return ObjectId(cursor)
+        except (InvalidId, TypeError):
+            raise NotFound('Invalid cursor.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        descending = self.ordering.startswith('-')
+        after = self.get_cursor(request, self.cursor_query_param)
+        before = self.get_cursor(request, self.previous_cursor_query_param)
+
+        if before is not None:
+            #walk back from the cursor, then put the page in order
+            queryset = queryset.order_by('id' if descending else '-id')
+            queryset = filter_id_bound(queryset, '$gt' if descending else '$lt', before)
+        else:
+            queryset = queryset.order_by(self.ordering)
+            if after is not None:
+                queryset = filter_id_bound(queryset, '$lt' if descending else '$gt', after)
+
+        page = list(queryset.limit(self.page_size + 1))
+        more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if before is not None:
+            page.reverse()
+            self.has_previous, self.has_next = more, True
+        else:
+            self.has_previous, self.has_next = after is not None, more
+        self.first_id = page[0].pk if page else None
+        self.last_id = page[-1].pk if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or self.last_id is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.previous_cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, str(self.last_id))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_id is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return replace_query_param(url, self.previous_cursor_query_param, str(self.first_id))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+
+import json
+
+import bson
+from bson.errors import InvalidBSON
+from django.conf import settings
+from django.utils import six
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+try:
+    from bson.codec_options import CodecOptions
+except ImportError:
+    #pymongo < 3.0
+    CodecOptions = None
+
+
+class InvalidLine(object):
+    """
+    Stands in for a line of an NDJSON body that could not be parsed.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+class NDJSONStream(object):
+    """
+    The records of an NDJSON body, parsed one line at a time as they are iterated, so
+    the body is never held in memory as a whole. Lines that are not valid JSON, or longer
+    than `max_line_length` bytes, come out as InvalidLine. Blank lines are skipped, but
+    counted: `line_number` is the number of the line last read.
+
+    The stream can be iterated once.
+    """
+
+    def __init__(self, stream, encoding, max_line_length):
+        self.stream = stream
+        self.encoding = encoding
+        self.max_line_length = max_line_length
+        self.line_number = 0
+
+    def read_line(self):
+        line = self.stream.readline(self.max_line_length + 1)
+        if len(line) > self.max_line_length and not line.endswith(b'\n'):
+            #skip the rest of it, in bounded reads too
+            while line and not line.endswith(b'\n'):
+                line = self.stream.readline(self.max_line_length + 1)
+            return None
+        return line
+
+    def __iter__(self):
+        if self.stream is None:
+            return
+        while True:
+            line = self.read_line()
+            if line is not None and not line:
+                return
+            self.line_number += 1
+            if line is None:
+                yield InvalidLine('Line is longer than %d bytes.' % self.max_line_length)
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode(self.encoding))
+            except ValueError as exc:
+                yield InvalidLine('JSON parse error - %s' % exc)
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses `application/x-ndjson` bodies (one JSON document per line) lazily: `request.data`
+    is an NDJSONStream reading the request as it is iterated.
+    """
+    media_type = 'application/x-ndjson'
+    max_line_length = 1024 * 1024
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return NDJSONStream(stream, encoding, self.max_line_length)
+
+
+class BSONParser(BaseParser):
+    """
+    Parses `application/bson` bodies, the counterpart of renderers.BSONRenderer: a document
+    holding nothing but a `list_key` list stands for that list. Datetimes are timezone aware
+    (UTC).
+    """
+    media_type = 'application/bson'
+    list_key = 'data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            if CodecOptions is not None:
+                data = bson.BSON(stream.read()).decode(codec_options=CodecOptions(tz_aware=True))
+            else:
+                data = bson.BSON(stream.read()).decode(tz_aware=True)
+        except (InvalidBSON, ValueError) as exc:
+            raise ParseError('BSON parse error - %s' % six.text_type(exc))
+        if list(data) == [self.list_key] and isinstance(data[self.list_key], list):
+            return data[self.list_key]
+        return data
@@ -0,0 +1,148 @@
+from __future__ import unicode_literals
+
+from bson import DBRef
+from django.core.exceptions import ImproperlyConfigured
+from mongoengine.base import get_document, _document_registry
+from mongoengine.document import Document
+
+from rest_framework_mongoengine.debug import record_find, record_queryset
+
+
+class QueryOptions(object):
+    """
+    Cursor options applied to every query a view (and its serializers) issue.
+
+    - max_time_ms: server side time limit, the query fails with `ExecutionTimeout` past it.
+    - hint: index name or index spec (list of (key, direction)) the query must use.
+    - batch_size: number of documents per cursor batch.
+    - comment: tag shown in the profiler and currentOp, see `GenericAPIView.get_query_options()`.
+    - read_concern: read concern level, e.g. 'local', 'majority' (requires mongoengine >= 0.18).
+    """
+
+    option_names = ('max_time_ms', 'hint', 'batch_size', 'comment', 'read_concern')
+
+    def __init__(self, max_time_ms=None, hint=None, batch_size=None, comment=None, read_concern=None):
+        self.max_time_ms = max_time_ms
+        self.hint = hint
+        self.batch_size = batch_size
+        self.comment = comment
+        self.read_concern = read_concern
+
+    def __repr__(self):
+        options = ', '.join('%s=%r' % (name, getattr(self, name))
+                            for name in self.option_names if getattr(self, name) is not None)
+        return '%s(%s)' % (self.__class__.__name__, options)
+
+    def copy(self, **overrides):
+        kwargs = dict((name, getattr(self, name)) for name in self.option_names)
+        kwargs.update(overrides)
+        return self.__class__(**kwargs)
+
+    def apply(self, queryset):
+        """
+        Returns a clone of `queryset` with the options set.
+        """
+        if self.max_time_ms is not None:
+            queryset = queryset.max_time_ms(self.max_time_ms)
+        if self.hint is not None:
+            queryset = queryset.hint(self.hint)
+        if self.batch_size is not None:
+            queryset = queryset.batch_size(self.batch_size)
+        if self.comment is not None:
+            queryset = queryset.comment(self.comment)
+        if self.read_concern is not None:
+            if not hasattr(queryset, 'read_concern'):
+                raise ImproperlyConfigured('QueryOptions.read_concern requires mongoengine >= 0.18')
+            queryset = queryset.read_concern({'level': self.read_concern})
+        return queryset
+
+    def find_kwargs(self):
+        """
+        Options as keyword arguments for pymongo's `Collection.find()`.
+        Hints are left out, since they name indexes of the primary collection only.
+        """
+        kwargs = {}
+        if self.max_time_ms is not None:
+            kwargs['max_time_ms'] = self.max_time_ms
+        if self.batch_size is not None:
+            kwargs['batch_size'] = self.batch_size
+        if self.comment is not None:
+            kwargs['comment'] = self.comment
+        return kwargs
+
+    def get_collection(self, collection):
+        if self.read_concern is None:
+            return collection
+        from pymongo.read_concern import ReadConcern
+        return collection.with_options(read_concern=ReadConcern(self.read_concern))
+
+
+def _ref_id(value):
+    if isinstance(value, (DBRef, Document)):
+        return value.id
+    return value
+
+
+def dereference(document, value, options=None):
+    """
+    Fetch the `document` referenced by `value` (a DBRef, ObjectId or already fetched Document).
+    Returns None for dangling references.
+    """
+    if value is None or isinstance(value, Document):
+        return value
+
+    queryset = document.objects.filter(pk=_ref_id(value))
+    if options is not None:
+        queryset = options.copy(hint=None).apply(queryset)
+    record_queryset(queryset, 'dereference')
+    return queryset.first()
+
+
+def dereference_many(document, values, options=None):
+    """
+    Fetch all `document`s referenced by `values` with a single `$in` query.
+    Order of `values` is kept, dangling references are returned as they are.
+    """
+    ids = [_ref_id(v) for v in values if v is not None and not isinstance(v, Document)]
+    if not ids:
+        return list(values)
+
+    queryset = document.objects.filter(pk__in=ids)
+    if options is not None:
+        queryset = options.copy(hint=None).apply(queryset)
+    record_queryset(queryset, 'dereference')
+    fetched = dict((doc.pk, doc) for doc in queryset)
+
+    return [fetched.get(_ref_id(v), v) if not isinstance(v, Document) else v for v in values]
+
+
+def dereference_dbref(dbref, options=None):
+    """
+    Fetch a DBRef whose document class is only known by collection name, as stored
+    in DictFields and DynamicFields. The collection is read through the connection of
+    the document class registered for it (`meta['db_alias']`).
+    """
+    document = document_for_collection(dbref.collection)
+    collection = document._get_collection()
+    record_find(collection, {'_id': dbref.id}, 'dereference', limit=1)
+    if options is not None:
+        collection = options.get_collection(collection)
+        son = next(iter(collection.find({'_id': dbref.id}, limit=1, **options.find_kwargs())), None)
+    else:
+        son = collection.find_one({'_id': dbref.id})
+    if son is None:
+        return None
+
+    if '_cls' in son:
+        return get_document(son['_cls'])._from_son(son)
+    return document._from_son(son)
+
+
+def document_for_collection(name):
+    """
+    Returns the root Document class stored in collection `name`.
+    """
+    for cls in _document_registry.values():
+        if issubclass(cls, Document) and cls._meta.get('collection') == name and not cls._superclasses:
+            return cls
+    raise LookupError('No document class is registered for collection %s' % name)
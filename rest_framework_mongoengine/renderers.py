@@ -0,0 +1,560 @@
+from __future__ import unicode_literals
+
+import datetime
+import decimal
+import json
+import uuid
+from collections import OrderedDict
+
+import bson
+from bson import Binary, DBRef, ObjectId
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+from mongoengine import fields as me_fields
+from rest_framework.fields import SkipField
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from rest_framework_mongoengine.fields import EmbeddedDocumentField, PolymorphicEmbeddedDocumentField
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    #pyarrow without parquet support
+    pass
+
+try:
+    from bson.codec_options import CodecOptions
+except ImportError:
+    #pymongo < 3.0
+    CodecOptions = None
+
+try:
+    from bson.codec_options import TypeRegistry
+except ImportError:
+    #pymongo < 3.8
+    TypeRegistry = None
+
+try:
+    from bson.decimal128 import Decimal128
+except ImportError:
+    #pymongo < 3.4
+    Decimal128 = None
+
+try:
+    from bson.raw_bson import RawBSONDocument
+except ImportError:
+    #pymongo < 3.2
+    RawBSONDocument = None
+
+
+def encode_bson_type(obj):
+    """
+    `default` hook of FastJSONRenderer: represents BSON and other non JSON types
+    the way DRF's JSONEncoder does, so switching renderers does not change payloads.
+    """
+    if isinstance(obj, ObjectId):
+        return six.text_type(obj)
+    elif isinstance(obj, DBRef):
+        return six.text_type(obj.id)
+    elif isinstance(obj, datetime.datetime):
+        representation = obj.isoformat()
+        if obj.microsecond:
+            representation = representation[:23] + representation[26:]
+        if representation.endswith('+00:00'):
+            representation = representation[:-6] + 'Z'
+        return representation
+    elif isinstance(obj, datetime.date):
+        return obj.isoformat()
+    elif isinstance(obj, datetime.time):
+        if obj.utcoffset() is not None:
+            raise ValueError('JSON can\'t represent timezone-aware times.')
+        representation = obj.isoformat()
+        if obj.microsecond:
+            representation = representation[:12]
+        return representation
+    elif isinstance(obj, decimal.Decimal):
+        return float(obj)
+    elif isinstance(obj, uuid.UUID):
+        return six.text_type(obj)
+    elif isinstance(obj, six.binary_type):
+        return obj.decode('utf-8')
+    elif isinstance(obj, Promise):
+        return force_text(obj)
+    elif hasattr(obj, 'tolist'):
+        # numpy arrays and scalars
+        return obj.tolist()
+    elif hasattr(obj, '__iter__'):
+        return [item for item in obj]
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer encoding with orjson when it is installed, else with the C encoder of
+    the json module. Types JSON lacks go through `encode_bson_type()`.
+
+    Serializer fields leave values of `native_types` (ObjectIds and DBRefs) to the
+    renderer instead of converting each to a string: views put the negotiated renderer's
+    `native_types` into the serializer context.
+
+    Keys are written in the order of the data, or sorted with `sort_keys = True` (or a
+    `sort_keys` renderer context entry).
+    """
+    native_types = (ObjectId, DBRef)
+    sort_keys = False
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        sort_keys = renderer_context.get('sort_keys', self.sort_keys)
+
+        if orjson is not None and not indent:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(data, default=encode_bson_type, option=option)
+
+        separators = (',', ': ') if indent else (',', ':')
+        ret = json.dumps(data, default=encode_bson_type, indent=indent, ensure_ascii=self.ensure_ascii,
+                         separators=separators, sort_keys=sort_keys)
+        if isinstance(ret, six.text_type):
+            return bytes(ret.encode('utf-8'))
+        return ret
+
+
+def encode_bson_fallback(obj):
+    """
+    Fallback encoder of BSONRenderer, for the few types BSON lacks.
+    """
+    if isinstance(obj, decimal.Decimal):
+        return Decimal128(obj) if Decimal128 is not None else six.text_type(obj)
+    elif isinstance(obj, datetime.date) and not isinstance(obj, datetime.datetime):
+        return datetime.datetime(obj.year, obj.month, obj.day)
+    elif isinstance(obj, datetime.time):
+        return obj.isoformat()
+    elif isinstance(obj, Promise):
+        return force_text(obj)
+    elif isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError('%r can not be encoded to BSON' % (obj,))
+
+
+def to_bson_types(value):
+    #without TypeRegistry, fallback types are converted up front
+    if isinstance(value, dict):
+        return OrderedDict((key, to_bson_types(item)) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return [to_bson_types(item) for item in value]
+    try:
+        return encode_bson_fallback(value)
+    except TypeError:
+        return value
+
+
+class BSONRenderer(BaseRenderer):
+    """
+    Renders `application/bson`. ObjectIds, DBRefs, datetimes and binary data are carried as
+    BSON types: serializer fields leave them to the renderer (see `native_types`), and
+    Decimals become Decimal128. A top level list is wrapped as `{list_key: [...]}`, since
+    a BSON body has to be a document.
+
+    Raw documents (RawBSONDocument, see `mixins.BSONPassthroughMixin`) are written as
+    they are.
+    """
+    media_type = 'application/bson'
+    format = 'bson'
+    charset = None
+    render_style = 'binary'
+    native_types = (ObjectId, DBRef, datetime.datetime, six.binary_type, Binary)
+    list_key = 'data'
+
+    def get_codec_options(self):
+        if CodecOptions is None:
+            return None
+        if TypeRegistry is not None:
+            return CodecOptions(type_registry=TypeRegistry(fallback_encoder=encode_bson_fallback))
+        return CodecOptions()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        if RawBSONDocument is not None and isinstance(data, RawBSONDocument):
+            return data.raw
+        if not isinstance(data, dict):
+            data = {self.list_key: data}
+
+        codec_options = self.get_codec_options()
+        if codec_options is None or TypeRegistry is None:
+            data = to_bson_types(data)
+        if codec_options is None:
+            return bytes(bson.BSON.encode(data))
+        return bytes(bson.BSON.encode(data, codec_options=codec_options))
+
+
+def get_flat_subfields(field):
+    #subfields of nested serializers and embedded documents, whose output has fixed keys
+    if isinstance(field, BaseSerializer) and not isinstance(field, ListSerializer):
+        return field.fields
+    if (isinstance(field, EmbeddedDocumentField) and not isinstance(field, PolymorphicEmbeddedDocumentField) and
+            field.go_deeper()):
+        return field.fields
+    return None
+
+
+def get_columns(fields, prefix=()):
+    """
+    Key paths (tuples) of the values `fields` output, in their order. Nested serializers and
+    embedded documents are flattened into the paths of their subfields.
+    """
+    columns = []
+    for name, field in fields.items():
+        if field.write_only:
+            continue
+        subfields = get_flat_subfields(field)
+        if subfields is not None:
+            columns.extend(get_columns(subfields, prefix + (name,)))
+        else:
+            columns.append(prefix + (name,))
+    return columns
+
+
+def get_row(item, columns):
+    row = []
+    for path in columns:
+        value = item
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        row.append(value)
+    return row
+
+
+class RowsRenderer(FastJSONRenderer):
+    """
+    Columnar JSON for lists: a header of field paths, then an array of values per item,
+    so keys are not repeated in every item. Embedded documents and nested serializers are
+    flattened to dotted columns; other values (lists, dicts) are cells of their own.
+
+        {"columns": ["id", "name", "address.city"], "rows": [["5610...", "north", "Oslo"]]}
+
+    Columns follow the field order of the serializer that produced the data. Serialized
+    single documents become a table of one row, lists in other data (e.g. the `results`
+    of a page) become tables in place, and anything else (errors) is rendered as is.
+    Negotiated with `?format=rows` or the `application/vnd.rows+json` media type.
+    """
+    media_type = 'application/vnd.rows+json'
+    format = 'rows'
+
+    def get_table(self, data, fields):
+        columns = get_columns(fields)
+        items = data if isinstance(data, list) else [data]
+        return OrderedDict([
+            ('columns', ['.'.join(path) for path in columns]),
+            ('rows', [get_row(item, columns) for item in items]),
+        ])
+
+    def get_serializer_fields(self, data):
+        serializer = getattr(data, 'serializer', None)
+        if isinstance(serializer, ListSerializer):
+            serializer = serializer.child
+        return serializer.fields if serializer is not None else None
+
+    def to_rows(self, data):
+        fields = self.get_serializer_fields(data)
+        if fields is not None:
+            return self.get_table(data, fields)
+        if isinstance(data, dict):
+            return OrderedDict((key, self.to_rows(value) if isinstance(value, list) else value)
+                               for key, value in data.items())
+        return data
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if not getattr(response, 'exception', False):
+            data = self.to_rows(data)
+        return super(RowsRenderer, self).render(data, accepted_media_type, renderer_context)
+
+    def render_stream(self, chunks, accepted_media_type=None, renderer_context=None):
+        """
+        The table of the serialized chunks of `mixins.StreamingListMixin`, in pieces.
+        """
+        view = (renderer_context or {}).get('view')
+        columns = None
+        separator = b''
+        for chunk in chunks:
+            if columns is None:
+                columns = get_columns(self.get_serializer_fields(chunk) or view.get_serializer().fields)
+                yield self.render_header(columns)
+            if not chunk:
+                continue
+            rows = super(RowsRenderer, self).render([get_row(item, columns) for item in chunk], accepted_media_type)
+            #the rows, without the brackets of the chunk's array
+            yield separator + rows.strip()[1:-1]
+            separator = b','
+        if columns is None:
+            yield self.render_header(get_columns(view.get_serializer().fields))
+        yield b']}'
+
+    def render_header(self, columns):
+        header = json.dumps(['.'.join(path) for path in columns])
+        return ('{"columns":%s,"rows":[' % header).encode('utf-8')
+
+
+def _to_text(value):
+    return six.text_type(value)
+
+
+def _to_ref_id(value):
+    #ReferenceFields hold ObjectIds, DBRefs or documents
+    return six.text_type(getattr(value, 'id', value))
+
+
+def get_arrow_type(model_field):
+    """
+    The Arrow type of the values of `model_field` and a function converting each value
+    to it, or None when there is none.
+    """
+    if isinstance(model_field, me_fields.BooleanField):
+        return pyarrow.bool_(), bool
+    elif isinstance(model_field, (me_fields.IntField, me_fields.LongField)):
+        return pyarrow.int64(), int
+    elif isinstance(model_field, me_fields.DecimalField):
+        #mongoengine keeps `precision` decimal places
+        return pyarrow.decimal128(38, model_field.precision), model_field.to_python
+    elif isinstance(model_field, me_fields.FloatField):
+        return pyarrow.float64(), float
+    elif isinstance(model_field, me_fields.DateTimeField):
+        #stored as UTC
+        return pyarrow.timestamp('ms', tz='UTC'), None
+    elif isinstance(model_field, me_fields.ObjectIdField):
+        return pyarrow.string(), _to_text
+    elif isinstance(model_field, me_fields.ReferenceField):
+        return pyarrow.string(), _to_ref_id
+    elif isinstance(model_field, me_fields.StringField):
+        return pyarrow.string(), _to_text
+    elif isinstance(model_field, me_fields.BinaryField):
+        return pyarrow.binary(), bytes
+    elif isinstance(model_field, me_fields.ListField) and not isinstance(model_field, me_fields.MapField):
+        item_type = get_arrow_type(model_field.field)
+        if item_type is None:
+            return None
+        arrow_type, convert = item_type
+        if convert is None:
+            return pyarrow.list_(arrow_type), list
+        return pyarrow.list_(arrow_type), lambda value: [item if item is None else convert(item) for item in value]
+    return None
+
+
+class ArrowColumn(object):
+    """
+    A column of ArrowRenderer: the chain of serializer fields leading to a value, and the
+    model field it is stored in, if any. Values of model fields with an Arrow type (see
+    `get_arrow_type()`) are read from the documents as they are; other fields are
+    serialized, and their output written as JSON text.
+    """
+
+    def __init__(self, name, fields, model_field=None):
+        self.name = name
+        self.fields = fields
+        arrow_type = get_arrow_type(model_field) if model_field is not None else None
+        if arrow_type is None:
+            self.type, self.convert = pyarrow.string(), self.to_json
+        else:
+            self.type, self.convert = arrow_type
+
+    def to_json(self, value):
+        return json.dumps(self.fields[-1].to_representation(value), default=encode_bson_type)
+
+    def get_value(self, document):
+        value = document
+        for field in self.fields:
+            if value is None:
+                return None
+            try:
+                value = field.get_attribute(value)
+            except (AttributeError, KeyError, SkipField):
+                return None
+        return value
+
+    def get_array(self, documents):
+        values = [self.get_value(document) for document in documents]
+        if self.convert is not None:
+            values = [value if value is None else self.convert(value) for value in values]
+        return pyarrow.array(values, type=self.type)
+
+
+def get_arrow_columns(fields, document=None, declared=(), prefix=(), parents=()):
+    """
+    ArrowColumns of the serializer `fields` of `document`, flattened like `get_columns()`.
+    Fields named in `declared` (the serializer's declared fields) are always serialized,
+    the typed columns are for fields the serializer built from the model fields.
+    """
+    columns = []
+    for name, field in fields.items():
+        if field.write_only:
+            continue
+        model_field = None
+        if document is not None and field.source != '*':
+            model_field = document._fields.get(field.source)
+        subfields = get_flat_subfields(field)
+        if subfields is not None:
+            columns.extend(get_arrow_columns(subfields, getattr(model_field, 'document_type', None),
+                                             getattr(field, '_declared_fields', ()),
+                                             prefix + (name,), parents + (field,)))
+        elif name in declared:
+            columns.append(ArrowColumn('.'.join(prefix + (name,)), parents + (field,)))
+        else:
+            columns.append(ArrowColumn('.'.join(prefix + (name,)), parents + (field,), model_field))
+    return columns
+
+
+class _ByteSink(object):
+    #file-like object collecting what Arrow writers write, handed out piece by piece
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class ArrowRenderer(BaseRenderer):
+    """
+    Renders lists as an Arrow IPC stream, a record batch per chunk of documents. Columns
+    come from the serializer's fields, flattened like RowsRenderer does, and are built
+    column by column from the documents: IntField, LongField, FloatField, DecimalField,
+    BooleanField, DateTimeField, ObjectIdField, ReferenceField and StringField values
+    (and ListFields of them) go into typed arrays without being serialized. Values of
+    other fields are serialized and written as JSON text.
+
+    DecimalFields are decimal128 columns of the field's `precision`. Fields declared on the
+    serializer are serialized whatever their model field.
+
+    With `mixins.StreamingListMixin`, batches are written as the queryset is read (the
+    renderer gets the serializers of the chunks, see `renders_documents`), otherwise the
+    page or list is one batch. The other keys of a page (`count`, `next`...) go into the
+    schema metadata, as JSON text. Errors, and data without a list of documents, are
+    rendered as JSON with a JSON content type. Requires pyarrow.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+    renders_documents = True
+
+    def get_writer(self, sink, schema):
+        return pyarrow.ipc.new_stream(sink, schema)
+
+    def write_batch(self, writer, batch):
+        writer.write_batch(batch)
+
+    def get_list_serializer(self, data):
+        """
+        The ListSerializer of the documents in `data`, and the metadata of the other keys
+        when `data` is a dict (e.g. a page).
+        """
+        serializer = getattr(data, 'serializer', None)
+        if isinstance(serializer, ListSerializer):
+            return serializer, None
+        if isinstance(data, dict):
+            for key, value in data.items():
+                serializer = getattr(value, 'serializer', None)
+                if isinstance(serializer, ListSerializer):
+                    metadata = dict((other, json.dumps(data[other], default=encode_bson_type))
+                                    for other in data if other != key)
+                    return serializer, metadata
+        return None, None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        serializer, metadata = self.get_list_serializer(data)
+        if getattr(response, 'exception', False) or serializer is None:
+            json_renderer = JSONRenderer()
+            if response is not None:
+                #the response was negotiated as Arrow, what it gets is JSON
+                response['Content-Type'] = '%s; charset=%s' % (json_renderer.media_type, json_renderer.charset)
+            return json_renderer.render(data, json_renderer.media_type, renderer_context)
+        return b''.join(self.render_stream([serializer], accepted_media_type, renderer_context, metadata))
+
+    def render_stream(self, chunks, accepted_media_type=None, renderer_context=None, metadata=None):
+        """
+        Write the Arrow output of `chunks`: ListSerializers of documents, or serialized
+        data carrying them. `metadata` (str to str) goes into the schema.
+        """
+        if pyarrow is None:
+            raise ImproperlyConfigured('%s requires pyarrow.' % self.__class__.__name__)
+        view = (renderer_context or {}).get('view')
+        sink = _ByteSink()
+        columns = writer = None
+        for chunk in chunks:
+            serializer = chunk if isinstance(chunk, ListSerializer) else chunk.serializer
+            if columns is None:
+                columns = self.get_columns(serializer.child)
+                writer = self.get_writer(sink, self.get_schema(columns, metadata))
+            documents = list(serializer.instance)
+            if documents:
+                batch = pyarrow.RecordBatch.from_arrays([column.get_array(documents) for column in columns],
+                                                        [column.name for column in columns])
+                self.write_batch(writer, batch)
+                yield sink.take()
+        if writer is None:
+            columns = self.get_columns(view.get_serializer())
+            writer = self.get_writer(sink, self.get_schema(columns, metadata))
+        writer.close()
+        yield sink.take()
+
+    def get_columns(self, serializer):
+        return get_arrow_columns(serializer.fields, getattr(getattr(serializer, 'Meta', None), 'model', None),
+                                 getattr(serializer, '_declared_fields', ()))
+
+    def get_schema(self, columns, metadata=None):
+        return pyarrow.schema([(column.name, column.type) for column in columns], metadata=metadata)
+
+
+class ParquetRenderer(ArrowRenderer):
+    """
+    ArrowRenderer writing a Parquet file, a row group per chunk of documents.
+    Requires pyarrow built with Parquet support.
+    """
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    def get_writer(self, sink, schema):
+        return pyarrow.parquet.ParquetWriter(sink, schema)
+
+    def write_batch(self, writer, batch):
+        writer.write_table(pyarrow.Table.from_batches([batch]))
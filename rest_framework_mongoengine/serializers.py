@@ -7,19 +7,30 @@ from mongoengine.base.common import get_document
 from django.db import models
 from django.forms import widgets
 from django.core.exceptions import ImproperlyConfigured
+from django.utils import six
 
 from collections import OrderedDict
 import inspect
 
 from rest_framework import serializers
 from rest_framework import fields as drf_fields
-from rest_framework.fields import SkipField
+from rest_framework.fields import SkipField, empty
+from rest_framework.utils import html
 from rest_framework.settings import api_settings
-from rest_framework_mongoengine.utils import get_field_info, FieldInfo, PolymorphicChainMap
+from rest_framework_mongoengine.utils import (get_field_info, FieldInfo, PolymorphicChainMap, get_validation_gaps,
+                                              get_db_field)
 from rest_framework_mongoengine.fields import (ReferenceField, ListField, EmbeddedDocumentField, DynamicField,
                                                ObjectIdField, DocumentField, BinaryField, BaseGeoField, DictField, MapField, FileField, PolymorphicEmbeddedDocumentField)
 import copy
-from mongoengine.errors import NotRegistered
+from mongoengine.errors import NotRegistered, SaveConditionError, NotUniqueError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo import UpdateOne
+from mongoengine.queryset.base import BaseQuerySet
+from rest_framework_mongoengine.updates import (snapshot, get_update_document, get_field_names, add_version_update,
+                                                get_version_condition, next_version, version_conflict)
+from mongoengine import signals as me_signals
+from rest_framework_mongoengine.validators import (BatchUniquenessMixin, IndexUniquenessMixin, UniqueValidator,
+                                                   DUPLICATE_KEY_ERROR, get_duplicate_index)
 
 
 def raise_errors_on_nested_writes(method_name, serializer, validated_data):
@@ -84,6 +95,367 @@ def raise_errors_on_nested_writes(method_name, serializer, validated_data):
     )
 
 
+class DocumentListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer used for `many=True` DocumentSerializers.
+
+    `create()` builds all documents, validates them with mongoengine and writes them with
+    `insert_many`, in batches of `Meta.bulk_batch_size` documents. Batches are ordered
+    unless `Meta.bulk_ordered = False`. Generated `_id`s are set back on the instances.
+
+    Write errors (e.g. duplicate keys) are raised as a ValidationError holding a list of
+    per-item errors, aligned with the input. Items without an error were written. With
+    ordered writes, items after the first failure are not written, and say so.
+
+    `update()` matches items to documents by id, fetches them with a single `$in` query
+    (restricted to the serializer's instance, when that is a queryset), and writes all
+    changed fields with one `bulk_write` of `$set`/`$unset` UpdateOne operations.
+    Items whose id is missing, invalid or does not match a document are reported per
+    index, and nothing is written then. With `Meta.version_field`, every item is written on condition
+    of its version (sent with the item, or as loaded); items changed meanwhile are reported
+    per index, while the other items are written.
+
+    Unique validators of the child (`validators.UniqueValidator`, `UniqueTogetherValidator`)
+    check all items with a single query each, and also catch duplicates within the items.
+    Duplicate key errors of the writes are reported like the child reports them (see
+    `DocumentSerializer.get_duplicate_key_detail()`).
+
+    Note that mongoengine's save signals are not sent for bulk written documents.
+    """
+    default_batch_size = 1000
+    not_written_message = 'Not written, since an earlier item failed.'
+    no_id_message = 'This field is required to update many documents.'
+    not_found_message = 'Document does not exist.'
+    invalid_id_message = 'Invalid id.'
+    version_conflict_message = 'The document was changed meanwhile, reload it and try again.'
+
+    @property
+    def batch_size(self):
+        return getattr(self.child.Meta, 'bulk_batch_size', self.default_batch_size)
+
+    @property
+    def ordered(self):
+        return getattr(self.child.Meta, 'bulk_ordered', True)
+
+    def create(self, validated_data):
+        instances = []
+        for attrs in validated_data:
+            raise_errors_on_nested_writes('create', self.child, attrs)
+            instances.append(self.child.build_instance(attrs))
+
+        if not self.child.trust_validation:
+            errors = self.validate_instances(instances)
+            if any(errors):
+                raise serializers.ValidationError(errors)
+
+        errors = self.insert(instances)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return instances
+
+    def validate_instances(self, instances):
+        """
+        Run mongoengine validation on every instance, before anything is written.
+        """
+        errors = []
+        for instance in instances:
+            try:
+                instance.validate()
+            except me_ValidationError as exc:
+                errors.append(exc.to_dict() or {api_settings.NON_FIELD_ERRORS_KEY: [exc.message]})
+            else:
+                errors.append({})
+        return errors
+
+    def get_write_error_detail(self, write_error):
+        if write_error.get('code') == DUPLICATE_KEY_ERROR:
+            return self.child.get_duplicate_key_detail(write_error)
+        return {api_settings.NON_FIELD_ERRORS_KEY: [write_error['errmsg']]}
+
+    def insert(self, instances, ordered=None):
+        """
+        Write instances with insert_many, returns per-item errors. `ordered` defaults
+        to `Meta.bulk_ordered`.
+        """
+        if ordered is None:
+            ordered = self.ordered
+        collection = self.child.Meta.model._get_collection()
+        errors = [{} for instance in instances]
+
+        for start in range(0, len(instances), self.batch_size):
+            batch = instances[start:start + self.batch_size]
+            sons = [instance.to_mongo() for instance in batch]
+            failed = {}
+            try:
+                collection.insert_many(sons, ordered=ordered)
+            except BulkWriteError as exc:
+                for write_error in exc.details.get('writeErrors', []):
+                    failed[write_error['index']] = self.get_write_error_detail(write_error)
+
+            for index, (instance, son) in enumerate(zip(batch, sons)):
+                if index in failed:
+                    errors[start + index] = failed[index]
+                elif ordered and failed and index > min(failed):
+                    errors[start + index] = {api_settings.NON_FIELD_ERRORS_KEY: [self.not_written_message]}
+                else:
+                    #pymongo sets generated _ids on the documents it inserts
+                    instance.pk = son['_id']
+                    instance._created = False
+                    instance._clear_changed_fields()
+
+            if ordered and failed:
+                for index in range(start + len(batch), len(instances)):
+                    errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: [self.not_written_message]}
+                break
+
+        return errors
+
+    def get_batch_validators(self):
+        """
+        (serializer field, validator) pairs of the child's validators that can check all items
+        at once. The field is None for validators of the child serializer itself.
+        """
+        pairs = []
+        for field in self.child.fields.values():
+            if not field.read_only:
+                pairs.extend((field, validator) for validator in field.validators
+                             if isinstance(validator, BatchUniquenessMixin))
+        pairs.extend((None, validator) for validator in self.child.validators
+                     if isinstance(validator, BatchUniquenessMixin))
+        #index backed validators do not query
+        return [(field, validator) for field, validator in pairs if not getattr(validator, 'use_index', False)]
+
+    def get_batch_keys(self, fields, data):
+        """
+        Tuples of the values of `fields` in the items of `data`, for items where they are valid.
+        """
+        keys = []
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            key = []
+            for field in fields:
+                value = field.get_value(item)
+                if value is empty or value is None:
+                    break
+                try:
+                    key.append(field.to_internal_value(value))
+                except (serializers.ValidationError, drf_fields.DjangoValidationError, TypeError, ValueError):
+                    break
+            else:
+                try:
+                    hash(tuple(key))
+                except TypeError:
+                    continue
+                keys.append(tuple(key))
+        return keys
+
+    def start_batches(self, data):
+        """
+        Prefetch what the batch validators need for `data`, returns the started validators.
+        """
+        fields_by_source = dict((field.source, field) for field in self.child.fields.values())
+        started = []
+        for field, validator in self.get_batch_validators():
+            if field is not None:
+                validator.set_context(field)
+                fields = [field]
+            else:
+                validator.set_context(self.child)
+                fields = [fields_by_source.get(name) for name in validator.get_unique_field_names()]
+                if None in fields:
+                    continue
+            validator.start_batch(self.get_batch_keys(fields, data))
+            started.append(validator)
+        return started
+
+    def get_raw_item_id(self, item):
+        Model = self.child.Meta.model
+        raw = item.get('id') if isinstance(item, dict) else None
+        if raw is None:
+            return None
+        return Model._fields[Model._meta['id_field']].to_python(raw)
+
+    def to_internal_value(self, data):
+        """
+        *** inherited from DRF 3 ListSerializer, runs unique validators in batches ***
+        """
+        if html.is_html_input(data):
+            data = html.parse_html_list(data)
+
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(
+                input_type=type(data).__name__
+            )
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [message]
+            })
+
+        results = self.validate_items(data)
+        errors = [error for validated, error in results]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return [validated for validated, error in results]
+
+    def validate_items(self, data):
+        """
+        Validate every item of the `data` list on its own, returns a (validated data, errors)
+        pair per item. Validated data is None for invalid items, errors are empty for valid ones.
+        """
+        batch_validators = [] if self.partial else self.start_batches(data)
+        results = []
+        try:
+            for item in data:
+                #updated documents do not conflict with themselves
+                item_id = self.get_raw_item_id(item) if self.instance is not None else None
+                for validator in batch_validators:
+                    validator.batch_item_id = item_id
+                try:
+                    results.append((self.child.run_validation(item), {}))
+                except serializers.ValidationError as exc:
+                    results.append((None, exc.detail))
+        finally:
+            for validator in batch_validators:
+                validator.end_batch()
+        return results
+
+    def get_item_ids(self, validated_data):
+        """
+        Ids of the items to update, from validated data or the initial data when
+        the id field is read only.
+        """
+        pk_name = self.child.Meta.model._meta['id_field']
+        initial_data = self.initial_data if hasattr(self, 'initial_data') else []
+        ids = []
+        for index, attrs in enumerate(validated_data):
+            pk = attrs.get(pk_name, attrs.get('id'))
+            if pk is None and index < len(initial_data):
+                pk = self.get_raw_item_id(initial_data[index])
+            ids.append(pk)
+        return ids
+
+    def update(self, instance, validated_data):
+        Model = self.child.Meta.model
+        pk_name = Model._meta['id_field']
+        ids = self.get_item_ids(validated_data)
+
+        #ids the query would refuse, checked before it runs
+        invalid = set()
+        for index, pk in enumerate(ids):
+            try:
+                if pk is not None:
+                    Model._fields[pk_name].validate(pk)
+            except me_ValidationError:
+                invalid.add(index)
+        queryset = instance if isinstance(instance, BaseQuerySet) else Model.objects
+        documents = dict((doc.pk, doc) for doc in queryset.filter(
+            pk__in=[pk for index, pk in enumerate(ids) if pk is not None and index not in invalid]))
+
+        errors = []
+        for index, pk in enumerate(ids):
+            if pk is None:
+                errors.append({pk_name: [self.no_id_message]})
+            elif index in invalid:
+                errors.append({pk_name: [self.invalid_id_message]})
+            elif pk not in documents:
+                errors.append({pk_name: [self.not_found_message]})
+            else:
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        version_field = self.child.version_field
+        if version_field is not None:
+            version_db_field = Model._fields[version_field].db_field
+        expected_versions = {}
+
+        instances = []
+        operations = []
+        for index, (pk, attrs) in enumerate(zip(ids, validated_data)):
+            raise_errors_on_nested_writes('update', self.child, attrs)
+            document = documents[pk]
+            if version_field is not None:
+                expected = attrs.pop(version_field, None)
+                initial_data = self.initial_data[index] if hasattr(self, 'initial_data') else {}
+                if expected is None or version_field not in initial_data:
+                    expected = getattr(document, version_field)
+                if getattr(document, version_field) != expected:
+                    errors[index] = {version_field: [self.version_conflict_message]}
+                    continue
+                expected_versions[index] = expected
+            original = snapshot(document, attrs.keys())
+            self.child.update_instance(document, attrs)
+            if not self.child.trust_validation:
+                try:
+                    document.validate()
+                except me_ValidationError as exc:
+                    errors[index] = exc.to_dict() or {api_settings.NON_FIELD_ERRORS_KEY: [exc.message]}
+            update = get_update_document(document, original)
+            if update:
+                select = {'_id': pk}
+                if version_field is not None:
+                    select[version_db_field] = get_version_condition(Model._fields[version_field],
+                                                                     expected_versions[index])
+                    update = add_version_update(update, version_db_field, expected_versions[index])
+                    setattr(document, version_field, next_version(expected_versions[index]))
+                operations.append((index, UpdateOne(select, update)))
+            instances.append(document)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        if operations:
+            collection = Model._get_collection()
+            try:
+                result = collection.bulk_write([op for index, op in operations], ordered=self.ordered)
+            except BulkWriteError as exc:
+                for write_error in exc.details.get('writeErrors', []):
+                    errors[operations[write_error['index']][0]] = self.get_write_error_detail(write_error)
+                raise serializers.ValidationError(errors)
+
+            if version_field is not None and result.matched_count < len(operations):
+                #find the items whose version did not match
+                written = dict((son['_id'], son.get(version_db_field)) for son in collection.find(
+                    {'_id': {'$in': [ids[index] for index, op in operations]}}, projection={version_db_field: 1}))
+                for index, op in operations:
+                    if written.get(ids[index]) != next_version(expected_versions[index]):
+                        errors[index] = {version_field: [self.version_conflict_message]}
+                raise serializers.ValidationError(errors)
+
+        for document in instances:
+            document._clear_changed_fields()
+        return instances
+
+
+class DocumentSerializerMetaclass(serializers.SerializerMetaclass):
+    """
+    Serializers setting `Meta.trust_serializer_validation = True` skip mongoengine's
+    validation when saving. That is only safe when the serializer validates everything
+    mongoengine would, so it is checked here, when the class is created: any gap
+    (see `utils.get_validation_gaps()`) raises ImproperlyConfigured.
+
+    Field validators set up with `use_index=True` get their unique index checked here too
+    (`UniqueTogetherValidator` checks its own when created).
+    """
+
+    def __new__(cls, name, bases, attrs):
+        serializer_class = super(DocumentSerializerMetaclass, cls).__new__(cls, name, bases, attrs)
+        for field_name, field in serializer_class._declared_fields.items():
+            for validator in getattr(field, 'validators', []):
+                if isinstance(validator, IndexUniquenessMixin):
+                    validator.check_index([field.source or field_name])
+        meta = getattr(serializer_class, 'Meta', None)
+        if getattr(meta, 'trust_serializer_validation', False):
+            gaps = get_validation_gaps(serializer_class())
+            if gaps:
+                raise ImproperlyConfigured(
+                    '%s sets `Meta.trust_serializer_validation`, but does not validate everything '
+                    'mongoengine does:\n- %s' % (name, '\n- '.join(gaps)))
+        return serializer_class
+
+
+@six.add_metaclass(DocumentSerializerMetaclass)
 class DocumentSerializer(serializers.ModelSerializer):
     """
 
@@ -132,6 +504,53 @@ class DocumentSerializer(serializers.ModelSerializer):
         if not hasattr(self.Meta, 'model'):
             raise AssertionError('You should set `model` attribute on %s.' % type(self).__name__)
 
+    @property
+    def version_field(self):
+        #model field counting the writes of a document, for optimistic concurrency
+        return getattr(self.Meta, 'version_field', None)
+
+    def pop_expected_version(self, validated_data, instance=None):
+        """
+        Returns (version, if_match): the version a document must still have for an update
+        to apply. Taken from the If-Match header of the request (passed by the view in the
+        context), else from the version field of the data, else from `instance`.
+        """
+        sent = validated_data.pop(self.version_field, None)
+        initial_data = getattr(self, 'initial_data', None)
+        if initial_data is not None and (not isinstance(initial_data, dict) or
+                                         self.version_field not in initial_data):
+            #filled in from the field's default
+            sent = None
+        if_match = self.context.get('if_match_version')
+        if if_match is not None:
+            return if_match, True
+        if sent is not None or instance is None:
+            return sent, False
+        return getattr(instance, self.version_field), False
+
+    @property
+    def trust_validation(self):
+        #documents are saved without mongoengine validation, see DocumentSerializerMetaclass
+        return getattr(self.Meta, 'trust_serializer_validation', False)
+
+    # list serializer used with many=True, unless Meta.list_serializer_class is set.
+    default_list_serializer_class = DocumentListSerializer
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        """
+        *** Inherited from DRF 3, defaults to `default_list_serializer_class` ***
+        """
+        child_serializer = cls(*args, **kwargs)
+        list_kwargs = {'child': child_serializer}
+        list_kwargs.update(dict([
+            (key, value) for key, value in kwargs.items()
+            if key in serializers.LIST_SERIALIZER_KWARGS
+        ]))
+        meta = getattr(cls, 'Meta', None)
+        list_serializer_class = getattr(meta, 'list_serializer_class', cls.default_list_serializer_class)
+        return list_serializer_class(*args, **list_kwargs)
+
     MAX_RECURSION_DEPTH = 5  # default value of depth
     field_mapping = {
         me_fields.FloatField: drf_fields.FloatField,
@@ -217,6 +636,8 @@ class DocumentSerializer(serializers.ModelSerializer):
         if self.is_drfme_field(model_field):
             kwargs['model_field'] = model_field
             kwargs['depth'] = getattr(self.Meta, 'depth', self.MAX_RECURSION_DEPTH)
+            #references are only fetched, up to `depth`, with `Meta.dereference_refs = True`
+            kwargs['dereference_refs'] = getattr(self.Meta, 'dereference_refs', False)
 
         if type(model_field) is me_fields.ObjectIdField:
             kwargs['required'] = False
@@ -424,22 +845,24 @@ class DocumentSerializer(serializers.ModelSerializer):
 
         return ret
 
-    def create(self, validated_data):
+    def build_instance(self, validated_data):
         """
-        Create an instance using queryset.create()
-        Before create() on self, call EmbeddedDocumentSerializer's create() first. If exists.
+        Instantiate a document from validated data, without saving it.
+        Before that, call EmbeddedDocumentSerializer's create() first. If exists.
         """
-        raise_errors_on_nested_writes('create', self, validated_data)
-
         # Automagically create and set embedded documents to validated data
         for embedded_field in self.embedded_document_serializer_fields:
-            embedded_doc_intance = embedded_field.create(embedded_field.validated_data)
+            if embedded_field.field_name in validated_data:
+                #with many=True, embedded data is left in place by ListSerializer.is_valid()
+                embedded_data = validated_data[embedded_field.field_name]
+            else:
+                embedded_data = embedded_field.validated_data
+            embedded_doc_intance = embedded_field.create(embedded_data)
             validated_data[embedded_field.field_name] = embedded_doc_intance
 
         ModelClass = self.Meta.model
         try:
             instance = ModelClass(**validated_data)
-            instance.save()
         except TypeError as exc:
             msg = (
                 'Got a `TypeError` when calling `%s.objects.create()`. '
@@ -456,6 +879,58 @@ class DocumentSerializer(serializers.ModelSerializer):
                 )
             )
             raise TypeError(msg)
+
+        if self.version_field is not None and getattr(instance, self.version_field) is None:
+            setattr(instance, self.version_field, 1)
+        return instance
+
+    def get_duplicate_key_detail(self, write_error):
+        """
+        Error detail for a duplicate key error of a write, given as a pymongo write error
+        (or error details) dict. The violated unique index is mapped back to the unique
+        validator of the same fields, whose message is returned, on its field or as a non
+        field error. Single field indexes without a validator report on their field.
+        """
+        Model = self.Meta.model
+        spec = get_duplicate_index(Model, write_error)
+        if spec is not None:
+            keys = set(spec['keys'])
+            writable = [field for field in self.fields.values() if not field.read_only and field.source != '*']
+            for field in writable:
+                if set([get_db_field(Model, field.source)]) != keys:
+                    continue
+                for validator in field.validators:
+                    if isinstance(validator, UniqueValidator):
+                        return {field.field_name: [validator.message]}
+                return {field.field_name: [UniqueValidator.message]}
+            for validator in self.validators:
+                if isinstance(validator, IndexUniquenessMixin):
+                    names = validator.get_unique_field_names()
+                    if set(get_db_field(Model, name) for name in names) == keys:
+                        message = validator.message.format(field_names=', '.join(names))
+                        return {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+        return {api_settings.NON_FIELD_ERRORS_KEY: [write_error.get('errmsg', 'Duplicate key.')]}
+
+    def duplicate_key_error(self, exc):
+        """
+        ValidationError for a NotUniqueError or DuplicateKeyError raised by a write.
+        """
+        details = getattr(exc, 'details', None) or {'errmsg': six.text_type(exc)}
+        return serializers.ValidationError(self.get_duplicate_key_detail(details))
+
+    def create(self, validated_data):
+        """
+        Create an instance using queryset.create()
+        Before create() on self, call EmbeddedDocumentSerializer's create() first. If exists.
+        """
+        raise_errors_on_nested_writes('create', self, validated_data)
+
+        instance = self.build_instance(validated_data)
+        ModelClass = self.Meta.model
+        try:
+            instance.save(validate=not self.trust_validation)
+        except NotUniqueError as exc:
+            raise self.duplicate_key_error(exc)
         except me_ValidationError as exc:
             msg = (
                 'Got a `ValidationError` when calling `%s.objects.create()`. '
@@ -475,16 +950,111 @@ class DocumentSerializer(serializers.ModelSerializer):
 
         return instance
 
+    def update_instance(self, instance, validated_data):
+        """
+        Set validated data on instance, without saving it. Embedded documents first.
+        """
+        for embedded_field in self.embedded_document_serializer_fields:
+            if embedded_field.field_name not in validated_data:
+                continue
+            #with many=True, embedded data is left in place by ListSerializer.is_valid()
+            embedded_data = validated_data.pop(embedded_field.field_name)
+            embedded_doc = getattr(instance, embedded_field.field_name)
+            if embedded_doc is None:
+                embedded_doc = embedded_field.create(embedded_data)
+            else:
+                embedded_doc = embedded_field.update(embedded_doc, embedded_data)
+            setattr(instance, embedded_field.field_name, embedded_doc)
+
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+
+        return instance
+
     def update(self, instance, validated_data):
         """
         Update embedded fields first, set relevant attributes with updated data
         And then continue regular updating
         """
+        if not getattr(self.Meta, 'diff_update', True) or instance._created or instance.pk is None:
+            for embedded_field in self.embedded_document_serializer_fields:
+                embedded_doc_intance = embedded_field.update(getattr(instance, embedded_field.field_name), embedded_field.validated_data)
+                setattr(instance, embedded_field.field_name, embedded_doc_intance)
+
+            raise_errors_on_nested_writes('update', self, validated_data)
+            save_kwargs = {'validate': not self.trust_validation}
+            versioned = self.version_field is not None and not instance._created and instance.pk is not None
+            if versioned:
+                expected, if_match = self.pop_expected_version(validated_data, instance)
+                if getattr(instance, self.version_field) != expected:
+                    raise version_conflict(if_match)
+                version_db_field = instance._fields[self.version_field].db_field
+                condition = get_version_condition(instance._fields[self.version_field], expected)
+                save_kwargs['save_condition'] = {'__raw__': {version_db_field: condition}}
+                validated_data[self.version_field] = next_version(expected)
+
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            try:
+                instance.save(**save_kwargs)
+            except SaveConditionError:
+                raise version_conflict(if_match)
+            except NotUniqueError as exc:
+                raise self.duplicate_key_error(exc)
+            return instance
+
+        return self.diff_update(instance, validated_data)
+
+    def diff_update(self, instance, validated_data):
+        """
+        Write only what changed: compare the stored values of the instance with the updated
+        ones and issue a single `update_one` with `$set`/`$unset`. Embedded documents are
+        diffed field by field, so changing one embedded field does not rewrite the whole
+        embedded document. Set `Meta.diff_update = False` to `save()` instead.
+
+        With `Meta.version_field`, the update only applies while the document still has
+        the expected version (see `pop_expected_version()`), and increments it. Otherwise
+        a 409 is raised, or a 412 when the version came from If-Match.
+        """
+        raise_errors_on_nested_writes('update', self, validated_data)
+
+        if self.version_field is not None:
+            expected, if_match = self.pop_expected_version(validated_data, instance)
+            if getattr(instance, self.version_field) != expected:
+                raise version_conflict(if_match)
+
+        original = snapshot(instance, get_field_names(instance))
+
         for embedded_field in self.embedded_document_serializer_fields:
             embedded_doc_intance = embedded_field.update(getattr(instance, embedded_field.field_name), embedded_field.validated_data)
             setattr(instance, embedded_field.field_name, embedded_doc_intance)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
 
-        return super(DocumentSerializer, self).update(instance, validated_data)
+        # pre_save receivers may still change the document, so diff after sending it.
+        me_signals.pre_save.send(instance.__class__, document=instance)
+        if not self.trust_validation:
+            instance.validate()
+
+        update = get_update_document(instance, original)
+        if update:
+            select = instance._qs.filter(**instance._object_key)._query
+            if self.version_field is not None:
+                version_db_field = instance._fields[self.version_field].db_field
+                select[version_db_field] = get_version_condition(instance._fields[self.version_field], expected)
+                update = add_version_update(update, version_db_field, expected)
+            try:
+                result = instance._get_collection().update_one(select, update)
+            except DuplicateKeyError as exc:
+                raise self.duplicate_key_error(exc)
+            if self.version_field is not None:
+                if not result.matched_count:
+                    raise version_conflict(if_match)
+                setattr(instance, self.version_field, next_version(expected))
+
+        instance._clear_changed_fields()
+        me_signals.post_save.send(instance.__class__, document=instance, created=False)
+        return instance
 
 
 subclass_serializers = {}
@@ -510,7 +1080,7 @@ class ChainableDocumentSerializer(DocumentSerializer):
         for klz in inspect.getmro(kls):
             if klz in subclass_serializers[self.__class__].keys():
                 serializer = subclass_serializers[self.__class__][klz]
-                if type(serializer) is serializers.SerializerMetaclass:
+                if isinstance(serializer, type):
                     #instantiate now, since there's a context we can pass along.
                     serializer = serializer(context=self._context)
                     subclass_serializers[self.__class__][klz] = serializer
@@ -694,6 +1264,9 @@ class EmbeddedDocumentSerializer(DocumentSerializer):
     A DocumentSerializer adjusted to have extended control over serialization and validation of EmbeddedDocuments.
     """
 
+    # EmbeddedDocuments have no collection to bulk write into.
+    default_list_serializer_class = serializers.ListSerializer
+
     def create(self, validated_data):
         """
         EmbeddedDocuments are not saved separately, so we create an instance of it.
@@ -1,8 +1,12 @@
 import mongoengine
+from pymongo import monitoring
 
 def pytest_configure():
     from django.conf import settings
+    from rest_framework_mongoengine.debug import QueryListener
 
+    #before connecting, so that the client notifies it
+    monitoring.register(QueryListener())
     mongoengine.connect("drfme-test", host="192.168.1.3")
 
     settings.configure(
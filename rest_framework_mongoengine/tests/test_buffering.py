@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from bson import ObjectId
+
+from rest_framework_mongoengine.buffering import BufferFull, WriteBuffer
+from test_models import Garage
+
+
+class TestWriteBuffer(TestCase):
+
+    def setUp(self):
+        self.buffer = WriteBuffer(Garage, batch_size=10, flush_interval=60)
+
+    def tearDown(self):
+        self.buffer.close()
+        Garage.objects.delete()
+
+    def test_flush_writes_queued_documents(self):
+        pending = [self.buffer.put(Garage(pk=ObjectId(), name='garage %d' % i).to_mongo()) for i in range(3)]
+        self.buffer.flush(timeout=5)
+
+        self.assertTrue(all(item.written and item.error is None for item in pending))
+        self.assertEqual(Garage.objects.count(), 3)
+
+    def test_write_errors_are_reported_per_document(self):
+        first = self.buffer.put(Garage(pk=ObjectId(), name='duplicate').to_mongo())
+        second = self.buffer.put(Garage(pk=ObjectId(), name='duplicate').to_mongo())
+        self.buffer.flush(timeout=5)
+
+        self.assertIsNone(first.wait(0))
+        self.assertIn('duplicate key', second.wait(0)['errmsg'])
+
+    def test_unencodable_batch_fails_without_stopping_the_thread(self):
+        bad = self.buffer.put({'_id': ObjectId(), 'name': object()})
+        self.buffer.flush(timeout=5)
+        self.assertIsNotNone(bad.wait(0))
+
+        good = self.buffer.put(Garage(pk=ObjectId(), name='after').to_mongo())
+        self.buffer.flush(timeout=5)
+        self.assertIsNone(good.wait(0))
+        self.assertEqual(Garage.objects.count(), 1)
+
+    def test_close_writes_pending_documents_and_refuses_new_ones(self):
+        self.buffer.put(Garage(pk=ObjectId(), name='last').to_mongo())
+        self.buffer.close(timeout=5)
+
+        self.assertEqual(Garage.objects.count(), 1)
+        with self.assertRaises(BufferFull):
+            self.buffer.put(Garage(pk=ObjectId(), name='too late').to_mongo())
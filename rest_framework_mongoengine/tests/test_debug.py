@@ -0,0 +1,159 @@
+from unittest import TestCase
+
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_mongoengine.debug import (QueryInspector, QueryRecord, QueryListener, get_plan_stages,
+                                              start_inspection, stop_inspection, is_inspecting)
+from rest_framework_mongoengine.mixins import FetchFreeDestroyModelMixin
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from rest_framework_mongoengine.viewsets import MongoGenericViewSet
+from test_models import Garage
+
+
+COLLSCAN_SORT = {
+    'queryPlanner': {
+        'winningPlan': {
+            'stage': 'SORT',
+            'inputStage': {'stage': 'COLLSCAN'},
+        },
+    },
+    'executionStats': {'nReturned': 2, 'totalDocsExamined': 5000},
+}
+
+IXSCAN = {
+    'queryPlanner': {
+        'winningPlan': {
+            'stage': 'FETCH',
+            'inputStage': {'stage': 'IXSCAN', 'indexName': 'city_1'},
+        },
+    },
+    'executionStats': {'nReturned': 2, 'totalDocsExamined': 2},
+}
+
+
+class TestQueryInspector(TestCase):
+
+    def test_plan_stages(self):
+        self.assertEqual(get_plan_stages(IXSCAN['queryPlanner']['winningPlan']), ['FETCH', 'IXSCAN'])
+
+    def test_flags_collscan_sort_and_ratio(self):
+        inspector = QueryInspector()
+        inspector.record(QueryRecord('list', 'garage', {}, lambda: COLLSCAN_SORT))
+        self.assertEqual(inspector.inspect(), 1)
+        flags = inspector.records[0].flags
+        self.assertIn('COLLSCAN', flags)
+        self.assertIn('SORT', flags)
+        self.assertIn('EXAMINED_RATIO: 5000/2', flags)
+
+    def test_index_scan_is_not_flagged(self):
+        inspector = QueryInspector()
+        inspector.record(QueryRecord('get_object', 'garage', {'city': 'x'}, lambda: IXSCAN))
+        inspector.inspect()
+        self.assertEqual(inspector.flagged, [])
+
+    def test_max_explains(self):
+        inspector = QueryInspector(max_explains=1)
+        for i in range(3):
+            inspector.record(QueryRecord('list', 'garage', {}, lambda: IXSCAN))
+        self.assertEqual(inspector.inspect(), 1)
+
+
+class TestInspection(TestCase):
+
+    def test_is_inspecting(self):
+        self.assertFalse(is_inspecting())
+        inspector = start_inspection()
+        try:
+            self.assertTrue(is_inspecting())
+        finally:
+            self.assertIs(stop_inspection(), inspector)
+        self.assertFalse(is_inspecting())
+
+
+class CommandStarted(object):
+    #the attributes of pymongo's CommandStartedEvent read by QueryListener
+    def __init__(self, command_name, command, database_name='drfme-test'):
+        self.command_name = command_name
+        self.command = command
+        self.database_name = database_name
+
+
+class TestQueryListener(TestCase):
+
+    def test_records_while_inspecting(self):
+        listener = QueryListener()
+        find = {'find': 'garage', 'filter': {'city': 'Oslo'}, 'sort': {'name': 1}, 'limit': 2, 'lsid': {}}
+        listener.started(CommandStarted('find', find))
+        inspector = start_inspection()
+        try:
+            listener.started(CommandStarted('find', find))
+            listener.started(CommandStarted('getMore', {'getMore': 1, 'collection': 'garage'}))
+            listener.started(CommandStarted('update', {'update': 'garage', 'updates': [
+                {'q': {'_id': 1}, 'u': {'$set': {'city': 'Bergen'}}}]}))
+        finally:
+            stop_inspection()
+        self.assertEqual([record.source for record in inspector.records], ['find', 'update'])
+        find_record, update_record = inspector.records
+        self.assertEqual(find_record.collection, 'garage')
+        self.assertEqual(find_record.query, {'city': 'Oslo'})
+        self.assertEqual(find_record.options, {'sort': {'name': 1}, 'limit': 2})
+        self.assertEqual(update_record.query, {'_id': 1})
+
+
+class GarageSerializer(DocumentSerializer):
+    class Meta:
+        model = Garage
+        fields = ('id', 'name')
+
+
+class GaragePagination(PageNumberPagination):
+    page_size = 2
+
+
+class InspectedGarageViewSet(FetchFreeDestroyModelMixin, MongoGenericViewSet):
+    queryset = Garage.objects.order_by('name')
+    serializer_class = GarageSerializer
+    pagination_class = GaragePagination
+    authentication_classes = ()
+    permission_classes = ()
+    query_debug = True
+    inspectors = []
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(InspectedGarageViewSet, self).finalize_response(request, response, *args, **kwargs)
+        self.inspectors.append(self.query_inspector)
+        return response
+
+
+class TestInspectedView(TestCase):
+
+    def setUp(self):
+        self.garages = [Garage(name=name).save() for name in ('a', 'b', 'c')]
+        del InspectedGarageViewSet.inspectors[:]
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def test_list_records_the_page_query(self):
+        response = InspectedGarageViewSet.as_view({'get': 'list'})(APIRequestFactory().get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Plan', response)
+        records = InspectedGarageViewSet.inspectors[0].records
+        self.assertIn('count', [record.source for record in records])
+        finds = [record for record in records if record.source == 'find']
+        self.assertEqual(len(finds), 1)
+        self.assertEqual(finds[0].options['limit'], 2)
+        self.assertEqual(finds[0].options['sort'], {'name': 1})
+        self.assertIsNotNone(finds[0].plan)
+
+    def test_fetch_free_writes_are_recorded(self):
+        view = InspectedGarageViewSet.as_view({'delete': 'destroy'})
+        self.assertEqual(view(APIRequestFactory().delete('/'), id=str(self.garages[0].pk)).status_code, 204)
+        records = InspectedGarageViewSet.inspectors[0].records
+        self.assertEqual([record.source for record in records], ['delete'])
+        self.assertEqual(records[0].query, {'_id': self.garages[0].pk})
@@ -1 +1,40 @@
+import base64
+from unittest import TestCase
+
+from mongoengine import fields as me_fields
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField
+
+from rest_framework_mongoengine.fields import BinaryField
+
 __author__ = 'bake3'
+
+
+class TestBinaryField(TestCase):
+
+    def get_field(self, **kwargs):
+        kwargs.setdefault('max_bytes', None)
+        field = BinaryField(model_field=me_fields.BinaryField(), depth=0, **kwargs)
+        field.chunk_size = 12
+        return field
+
+    def test_encodes_in_chunks(self):
+        value = bytes(bytearray(range(256))) * 4
+        self.assertEqual(self.get_field().to_representation(value), base64.b64encode(value).decode('ascii'))
+
+    def test_decodes(self):
+        field = self.get_field(max_bytes=4)
+        self.assertEqual(field.to_internal_value('AAECAw=='), b'\x00\x01\x02\x03')
+        self.assertRaises(ValidationError, field.to_internal_value, 'AAECAwQF')
+        self.assertRaises(ValidationError, self.get_field().to_internal_value, 'not base64!')
+
+    def test_out_of_band(self):
+        field = self.get_field(out_of_band_bytes=3)
+        self.assertEqual(field.to_representation(b'abcd'), {'length': 4})
+        self.assertEqual(field.to_representation(b'abc'), 'YWJj')
+
+    def test_out_of_band_placeholder_is_ignored(self):
+        field = self.get_field(out_of_band_bytes=3)
+        self.assertRaises(SkipField, field.to_internal_value, {'length': 4})
+        self.assertEqual(field.to_internal_value('YWJj'), b'abc')
+        self.assertRaises(ValidationError, self.get_field().to_internal_value, {'length': 4})
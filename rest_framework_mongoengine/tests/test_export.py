@@ -0,0 +1,124 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from mongoengine import connection
+from rest_framework.exceptions import ParseError
+
+from rest_framework_mongoengine import export
+from rest_framework_mongoengine.export import (get_split_points, get_ranges, get_after_query, dump_checkpoint,
+                                               load_checkpoint, run_export, get_executor, reset_connections)
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from test_models import Garage
+
+
+class SampledCollection(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def aggregate(self, pipeline):
+        return [{'n': value} for value in self.values]
+
+
+class GarageSerializer(DocumentSerializer):
+    class Meta:
+        model = Garage
+        fields = ('id', 'name', 'city')
+
+
+class TestExportRanges(TestCase):
+
+    def test_split_points_are_quantiles_of_the_sample(self):
+        points = get_split_points(SampledCollection([7, 1, 5, 3, 2, 8, 4, 6]), {}, 'n', 4, 8)
+        self.assertEqual(points, [3, 5, 7])
+        self.assertEqual(get_split_points(SampledCollection([1, 1, 1, 2]), {}, 'n', 4, 4), [1, 2])
+        self.assertEqual(get_split_points(SampledCollection([]), {}, 'n', 4, 4), [])
+
+    def test_range_queries(self):
+        first, middle, last = get_ranges([3, 5])
+        self.assertEqual(first.get_query('n'), [{'n': {'$not': {'$gte': 3}}}])
+        self.assertEqual(middle.get_query('n'), [{'n': {'$gte': 3, '$lt': 5}}])
+        self.assertEqual(last.get_query('n'), [{'n': {'$gte': 5}}])
+
+    def test_resuming_spans_later_types(self):
+        query = get_after_query('n', 4, 10)['$or']
+        self.assertEqual(query[:2], [{'n': {'$gt': 4}}, {'n': 4, '_id': {'$gt': 10}}])
+        self.assertIn('string', query[2]['n']['$type'])
+        self.assertNotIn('int', query[2]['n']['$type'])
+
+        query = get_after_query('n', None, 10)['$or']
+        self.assertEqual(query[0], {'n': None, '_id': {'$gt': 10}})
+        self.assertIn('int', query[1]['n']['$type'])
+
+    def test_checkpoint_round_trip(self):
+        ranges = get_ranges([3])
+        ranges[0].after = (2, 'b')
+        ranges[1].done = True
+        loaded = load_checkpoint(dump_checkpoint(ranges))
+        self.assertEqual([export_range.as_list() for export_range in loaded],
+                         [[None, 3, [2, 'b'], False], [3, None, None, True]])
+        self.assertRaises(ParseError, load_checkpoint, 'not a checkpoint')
+
+
+class TestRunExport(TestCase):
+
+    def setUp(self):
+        #batches of 2 end on documents without a city, then on 'a'
+        for name in ('one', 'two', 'three'):
+            Garage(name=name).save()
+        Garage(name='four', city='a').save()
+        Garage(name='five', city='b').save()
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def make_task(self, export_range):
+        return {'document': Garage, 'db_key': 'city', 'query': {}, 'find_kwargs': {}, 'batch_size': 2,
+                'serializer_class': GarageSerializer, 'context': {}, 'range': export_range}
+
+    def export(self, ranges, ordered=False, executor=None):
+        executor = executor or ThreadPoolExecutor(2)
+        content = b''.join(run_export(ranges, self.make_task, executor, 2, ordered=ordered))
+        lines = [json.loads(line) for line in content.decode('utf-8').splitlines()]
+        return ([line['name'] for line in lines if 'name' in line],
+                [line['__checkpoint__'] for line in lines if '__checkpoint__' in line])
+
+    def test_missing_keys_across_batches(self):
+        names, checkpoints = self.export(get_ranges([]), ordered=True)
+        self.assertEqual(names, ['one', 'two', 'three', 'four', 'five'])
+        self.assertEqual(len(checkpoints), 3)
+
+    def test_ranges_in_parallel(self):
+        names, checkpoints = self.export(get_ranges(['b']))
+        self.assertEqual(sorted(names), ['five', 'four', 'one', 'three', 'two'])
+
+    def test_resume_from_checkpoint(self):
+        names, checkpoints = self.export(get_ranges([]))
+        resumed, _ = self.export(load_checkpoint(checkpoints[0]))
+        self.assertEqual(resumed, names[2:])
+
+    def test_ranges_on_process_pool(self):
+        names, checkpoints = self.export(get_ranges(['b']), executor=get_executor('process', 2))
+        self.assertEqual(sorted(names), ['five', 'four', 'one', 'three', 'two'])
+
+
+class TestResetConnections(TestCase):
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def test_every_alias_is_reconnected_after_fork(self):
+        Garage(name='one').save()
+        clients = dict((alias, connection.get_connection(alias)) for alias in connection._connection_settings)
+        export._pid = None
+        reset_connections()
+        for alias, client in clients.items():
+            self.assertIsNot(connection.get_connection(alias), client)
+        self.assertIsNone(Garage._collection)
+        self.assertEqual(Garage.objects.count(), 1)
+
+    def test_same_process_keeps_connections(self):
+        client = connection.get_connection()
+        reset_connections()
+        self.assertIs(connection.get_connection(), client)
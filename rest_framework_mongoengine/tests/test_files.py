@@ -0,0 +1,191 @@
+from unittest import TestCase
+
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_mongoengine.files import RangeNotSatisfiable, etag_matches, parse_range, get_grid_fs
+from rest_framework_mongoengine.generics import GridFSFileAPIView, BinaryFieldAPIView
+from test_models import Report
+
+factory = APIRequestFactory()
+
+
+class ReportFile(GridFSFileAPIView):
+    queryset = Report.objects
+    file_field = 'pdf'
+    file_max_bytes = 64
+    file_chunk_size = 4
+    authentication_classes = ()
+    permission_classes = ()
+
+
+class VersionedReportFile(ReportFile):
+    version_field = 'version'
+
+
+class ReportPayload(BinaryFieldAPIView):
+    queryset = Report.objects
+    binary_field = 'payload'
+    version_field = 'version'
+    authentication_classes = ()
+    permission_classes = ()
+
+
+class TestRanges(TestCase):
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 100))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 1000))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 1000))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 1000))
+
+    def test_whole_file_for_other_ranges(self):
+        self.assertIsNone(parse_range(None, 1000))
+        self.assertIsNone(parse_range('bytes=0-9,20-29', 1000))
+        self.assertIsNone(parse_range('bytes=50-10', 1000))
+        self.assertIsNone(parse_range('items=0-9', 1000))
+
+    def test_range_past_the_end(self):
+        self.assertRaises(RangeNotSatisfiable, parse_range, 'bytes=1000-', 1000)
+        self.assertRaises(RangeNotSatisfiable, parse_range, 'bytes=-0', 1000)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"a", W/"b"', '"b"'))
+        self.assertTrue(etag_matches('*', '"b"'))
+        self.assertFalse(etag_matches('"a"', '"b"'))
+        self.assertFalse(etag_matches(None, '"b"'))
+
+
+class TestGridFSFileView(TestCase):
+
+    def setUp(self):
+        self.report = Report(title='yearly').save()
+        self.fs = get_grid_fs(Report._fields['pdf'])
+
+    def tearDown(self):
+        for grid_out in self.fs.find():
+            self.fs.delete(grid_out._id)
+        Report.objects.delete()
+
+    def call(self, request):
+        return ReportFile.as_view()(request, id=str(self.report.pk))
+
+    def upload(self, body, **extra):
+        return self.call(factory.put('/', body, content_type='application/pdf', **extra))
+
+    def get(self, **extra):
+        return self.call(factory.get('/', **extra))
+
+    def get_file_id(self):
+        return Report._get_collection().find_one({'_id': self.report.pk}).get('pdf')
+
+    def test_upload_and_download(self):
+        response = self.upload(b'0123456789')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['length'], 10)
+
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], '"%s"' % self.get_file_id())
+
+    def test_range(self):
+        self.upload(b'0123456789')
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+    def test_range_past_the_end(self):
+        self.upload(b'0123456789')
+        response = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_not_modified(self):
+        self.upload(b'0123456789')
+        response = self.get(HTTP_IF_NONE_MATCH='"%s"' % self.get_file_id())
+        self.assertEqual(response.status_code, 304)
+
+    def test_upload_replaces_the_old_file(self):
+        self.upload(b'first')
+        old_id = self.get_file_id()
+        self.upload(b'second')
+        self.assertNotEqual(self.get_file_id(), old_id)
+        self.assertFalse(self.fs.exists(old_id))
+        self.assertEqual(self.fs.get(self.get_file_id()).read(), b'second')
+
+    def test_too_large(self):
+        response = self.upload(b'x' * 65)
+        self.assertEqual(response.status_code, 413)
+        self.assertIsNone(self.get_file_id())
+        self.assertEqual(self.fs.find().count(), 0)
+
+    def test_truncated_body(self):
+        request = factory.put('/', b'0123', content_type='application/pdf')
+        request.META['CONTENT_LENGTH'] = '10'
+        response = self.call(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(self.get_file_id())
+        self.assertEqual(self.fs.find().count(), 0)
+
+    def test_delete(self):
+        self.upload(b'0123456789')
+        file_id = self.get_file_id()
+        response = self.call(factory.delete('/'))
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.get_file_id())
+        self.assertFalse(self.fs.exists(file_id))
+        self.assertEqual(self.get().status_code, 404)
+
+
+class TestVersionedWrites(TestCase):
+
+    def setUp(self):
+        self.report = Report(title='yearly').save()
+        self.fs = get_grid_fs(Report._fields['pdf'])
+
+    def tearDown(self):
+        for grid_out in self.fs.find():
+            self.fs.delete(grid_out._id)
+        Report.objects.delete()
+
+    def call(self, view, request):
+        return view.as_view()(request, id=str(self.report.pk))
+
+    def get_version(self):
+        return Report.objects.get(pk=self.report.pk).version
+
+    def test_upload_moves_the_version_on(self):
+        response = self.call(VersionedReportFile, factory.put('/', b'0123', content_type='application/pdf'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_version(), 2)
+        response = self.call(VersionedReportFile, factory.put('/', b'4567', content_type='application/pdf',
+                                                              HTTP_IF_MATCH='"2"'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_version(), 3)
+
+    def test_stale_upload(self):
+        response = self.call(VersionedReportFile, factory.put('/', b'0123', content_type='application/pdf',
+                                                              HTTP_IF_MATCH='"5"'))
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.get_version(), 1)
+        self.assertEqual(self.fs.find().count(), 0)
+
+    def test_delete(self):
+        self.call(VersionedReportFile, factory.put('/', b'0123', content_type='application/pdf'))
+        self.assertEqual(self.call(VersionedReportFile, factory.delete('/', HTTP_IF_MATCH='"1"')).status_code, 412)
+        response = self.call(VersionedReportFile, factory.delete('/', HTTP_IF_MATCH='"2"'))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['ETag'], '"3"')
+        self.assertEqual(self.fs.find().count(), 0)
+
+    def test_binary_upload(self):
+        response = self.call(ReportPayload, factory.put('/', b'0123', content_type='application/octet-stream'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        response = self.call(ReportPayload, factory.put('/', b'4567', content_type='application/octet-stream',
+                                                        HTTP_IF_MATCH='"1"'))
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Report.objects.get(pk=self.report.pk).payload, b'0123')
+        self.assertEqual(self.get_version(), 2)
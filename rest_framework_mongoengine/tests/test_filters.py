@@ -0,0 +1,86 @@
+from datetime import datetime
+from unittest import TestCase
+
+from bson import ObjectId
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_mongoengine.filters import MongoFilterBackend, objectid_time_bounds
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from rest_framework_mongoengine.utils import get_db_field, get_indexed_fields
+from test_models import Garage, Truck
+
+
+class GarageSerializer(DocumentSerializer):
+    class Meta:
+        model = Garage
+        fields = ('id', 'name', 'city')
+
+
+class GarageView(object):
+    filter_fields = ('city', 'zip_code')
+
+    def get_serializer(self):
+        return GarageSerializer()
+
+
+class TestIndexedFields(TestCase):
+
+    def test_leading_keys_are_indexed(self):
+        indexed = get_indexed_fields(Garage)
+        self.assertIn('_id', indexed)
+        self.assertIn('name', indexed)
+        self.assertIn('city', indexed)
+        self.assertIn('opened', indexed)
+
+    def test_compound_suffix_is_not_indexed(self):
+        self.assertNotIn('zip_code', get_indexed_fields(Garage))
+
+    def test_db_field_of_pk(self):
+        self.assertEqual(get_db_field(Garage, 'id'), '_id')
+
+    def test_db_field_of_embedded_path(self):
+        self.assertEqual(get_db_field(Truck, 'mpg__loaded'), 'mpg.loaded')
+
+
+class TestParseParam(TestCase):
+
+    def test_plain_param_is_exact(self):
+        self.assertEqual(MongoFilterBackend().parse_param('city'), ('city', 'exact'))
+
+    def test_lookup_param(self):
+        self.assertEqual(MongoFilterBackend().parse_param('opened__gte'), ('opened', 'gte'))
+
+    def test_unknown_lookup_is_part_of_the_name(self):
+        self.assertEqual(MongoFilterBackend().parse_param('zip__code'), ('zip__code', 'exact'))
+
+
+class TestGetFilters(TestCase):
+
+    def get_filters(self, view, query):
+        return MongoFilterBackend().get_filters(Request(APIRequestFactory().get('/' + query)), view)
+
+    def test_filters(self):
+        view = GarageView()
+        view.filter_fields = ('city',)
+        self.assertEqual(self.get_filters(view, '?city=Oslo&other=1'), [('city', 'exact', 'Oslo')])
+
+    def test_filter_field_missing_from_serializer(self):
+        with self.assertRaises(ImproperlyConfigured) as context:
+            self.get_filters(GarageView(), '?city=Oslo')
+        self.assertIn('zip_code', str(context.exception))
+
+
+class TestObjectIdTimeBounds(TestCase):
+
+    def test_bounds_are_objectid_range(self):
+        after = datetime(2015, 6, 1, tzinfo=timezone.utc)
+        before = datetime(2015, 7, 1, tzinfo=timezone.utc)
+        kwargs = objectid_time_bounds(after, before)
+        self.assertEqual(kwargs['pk__gte'], ObjectId.from_datetime(after))
+        self.assertEqual(kwargs['pk__lt'], ObjectId.from_datetime(before))
+
+    def test_missing_bounds_are_left_out(self):
+        self.assertEqual(objectid_time_bounds(), {})
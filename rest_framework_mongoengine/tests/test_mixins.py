@@ -0,0 +1,542 @@
+import json
+from contextlib import contextmanager
+from io import BytesIO
+from unittest import TestCase
+
+from bson import ObjectId
+from mongoengine import Document, IntField, StringField, signals
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_mongoengine.filters import MongoFilterBackend
+from rest_framework_mongoengine.generics import EmbeddedListItemAPIView
+from rest_framework_mongoengine.mixins import (StreamingListMixin, FetchFreeUpdateModelMixin, FetchFreeDestroyModelMixin,
+                                               BulkDestroyMixin, BSONPassthroughMixin)
+from rest_framework_mongoengine.parsers import BSONParser
+from rest_framework_mongoengine.renderers import BSONRenderer
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from rest_framework_mongoengine.viewsets import MongoGenericViewSet
+from test_models import Garage, Blog, Extension, Car, Manufacturer, Note
+
+factory = APIRequestFactory()
+
+
+class CollectionSpy(object):
+    """
+    Stands in for a pymongo collection, recording the names of the methods called.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            return attr(*args, **kwargs)
+        return call
+
+
+@contextmanager
+def spy_collection(document):
+    #_get_collection() returns the cached _collection
+    collection = document._get_collection()
+    spy = CollectionSpy(collection)
+    document._collection = spy
+    try:
+        yield spy.calls
+    finally:
+        document._collection = collection
+
+
+class GarageSerializer(DocumentSerializer):
+    class Meta:
+        model = Garage
+        fields = ('id', 'name', 'city')
+
+
+class CheckedPermission(BasePermission):
+    checked = []
+
+    def has_object_permission(self, request, view, obj):
+        self.checked.append(obj.pk)
+        return True
+
+
+class GarageViewSet(FetchFreeUpdateModelMixin, FetchFreeDestroyModelMixin, BulkDestroyMixin, MongoGenericViewSet):
+    queryset = Garage.objects
+    serializer_class = GarageSerializer
+    authentication_classes = ()
+    permission_classes = ()
+    filter_backends = (MongoFilterBackend,)
+    filter_fields = ('city',)
+    loaded = []
+
+    def get_object(self):
+        obj = super(GarageViewSet, self).get_object()
+        self.loaded.append(obj.pk)
+        return obj
+
+
+class CheckedGarageViewSet(GarageViewSet):
+    permission_classes = (CheckedPermission,)
+
+
+class CarSerializer(DocumentSerializer):
+    class Meta:
+        model = Car
+        fields = ('id', 'name', 'manufacturer')
+        depth = 1
+
+
+class NestedCarSerializer(CarSerializer):
+    class Meta(CarSerializer.Meta):
+        dereference_refs = True
+
+
+class CarViewSet(StreamingListMixin, MongoGenericViewSet):
+    queryset = Car.objects.order_by('name')
+    serializer_class = CarSerializer
+    authentication_classes = ()
+    permission_classes = ()
+    pagination_class = None
+    renderer_classes = (JSONRenderer,)
+    stream_chunk_size = 2
+    stream_select_related = True
+
+
+class Ranking(Document):
+    name = StringField()
+    rank = IntField()
+    level = IntField(default=1)
+
+    meta = {'ordering': ['-rank']}
+
+
+class RankingSerializer(DocumentSerializer):
+    class Meta:
+        model = Ranking
+        fields = ('name', 'rank')
+
+
+class RankingViewSet(BSONPassthroughMixin, MongoGenericViewSet):
+    queryset = Ranking.objects
+    serializer_class = RankingSerializer
+    authentication_classes = ()
+    permission_classes = ()
+    pagination_class = None
+    renderer_classes = (BSONRenderer,)
+
+
+class DefaultRankingSerializer(DocumentSerializer):
+    class Meta:
+        model = Ranking
+
+
+class DefaultRankingViewSet(RankingViewSet):
+    serializer_class = DefaultRankingSerializer
+    passthrough_defaults_stored = True
+
+
+class BlogExtensions(EmbeddedListItemAPIView):
+    queryset = Blog.objects
+    list_field = 'extensions'
+    item_key = 'name'
+    authentication_classes = ()
+    permission_classes = ()
+
+
+class BlogExtensionsByIndex(BlogExtensions):
+    item_key = None
+
+
+class VersionedBlogExtensions(BlogExtensions):
+    version_field = 'version'
+
+
+class NoteViewSet(BulkDestroyMixin, MongoGenericViewSet):
+    queryset = Note.objects
+    authentication_classes = ()
+    permission_classes = ()
+    version_field = 'version'
+
+
+class TestStreamingList(TestCase):
+
+    def render(self, chunks):
+        content = StreamingListMixin().render_json_array(JSONRenderer(), iter(chunks), 'application/json', {})
+        return b''.join(content)
+
+    def test_chunks_are_joined_into_one_array(self):
+        body = self.render([[{'name': 'north'}, {'name': 'south'}], [], [{'name': 'east'}]])
+        self.assertEqual(json.loads(body.decode('utf-8')), [{'name': 'north'}, {'name': 'south'}, {'name': 'east'}])
+
+    def test_no_chunks(self):
+        self.assertEqual(json.loads(self.render([]).decode('utf-8')), [])
+
+
+class TestStreamingListView(TestCase):
+
+    def setUp(self):
+        self.ford = Manufacturer(name='Ford').save()
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            Car(name=name, manufacturer=self.ford).save()
+
+    def tearDown(self):
+        Car.objects.delete()
+        Manufacturer.objects.delete()
+
+    def get(self, serializer_class):
+        view = CarViewSet.as_view({'get': 'list'}, serializer_class=serializer_class)
+        response = view(factory.get('/'))
+        return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def test_chunks(self):
+        data = self.get(CarSerializer)
+        self.assertEqual([car['name'] for car in data], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(set(car['manufacturer'] for car in data), set([str(self.ford.pk)]))
+
+    def test_nested_references(self):
+        data = self.get(NestedCarSerializer)
+        self.assertEqual([car['name'] for car in data], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual([car['manufacturer']['name'] for car in data], ['Ford'] * 5)
+
+    def test_select_related_only_for_nested_references(self):
+        for serializer_class, expected in ((CarSerializer, False), (NestedCarSerializer, True)):
+            view = CarViewSet(request=None, format_kwarg=None, serializer_class=serializer_class)
+            self.assertEqual(view.needs_select_related(), expected)
+
+
+class TestFetchFreeWrites(TestCase):
+
+    def setUp(self):
+        self.garage = Garage(name='north', city='Oslo')
+        self.garage.save()
+        del CheckedPermission.checked[:]
+        del GarageViewSet.loaded[:]
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def put(self, viewset, pk, data):
+        view = viewset.as_view({'put': 'update'})
+        return view(factory.put('/', data, format='json'), id=str(pk))
+
+    def delete(self, viewset, pk):
+        return viewset.as_view({'delete': 'destroy'})(factory.delete('/'), id=str(pk))
+
+    def test_update(self):
+        with spy_collection(Garage) as calls:
+            response = self.put(GarageViewSet, self.garage.pk, {'name': 'north', 'city': 'Bergen'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['city'], 'Bergen')
+        self.assertEqual(Garage.objects.get(pk=self.garage.pk).city, 'Bergen')
+        self.assertEqual(CheckedPermission.checked, [])
+        self.assertEqual(GarageViewSet.loaded, [])
+        self.assertEqual(calls.count('update_one'), 1)
+        self.assertNotIn('find_one', calls)
+
+    def test_update_of_missing_document(self):
+        response = self.put(GarageViewSet, ObjectId(), {'name': 'south', 'city': 'Bergen'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Garage.objects.count(), 1)
+
+    def test_update_loads_for_object_permissions(self):
+        response = self.put(CheckedGarageViewSet, self.garage.pk, {'name': 'north', 'city': 'Bergen'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CheckedPermission.checked, [self.garage.pk])
+        self.assertEqual(GarageViewSet.loaded, [self.garage.pk])
+
+    def test_update_loads_for_signal_receivers(self):
+        saved = []
+
+        def receiver(sender, document, **kwargs):
+            saved.append(document.pk)
+
+        signals.pre_save.connect(receiver, sender=Garage)
+        try:
+            response = self.put(GarageViewSet, self.garage.pk, {'name': 'north', 'city': 'Bergen'})
+        finally:
+            signals.pre_save.disconnect(receiver, sender=Garage)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(GarageViewSet.loaded, [self.garage.pk])
+        self.assertEqual(saved, [self.garage.pk])
+
+    def test_destroy(self):
+        with spy_collection(Garage) as calls:
+            response = self.delete(GarageViewSet, self.garage.pk)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Garage.objects.count(), 0)
+        self.assertEqual(GarageViewSet.loaded, [])
+        self.assertEqual(calls, ['delete_one'])
+
+    def test_destroy_of_missing_document(self):
+        self.assertEqual(self.delete(GarageViewSet, ObjectId()).status_code, 404)
+        self.assertEqual(Garage.objects.count(), 1)
+
+    def test_destroy_loads_for_object_permissions(self):
+        self.assertEqual(self.delete(CheckedGarageViewSet, self.garage.pk).status_code, 204)
+        self.assertEqual(CheckedPermission.checked, [self.garage.pk])
+
+    def test_destroy_loads_for_signal_receivers(self):
+        deleted = []
+
+        def receiver(sender, document, **kwargs):
+            deleted.append(document.pk)
+
+        signals.pre_delete.connect(receiver, sender=Garage)
+        try:
+            self.assertEqual(self.delete(GarageViewSet, self.garage.pk).status_code, 204)
+        finally:
+            signals.pre_delete.disconnect(receiver, sender=Garage)
+        self.assertEqual(deleted, [self.garage.pk])
+        self.assertEqual(GarageViewSet.loaded, [self.garage.pk])
+        self.assertEqual(Garage.objects.count(), 0)
+
+
+class TestBulkDestroy(TestCase):
+
+    def setUp(self):
+        for name, city in (('north', 'Oslo'), ('east', 'Oslo'), ('west', 'Bergen')):
+            Garage(name=name, city=city).save()
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def bulk_destroy(self, path, data=None):
+        view = GarageViewSet.as_view({'post': 'bulk_destroy'})
+        return view(factory.post(path, data or {}, format='json'))
+
+    def test_filters(self):
+        with spy_collection(Garage) as calls:
+            response = self.bulk_destroy('/?city=Oslo')
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual([garage.name for garage in Garage.objects], ['west'])
+        self.assertEqual(calls, ['delete_many'])
+
+    def test_signal_receivers_get_the_documents(self):
+        deleted = []
+
+        def receiver(sender, document, **kwargs):
+            deleted.append(document.name)
+
+        signals.pre_delete.connect(receiver, sender=Garage)
+        try:
+            response = self.bulk_destroy('/?city=Oslo')
+        finally:
+            signals.pre_delete.disconnect(receiver, sender=Garage)
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(sorted(deleted), ['east', 'north'])
+        self.assertEqual([garage.name for garage in Garage.objects], ['west'])
+
+    def test_ids_and_filters(self):
+        north = Garage.objects.get(name='north')
+        west = Garage.objects.get(name='west')
+        response = self.bulk_destroy('/?city=Oslo', {'ids': [str(north.pk), str(west.pk)]})
+        self.assertEqual(response.data, {'deleted': 1})
+        self.assertEqual(Garage.objects.count(), 2)
+
+    def test_every_document_is_refused(self):
+        self.assertEqual(self.bulk_destroy('/').status_code, 400)
+        self.assertEqual(Garage.objects.count(), 3)
+
+
+class TestEmbeddedListItemKeys(TestCase):
+
+    def setUp(self):
+        self.blog = Blog(title='news', extensions=[Extension(name='tags', value=1),
+                                                   Extension(name='likes', value=2)]).save()
+
+    def tearDown(self):
+        Blog.objects.delete()
+
+    def patch(self, item, data):
+        request = factory.patch('/', data, format='json')
+        return BlogExtensions.as_view()(request, id=str(self.blog.pk), item=item)
+
+    def get_names(self):
+        return [extension.name for extension in Blog.objects.get(pk=self.blog.pk).extensions]
+
+    def test_rename(self):
+        response = self.patch('tags', {'name': 'labels'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'labels')
+        self.assertEqual(self.get_names(), ['labels', 'likes'])
+
+    def test_rename_to_a_taken_key(self):
+        response = self.patch('tags', {'name': 'likes'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.data)
+        self.assertEqual(self.get_names(), ['tags', 'likes'])
+
+    def test_same_key(self):
+        response = self.patch('tags', {'name': 'tags', 'value': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).extensions[0].value, 5)
+
+    def test_rename_of_missing_item(self):
+        self.assertEqual(self.patch('ratings', {'name': 'likes'}).status_code, 404)
+
+
+class TestEmbeddedListItemRemoval(TestCase):
+
+    def setUp(self):
+        self.blog = Blog(title='news', extensions=[Extension(name='tags', value=1), Extension(name='likes', value=2),
+                                                   Extension(name='ratings', value=3)]).save()
+
+    def tearDown(self):
+        Blog.objects.delete()
+
+    def delete(self, view, item, pk=None):
+        return view.as_view()(factory.delete('/'), id=str(pk or self.blog.pk), item=item)
+
+    def get_names(self):
+        return [extension.name for extension in Blog.objects.get(pk=self.blog.pk).extensions]
+
+    def test_by_index(self):
+        self.assertEqual(self.delete(BlogExtensionsByIndex, '1').status_code, 204)
+        self.assertEqual(self.get_names(), ['tags', 'ratings'])
+        self.assertEqual(self.delete(BlogExtensionsByIndex, '0').status_code, 204)
+        self.assertEqual(self.get_names(), ['ratings'])
+
+    def test_by_key(self):
+        self.assertEqual(self.delete(BlogExtensions, 'likes').status_code, 204)
+        self.assertEqual(self.get_names(), ['tags', 'ratings'])
+
+    def test_missing_items(self):
+        self.assertEqual(self.delete(BlogExtensionsByIndex, '3').status_code, 404)
+        self.assertEqual(self.delete(BlogExtensions, 'views').status_code, 404)
+        self.assertEqual(self.delete(BlogExtensionsByIndex, '0', pk=ObjectId()).status_code, 404)
+        self.assertEqual(self.get_names(), ['tags', 'likes', 'ratings'])
+
+
+class TestVersionedListItems(TestCase):
+
+    def setUp(self):
+        self.blog = Blog(title='news', extensions=[Extension(name='tags', value=1)]).save()
+
+    def tearDown(self):
+        Blog.objects.delete()
+
+    def call(self, request, **kwargs):
+        return VersionedBlogExtensions.as_view()(request, id=str(self.blog.pk), **kwargs)
+
+    def get_blog(self):
+        return Blog.objects.get(pk=self.blog.pk)
+
+    def test_append_moves_the_version_on(self):
+        response = self.call(factory.post('/', {'name': 'likes', 'value': 2}, format='json'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(self.get_blog().version, 2)
+
+    def test_update_with_if_match(self):
+        response = self.call(factory.patch('/', {'value': 5}, format='json', HTTP_IF_MATCH='"1"'), item='tags')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(self.get_blog().extensions[0].value, 5)
+
+        response = self.call(factory.patch('/', {'value': 6}, format='json', HTTP_IF_MATCH='"1"'), item='tags')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.get_blog().extensions[0].value, 5)
+
+    def test_stale_destroy(self):
+        self.assertEqual(self.call(factory.delete('/', HTTP_IF_MATCH='"3"'), item='tags').status_code, 412)
+        self.assertEqual(len(self.get_blog().extensions), 1)
+        response = self.call(factory.delete('/', HTTP_IF_MATCH='"1"'), item='tags')
+        self.assertEqual(response.status_code, 204)
+        blog = self.get_blog()
+        self.assertEqual((len(blog.extensions), blog.version), (0, 2))
+
+
+class TestVersionedBulkDestroy(TestCase):
+
+    def setUp(self):
+        self.first = Note(text='first').save()
+        self.second = Note(text='second').save()
+        Note.objects(pk=self.second.pk).update(inc__version=1)
+
+    def tearDown(self):
+        Note.objects.delete()
+
+    def bulk_destroy(self, ids):
+        return NoteViewSet.as_view({'post': 'bulk_destroy'})(factory.post('/', {'ids': ids}, format='json'))
+
+    def test_changed_documents_are_kept(self):
+        response = self.bulk_destroy([{'id': str(self.first.pk), 'version': 1},
+                                      {'id': str(self.second.pk), 'version': 1}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['deleted'], 1)
+        self.assertEqual(response.data['ids'][0], {})
+        self.assertIn('version', response.data['ids'][1])
+        self.assertEqual([note.text for note in Note.objects], ['second'])
+
+    def test_plain_and_versioned_ids(self):
+        response = self.bulk_destroy([str(self.first.pk), {'id': str(self.second.pk), 'version': 2}])
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(Note.objects.count(), 0)
+
+    def test_missing_version(self):
+        self.assertEqual(self.bulk_destroy([{'id': str(self.first.pk)}]).status_code, 400)
+        self.assertEqual(Note.objects.count(), 2)
+
+
+class TestBSONPassthrough(TestCase):
+
+    def tearDown(self):
+        Ranking.objects.delete()
+
+    def get_projection(self, view=None, **meta):
+        class Serializer(DocumentSerializer):
+            class Meta:
+                model = Ranking
+        for name, value in meta.items():
+            setattr(Serializer.Meta, name, value)
+        return (view or RankingViewSet()).get_passthrough_projection(Serializer())
+
+    def test_projection(self):
+        self.assertEqual(self.get_projection(fields=('name', 'rank')), {'_id': 0, 'name': 1, 'rank': 1})
+
+    def test_primary_key_is_renamed(self):
+        self.assertEqual(self.get_projection(fields=('id', 'name')), {'_id': 0, 'id': '$_id', 'name': 1})
+
+    def test_defaults_are_passed_through_when_stored(self):
+        self.assertIsNone(self.get_projection(fields=('name', 'level')))
+        view = RankingViewSet(passthrough_defaults_stored=True)
+        self.assertEqual(self.get_projection(view, fields=('name', 'level')), {'_id': 0, 'name': 1, 'level': 1})
+
+    def test_list_follows_document_ordering(self):
+        for name, rank in (('b', 1), ('a', 3), ('c', 2)):
+            Ranking(name=name, rank=rank).save()
+        response = RankingViewSet.as_view({'get': 'list'})(factory.get('/', HTTP_ACCEPT='application/bson'))
+        response.render()
+        data = BSONParser().parse(BytesIO(response.content))
+        self.assertEqual([ranking['name'] for ranking in data], ['a', 'c', 'b'])
+        self.assertEqual(set(data[0].keys()), set(['name', 'rank']))
+
+    def test_default_serializer_is_passed_through(self):
+        self.assertEqual(DefaultRankingViewSet().get_passthrough_projection(DefaultRankingSerializer()),
+                         {'_id': 0, 'id': '$_id', 'name': 1, 'rank': 1, 'level': 1})
+
+    def test_list_renames_primary_key(self):
+        rankings = [Ranking(name=name, rank=rank).save() for name, rank in (('a', 2), ('b', 1))]
+        response = DefaultRankingViewSet.as_view({'get': 'list'})(factory.get('/', HTTP_ACCEPT='application/bson'))
+        response.render()
+        data = BSONParser().parse(BytesIO(response.content))
+        self.assertEqual([ranking['id'] for ranking in data], [ranking.pk for ranking in rankings])
+        self.assertEqual(set(data[0].keys()), set(['id', 'name', 'rank', 'level']))
+
+    def test_retrieve_renames_primary_key(self):
+        ranking = Ranking(name='a', rank=1).save()
+        view = DefaultRankingViewSet.as_view({'get': 'retrieve'})
+        response = view(factory.get('/', HTTP_ACCEPT='application/bson'), id=str(ranking.pk))
+        response.render()
+        data = BSONParser().parse(BytesIO(response.content))
+        self.assertEqual(data, {'id': ranking.pk, 'name': 'a', 'rank': 1, 'level': 1})
+        response = view(factory.get('/', HTTP_ACCEPT='application/bson'), id=str(ObjectId()))
+        self.assertEqual(response.status_code, 404)
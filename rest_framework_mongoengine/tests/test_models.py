@@ -37,3 +37,44 @@ class FuelMileage(Mileage):
 class Truck(Vehicle):
     mpg = fields.EmbeddedDocumentField(Mileage)
 
+
+class Dealer(Document):
+    name = fields.StringField()
+    makes = fields.ListField(fields.ReferenceField(Manufacturer))
+    brands = fields.MapField(fields.ReferenceField(Manufacturer))
+    extras = fields.DictField()
+
+
+class Garage(Document):
+    name = fields.StringField(unique=True)
+    city = fields.StringField()
+    zip_code = fields.StringField()
+    opened = fields.DateTimeField()
+    spaces = fields.IntField(min_value=0, max_value=50)
+
+    meta = {
+        'indexes': [('city', 'zip_code'), '-opened']
+    }
+
+
+class Note(Document):
+    text = fields.StringField()
+    version = fields.IntField(default=1)
+
+
+class Report(Document):
+    title = fields.StringField()
+    pdf = fields.FileField(collection_name='reports')
+    payload = fields.BinaryField(max_bytes=64)
+    version = fields.IntField(default=1)
+
+
+class Extension(EmbeddedDocument):
+    name = fields.StringField(required=True)
+    value = fields.IntField()
+
+
+class Blog(Document):
+    title = fields.StringField()
+    extensions = fields.ListField(fields.EmbeddedDocumentField(Extension))
+    version = fields.IntField(default=1)
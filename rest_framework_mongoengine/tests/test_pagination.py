@@ -0,0 +1,165 @@
+import gc
+import uuid
+from unittest import TestCase
+
+from bson import ObjectId
+from django.utils.six.moves.urllib.parse import parse_qs, urlparse
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_mongoengine.debug import get_plan_stages
+from rest_framework_mongoengine.mixins import needs_documents
+from rest_framework_mongoengine.pagination import CountCache, KeysetPagination, normalize_query, filter_id_bound
+from test_models import Garage, Vehicle, Car
+
+
+class TestNormalizeQuery(TestCase):
+
+    def test_key_order_is_ignored(self):
+        a = normalize_query({'name': 'DMC 12', 'weight': {'$gte': 10, '$lt': 20}})
+        b = normalize_query({'weight': {'$lt': 20, '$gte': 10}, 'name': 'DMC 12'})
+        self.assertEqual(a, b)
+
+    def test_in_order_is_ignored(self):
+        ids = [ObjectId(), ObjectId(), ObjectId()]
+        a = normalize_query({'_id': {'$in': ids}})
+        b = normalize_query({'_id': {'$in': list(reversed(ids))}})
+        self.assertEqual(a, b)
+
+    def test_or_order_is_kept(self):
+        query = {'$or': [{'name': 'a'}, {'name': 'b'}]}
+        self.assertEqual(normalize_query(query), query)
+
+
+class TestCountCache(TestCase):
+
+    def setUp(self):
+        self.count_cache = CountCache(key_prefix='test:%s' % uuid.uuid4().hex, documents=[Garage])
+        Garage(name='first').save()
+
+    def tearDown(self):
+        self.count_cache.close()
+        Garage.objects.delete()
+
+    def test_counts_are_cached(self):
+        self.assertEqual(self.count_cache.count(Garage.objects), 1)
+        #raw writes send no signals
+        Garage._get_collection().insert_one({'name': 'raw'})
+        self.assertEqual(self.count_cache.count(Garage.objects), 1)
+        self.assertEqual(self.count_cache.count(Garage.objects(name='raw')), 1)
+
+    def test_save_invalidates(self):
+        self.assertEqual(self.count_cache.count(Garage.objects), 1)
+        Garage(name='second').save()
+        self.assertEqual(self.count_cache.count(Garage.objects), 2)
+
+    def test_delete_invalidates(self):
+        self.assertEqual(self.count_cache.count(Garage.objects), 1)
+        Garage.objects.get(name='first').delete()
+        self.assertEqual(self.count_cache.count(Garage.objects), 0)
+
+    def test_writes_invalidate_without_counting(self):
+        #e.g. a worker that only writes
+        writer = CountCache(key_prefix='test:%s' % uuid.uuid4().hex)
+        generation = writer.get_generation('garage')
+        Garage(name='second').save()
+        self.assertNotEqual(writer.get_generation('garage'), generation)
+        writer.close()
+
+    def test_only_watched_documents_have_receivers(self):
+        self.assertTrue(needs_documents(Garage, 'post_save', 'post_delete'))
+        self.assertFalse(needs_documents(Vehicle, 'post_save', 'post_delete'))
+
+    def test_subclasses_are_watched(self):
+        count_cache = CountCache(key_prefix='test:%s' % uuid.uuid4().hex, documents=[Vehicle])
+        generation = count_cache.get_generation('vehicle')
+        car = Car(name='Beetle').save()
+        self.assertNotEqual(count_cache.get_generation('vehicle'), generation)
+        count_cache.close()
+        car.delete()
+
+    def test_close_disconnects(self):
+        generation = self.count_cache.get_generation('garage')
+        self.count_cache.close()
+        Garage(name='second').save()
+        self.assertEqual(self.count_cache.get_generation('garage'), generation)
+        self.assertFalse(needs_documents(Garage, 'post_save', 'post_delete'))
+
+    def test_unreferenced_cache_stops_listening(self):
+        CountCache(key_prefix='test:%s' % uuid.uuid4().hex)
+        gc.collect()
+        self.assertFalse(needs_documents(Vehicle, 'post_save', 'post_delete'))
+
+
+class TestKeysetPagination(TestCase):
+
+    def setUp(self):
+        self.ids = [Garage(name='garage %d' % index).save().pk for index in range(5)]
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def paginate(self, query='', ordering='id'):
+        paginator = KeysetPagination()
+        paginator.page_size = 2
+        paginator.ordering = ordering
+        page = paginator.paginate_queryset(Garage.objects, Request(APIRequestFactory().get('/garages/' + query)))
+        return [garage.pk for garage in page], paginator
+
+    def get_cursor(self, link, param):
+        return ObjectId(parse_qs(urlparse(link).query)[param][0])
+
+    def test_first_page(self):
+        page, paginator = self.paginate()
+        self.assertEqual(page, self.ids[:2])
+        self.assertEqual(self.get_cursor(paginator.get_next_link(), 'after'), self.ids[1])
+        self.assertIsNone(paginator.get_previous_link())
+
+    def test_next_page(self):
+        page, paginator = self.paginate('?after=%s' % self.ids[1])
+        self.assertEqual(page, self.ids[2:4])
+        self.assertEqual(self.get_cursor(paginator.get_next_link(), 'after'), self.ids[3])
+        previous = paginator.get_previous_link()
+        self.assertEqual(self.get_cursor(previous, 'before'), self.ids[2])
+        self.assertNotIn('after=', previous)
+
+    def test_last_page(self):
+        page, paginator = self.paginate('?after=%s' % self.ids[3])
+        self.assertEqual(page, self.ids[4:])
+        self.assertIsNone(paginator.get_next_link())
+
+    def test_previous_page(self):
+        page, paginator = self.paginate('?before=%s' % self.ids[2])
+        self.assertEqual(page, self.ids[:2])
+        self.assertIsNone(paginator.get_previous_link())
+        next_link = paginator.get_next_link()
+        self.assertEqual(self.get_cursor(next_link, 'after'), self.ids[1])
+        self.assertNotIn('before=', next_link)
+
+    def test_descending(self):
+        page, paginator = self.paginate(ordering='-id')
+        self.assertEqual(page, [self.ids[4], self.ids[3]])
+        page, paginator = self.paginate('?after=%s' % self.ids[3], ordering='-id')
+        self.assertEqual(page, [self.ids[2], self.ids[1]])
+        page, paginator = self.paginate('?before=%s' % self.ids[2], ordering='-id')
+        self.assertEqual(page, [self.ids[4], self.ids[3]])
+
+    def test_invalid_cursor(self):
+        self.assertRaises(NotFound, self.paginate, '?after=nope')
+        self.assertRaises(NotFound, self.paginate, '?before=nope')
+
+    def test_cursor_bound_is_added_to_id_range(self):
+        queryset = Garage.objects.filter(pk__gte=self.ids[1], pk__lt=self.ids[4])
+        bounded = filter_id_bound(queryset, '$gt', self.ids[2])
+        self.assertEqual([garage.pk for garage in bounded.order_by('id')], [self.ids[3]])
+        self.assertEqual([garage.pk for garage in queryset.order_by('id')], self.ids[1:4])
+
+    def test_cursor_bound_uses_id_index(self):
+        queryset = filter_id_bound(Garage.objects.filter(pk__gte=self.ids[1]), '$gt', self.ids[2])
+        stages = get_plan_stages(queryset.explain()['queryPlanner']['winningPlan'])
+        self.assertNotIn('COLLSCAN', stages)
+
+    def test_looser_cursor_bound(self):
+        queryset = filter_id_bound(Garage.objects.filter(pk__gt=self.ids[3]), '$gt', self.ids[1])
+        self.assertEqual([garage.pk for garage in queryset], self.ids[4:])
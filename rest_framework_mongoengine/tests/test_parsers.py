@@ -0,0 +1,28 @@
+from io import BytesIO
+from unittest import TestCase
+
+from rest_framework_mongoengine.parsers import InvalidLine, NDJSONParser
+
+
+class TestNDJSONParser(TestCase):
+
+    def parse(self, body, max_line_length=None):
+        parser = NDJSONParser()
+        if max_line_length is not None:
+            parser.max_line_length = max_line_length
+        return parser.parse(BytesIO(body), parser_context={'encoding': 'utf-8'})
+
+    def test_parses_lines_lazily(self):
+        stream = self.parse(b'{"name": "north"}\n\n{"name": "south"}\n')
+        records = iter(stream)
+        self.assertEqual(next(records), {'name': 'north'})
+        self.assertEqual(stream.line_number, 1)
+        self.assertEqual(next(records), {'name': 'south'})
+        self.assertEqual(stream.line_number, 3)
+        self.assertEqual(list(records), [])
+
+    def test_invalid_lines_do_not_stop_parsing(self):
+        records = list(self.parse(b'{"name": \n' + b'x' * 50 + b'\n{"name": "east"}', max_line_length=20))
+        self.assertIsInstance(records[0], InvalidLine)
+        self.assertIsInstance(records[1], InvalidLine)
+        self.assertEqual(records[2], {'name': 'east'})
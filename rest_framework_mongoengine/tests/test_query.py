@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+from bson import DBRef
+from mongoengine import Document, StringField
+from mongoengine.connection import get_connection, register_connection
+
+from rest_framework_mongoengine.query import dereference_dbref
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from test_models import Manufacturer, Dealer
+
+
+class Archive(Document):
+    name = StringField()
+
+    meta = {'db_alias': 'drfme-archive'}
+
+
+class TestDereferenceDBRef(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        host, port = get_connection().address
+        register_connection('drfme-archive', 'drfme-test-archive', host=host, port=port)
+
+    def tearDown(self):
+        Archive.objects.delete()
+
+    def test_reads_through_the_alias_of_the_document(self):
+        archive = Archive(name='1999').save()
+        fetched = dereference_dbref(DBRef(Archive._get_collection_name(), archive.pk))
+        self.assertTrue(isinstance(fetched, Archive))
+        self.assertEqual(fetched.name, '1999')
+
+    def test_dangling_reference(self):
+        archive = Archive(name='1999').save()
+        archive.delete()
+        self.assertIsNone(dereference_dbref(DBRef(Archive._get_collection_name(), archive.pk)))
+
+
+class TestDereferenceRefs(TestCase):
+
+    def setUp(self):
+        self.ford = Manufacturer(name='Ford').save()
+        self.dmc = Manufacturer(name='DMC').save()
+        self.dealer = Dealer(name='Main Street', makes=[self.ford, self.dmc],
+                             brands={'classic': self.ford, 'future': self.dmc}).save()
+
+    def tearDown(self):
+        Dealer.objects.delete()
+        Manufacturer.objects.delete()
+
+    def get_data(self, **meta):
+        class DealerSerializer(DocumentSerializer):
+            class Meta:
+                model = Dealer
+                fields = ('name', 'makes', 'brands')
+                #the list or map is a level, its references the next one
+                depth = 2
+        for name, value in meta.items():
+            setattr(DealerSerializer.Meta, name, value)
+        return DealerSerializer(Dealer.objects.get(pk=self.dealer.pk)).data
+
+    def test_references_are_ids_by_default(self):
+        data = self.get_data()
+        self.assertEqual(data['makes'], [str(self.ford.pk), str(self.dmc.pk)])
+        self.assertEqual(data['brands'], {'classic': str(self.ford.pk), 'future': str(self.dmc.pk)})
+
+    def test_list_of_references(self):
+        data = self.get_data(dereference_refs=True)
+        self.assertEqual([make['name'] for make in data['makes']], ['Ford', 'DMC'])
+
+    def test_map_of_references(self):
+        data = self.get_data(dereference_refs=True)
+        self.assertEqual(dict((key, brand['name']) for key, brand in data['brands'].items()),
+                         {'classic': 'Ford', 'future': 'DMC'})
+
+    def test_references_past_depth_are_ids(self):
+        data = self.get_data(dereference_refs=True, depth=1)
+        self.assertEqual(data['makes'], [str(self.ford.pk), str(self.dmc.pk)])
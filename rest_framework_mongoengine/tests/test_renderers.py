@@ -0,0 +1,143 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+from unittest import TestCase
+
+from bson import DBRef, ObjectId
+from mongoengine import Document, DecimalField
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from rest_framework_mongoengine import renderers
+from rest_framework_mongoengine.parsers import BSONParser
+from rest_framework_mongoengine.renderers import FastJSONRenderer, ArrowRenderer, BSONRenderer, RowsRenderer
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from test_models import Garage
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class Price(Document):
+    amount = DecimalField(precision=2)
+
+
+class GarageSerializer(DocumentSerializer):
+    class Meta:
+        model = Garage
+
+
+class TestFastJSONRenderer(TestCase):
+
+    def render(self, data, **context):
+        return json.loads(FastJSONRenderer().render(data, 'application/json', context).decode('utf-8'))
+
+    def test_bson_types(self):
+        oid = ObjectId()
+        data = {'id': oid, 'ref': DBRef('garage', oid), 'opened': datetime(2015, 6, 1, 12, 30, 0, 123456),
+                'price': Decimal('1.5')}
+        self.assertEqual(self.render(data), {'id': str(oid), 'ref': str(oid), 'opened': '2015-06-01T12:30:00.123',
+                                             'price': 1.5})
+
+    def test_key_order(self):
+        data = OrderedDict([('b', 1), ('a', 2)])
+        rendered = FastJSONRenderer().render(data, 'application/json', {}).decode('utf-8')
+        self.assertLess(rendered.index('"b"'), rendered.index('"a"'))
+        rendered = FastJSONRenderer().render(data, 'application/json', {'sort_keys': True}).decode('utf-8')
+        self.assertLess(rendered.index('"a"'), rendered.index('"b"'))
+
+    def test_non_finite_floats(self):
+        data = [float('nan'), float('inf'), float('-inf')]
+        rendered = FastJSONRenderer().render(data, 'application/json', {})
+        if renderers.orjson is not None:
+            self.assertEqual(rendered, b'[null,null,null]')
+        else:
+            self.assertEqual(rendered, b'[NaN,Infinity,-Infinity]')
+        #indented output is always encoded by the json module, like JSONRenderer
+        rendered = FastJSONRenderer().render(data, 'application/json; indent=2', {})
+        self.assertEqual(json.loads(rendered.decode('utf-8'))[1], float('inf'))
+
+
+class TestBSON(TestCase):
+
+    def test_round_trip(self):
+        oid = ObjectId()
+        body = BSONRenderer().render([{'id': oid, 'price': Decimal('1.5')}])
+        data = BSONParser().parse(BytesIO(body))
+        self.assertEqual(data[0]['id'], oid)
+        self.assertEqual(str(data[0]['price']), '1.5')
+
+
+class TestRowsRenderer(TestCase):
+
+    def test_nested_fields_are_flattened(self):
+        class AddressSerializer(serializers.Serializer):
+            city = serializers.CharField()
+
+        class PlaceSerializer(serializers.Serializer):
+            name = serializers.CharField()
+            address = AddressSerializer(allow_null=True)
+
+        places = [{'name': 'north', 'address': {'city': 'Oslo'}}, {'name': 'south', 'address': None}]
+        data = PlaceSerializer(places, many=True).data
+        rendered = json.loads(RowsRenderer().render(data, 'application/vnd.rows+json', {}).decode('utf-8'))
+        self.assertEqual(rendered, {'columns': ['name', 'address.city'],
+                                    'rows': [['north', 'Oslo'], ['south', None]]})
+
+
+class TestArrowRenderer(TestCase):
+
+    def setUp(self):
+        if pyarrow is None:
+            self.skipTest('pyarrow is not installed')
+        self.garages = [Garage(id=ObjectId(), name='north', opened=datetime(2015, 6, 1)),
+                        Garage(id=ObjectId(), name='south')]
+
+    def read(self, body):
+        return pyarrow.ipc.open_stream(body).read_all()
+
+    def test_typed_columns(self):
+        body = b''.join(ArrowRenderer().render_stream([GarageSerializer(self.garages, many=True)]))
+        table = self.read(body)
+        self.assertEqual(table.column('name').to_pylist(), ['north', 'south'])
+        self.assertEqual(table.column('id').to_pylist(), [str(garage.id) for garage in self.garages])
+        self.assertEqual(str(table.schema.field('opened').type), 'timestamp[ms, tz=UTC]')
+
+    def test_decimal_columns(self):
+        class PriceSerializer(DocumentSerializer):
+            class Meta:
+                model = Price
+
+        prices = [Price(id=ObjectId(), amount=Decimal('1.25')), Price(id=ObjectId(), amount=Decimal('0.1'))]
+        table = self.read(b''.join(ArrowRenderer().render_stream([PriceSerializer(prices, many=True)])))
+        self.assertEqual(str(table.schema.field('amount').type), 'decimal128(38, 2)')
+        self.assertEqual(table.column('amount').to_pylist(), [Decimal('1.25'), Decimal('0.10')])
+
+    def test_declared_fields_are_serialized(self):
+        class UpperCaseField(serializers.CharField):
+            def to_representation(self, value):
+                return value.upper()
+
+        class UpperCaseGarageSerializer(GarageSerializer):
+            name = UpperCaseField()
+
+        body = b''.join(ArrowRenderer().render_stream([UpperCaseGarageSerializer(self.garages, many=True)]))
+        self.assertEqual([json.loads(name) for name in self.read(body).column('name').to_pylist()],
+                         ['NORTH', 'SOUTH'])
+
+    def test_page_keys_go_into_metadata(self):
+        data = OrderedDict([('count', 2), ('next', None), ('results', GarageSerializer(self.garages, many=True).data)])
+        table = self.read(ArrowRenderer().render(data))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.schema.metadata, {b'count': b'2', b'next': b'null'})
+
+    def test_errors_are_json(self):
+        response = Response({'detail': 'Not found.'}, status=404)
+        response.exception = True
+        body = ArrowRenderer().render(response.data, ArrowRenderer.media_type, {'response': response})
+        self.assertEqual(json.loads(body.decode('utf-8')), {'detail': 'Not found.'})
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
@@ -4,11 +4,15 @@ from unittest import TestCase
 from bson import objectid
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 from rest_framework import fields as drf_fields
+from rest_framework.exceptions import ValidationError
 
-from rest_framework_mongoengine.serializers import DocumentSerializer, PolymorphicDocumentSerializer
-from test_models import Vehicle, Car, Truck, Mileage, FuelMileage
+from rest_framework_mongoengine.serializers import (DocumentSerializer, DocumentListSerializer,
+                                                    PolymorphicDocumentSerializer)
+from rest_framework_mongoengine.validators import UniqueValidator, UniqueTogetherValidator
+from test_models import Vehicle, Car, Truck, Mileage, FuelMileage, Garage
 
 class VehicleSerializer(DocumentSerializer):
 
@@ -58,4 +62,139 @@ class TestDocumentSerializer(TestCase):
 
         self.assertTrue(isinstance(f['weight'], drf_fields.IntegerField))
         self.assertTrue(isinstance(f['name'], drf_fields.CharField))
-        self.assertTrue(isinstance(f['weight'], drf_fields.IntegerField))
\ No newline at end of file
+        self.assertTrue(isinstance(f['weight'], drf_fields.IntegerField))
+
+
+class TestDocumentListSerializer(TestCase):
+
+    def test_many_uses_document_list_serializer(self):
+        serializer = VehicleSerializer(many=True)
+        self.assertTrue(isinstance(serializer, DocumentListSerializer))
+
+    def test_bulk_create_assigns_ids(self):
+        data = [
+            {'name': 'DMC 12', 'manufacturer': 'Delorean Motor Company', 'weight': 4000},
+            {'name': 'Model T', 'manufacturer': 'Ford', 'weight': 1200},
+        ]
+        serializer = VehicleSerializer(data=data, many=True)
+        self.assertTrue(serializer.is_valid())
+        instances = serializer.save()
+
+        self.assertEqual(len(instances), 2)
+        for instance in instances:
+            self.assertTrue(isinstance(instance.pk, objectid.ObjectId))
+            self.assertEqual(Vehicle.objects(pk=instance.pk).count(), 1)
+            instance.delete()
+
+    def test_bulk_update_reports_invalid_ids(self):
+        vehicle = Vehicle(name='DMC 12', weight=4000).save()
+        data = [{'id': str(vehicle.pk), 'name': 'DMC 12', 'weight': 4100}, {'id': 'not an id', 'name': 'Model T'}]
+        serializer = VehicleSerializer(Vehicle.objects, data=data, many=True)
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(ValidationError) as context:
+            serializer.save()
+        self.assertEqual(context.exception.detail[0], {})
+        self.assertEqual(context.exception.detail[1], {'id': ['Invalid id.']})
+        self.assertEqual(Vehicle.objects.get(pk=vehicle.pk).weight, 4000)
+        vehicle.delete()
+
+
+class TestTrustSerializerValidation(TestCase):
+
+    def test_trusted_serializer_saves_without_validation(self):
+        class TrustedVehicleSerializer(DocumentSerializer):
+            class Meta:
+                model = Vehicle
+                trust_serializer_validation = True
+
+        serializer = TrustedVehicleSerializer(data={'name': 'DMC 12', 'weight': 4000})
+        self.assertTrue(serializer.trust_validation)
+        self.assertTrue(serializer.is_valid())
+        instance = serializer.save()
+        self.assertEqual(Vehicle.objects(pk=instance.pk).count(), 1)
+        instance.delete()
+
+    def test_uncovered_constraints_are_rejected(self):
+        class Part(me.Document):
+            kind = me.StringField(choices=('engine', 'wheel'))
+            serial = me.StringField(regex=r'^[A-Z0-9]+$')
+            count = me.IntField(min_value=1)
+
+        with self.assertRaises(ImproperlyConfigured) as context:
+            class PartSerializer(DocumentSerializer):
+                class Meta:
+                    model = Part
+                    trust_serializer_validation = True
+
+        message = str(context.exception)
+        for name in ('kind', 'serial', 'count'):
+            self.assertIn(name, message)
+
+    def test_embedded_documents_need_nested_serializer(self):
+        with self.assertRaises(ImproperlyConfigured):
+            class TruckSerializer(DocumentSerializer):
+                class Meta:
+                    model = Truck
+                    trust_serializer_validation = True
+
+
+class TestBatchedUniqueness(TestCase):
+
+    def get_serializer_class(self):
+        class GarageSerializer(DocumentSerializer):
+            name = drf_fields.CharField(validators=[UniqueValidator(queryset=Garage.objects)])
+
+            class Meta:
+                model = Garage
+
+        return GarageSerializer
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def test_duplicates_within_payload(self):
+        serializer = self.get_serializer_class()(data=[{'name': 'north'}, {'name': 'north'}], many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors[0], {})
+        self.assertIn('name', serializer.errors[1])
+
+    def test_stored_values(self):
+        Garage(name='south').save()
+        serializer = self.get_serializer_class()(data=[{'name': 'east'}, {'name': 'south'}], many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors[0], {})
+        self.assertIn('name', serializer.errors[1])
+
+class TestIndexBackedUniqueness(TestCase):
+
+    def get_serializer_class(self):
+        class GarageSerializer(DocumentSerializer):
+            name = drf_fields.CharField(validators=[UniqueValidator(queryset=Garage.objects, use_index=True)])
+
+            class Meta:
+                model = Garage
+
+        return GarageSerializer
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def test_requires_unique_index(self):
+        with self.assertRaises(ImproperlyConfigured):
+            UniqueTogetherValidator(queryset=Garage.objects, fields=('city', 'zip_code'), use_index=True)
+
+    def test_duplicate_key_on_create(self):
+        Garage(name='south').save()
+        serializer = self.get_serializer_class()(data={'name': 'south'})
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(ValidationError) as context:
+            serializer.save()
+        self.assertEqual(context.exception.detail, {'name': ['This field must be unique.']})
+
+    def test_duplicate_key_on_bulk_insert(self):
+        Garage(name='south').save()
+        serializer = self.get_serializer_class()(data=[{'name': 'east'}, {'name': 'south'}], many=True)
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(ValidationError) as context:
+            serializer.save()
+        self.assertEqual(context.exception.detail[1], {'name': ['This field must be unique.']})
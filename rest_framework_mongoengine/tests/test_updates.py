@@ -0,0 +1,236 @@
+from unittest import TestCase
+
+from bson import ObjectId
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_mongoengine.mixins import OperatorPartialUpdateMixin
+from rest_framework_mongoengine.serializers import DocumentSerializer
+from rest_framework_mongoengine.updates import (snapshot, get_update_document, OperatorUpdateBuilder, ListItemSelector,
+                                                prefix_update_document, VersionConflict, VersionPreconditionFailed,
+                                                add_version_increment)
+from rest_framework_mongoengine.viewsets import MongoGenericViewSet
+from test_models import Vehicle, Note, Garage, Truck, Mileage, FuelMileage
+
+
+class TestUpdateDocument(TestCase):
+
+    def setUp(self):
+        self.vehicle = Vehicle(id=ObjectId(), name='DMC 12', manufacturer='Delorean Motor Company', weight=4000)
+
+    def test_changed_fields_are_set(self):
+        original = snapshot(self.vehicle, ['name', 'weight'])
+        self.vehicle.weight = 4100
+        self.vehicle.name = 'DMC 12'
+        self.assertEqual(get_update_document(self.vehicle, original), {'$set': {'weight': 4100}})
+
+    def test_cleared_fields_are_unset(self):
+        original = snapshot(self.vehicle, ['manufacturer'])
+        self.vehicle.manufacturer = None
+        self.assertEqual(get_update_document(self.vehicle, original), {'$unset': {'manufacturer': ''}})
+
+    def test_unchanged_document_needs_no_update(self):
+        original = snapshot(self.vehicle, ['id', 'name'])
+        self.assertEqual(get_update_document(self.vehicle, original), {})
+
+
+class TestEmbeddedDiff(TestCase):
+
+    def test_embedded_fields_are_set_by_path(self):
+        truck = Truck(id=ObjectId(), name='Semi', mpg=Mileage(loaded=5, unloaded=8))
+        original = snapshot(truck, ['mpg'])
+        truck.mpg.loaded = 6
+        self.assertEqual(get_update_document(truck, original), {'$set': {'mpg.loaded': 6}})
+
+    def test_embedded_fields_are_unset_by_path(self):
+        truck = Truck(id=ObjectId(), name='Semi', mpg=Mileage(loaded=5, unloaded=8))
+        original = snapshot(truck, ['mpg'])
+        truck.mpg.unloaded = None
+        self.assertEqual(get_update_document(truck, original), {'$unset': {'mpg.unloaded': ''}})
+
+    def test_embedded_class_change_replaces_document(self):
+        truck = Truck(id=ObjectId(), name='Semi', mpg=Mileage(loaded=5))
+        original = snapshot(truck, ['mpg'])
+        truck.mpg = FuelMileage(loaded=5, e85=3)
+        update = get_update_document(truck, original)
+        self.assertEqual(list(update['$set'].keys()), ['mpg'])
+
+
+class TestOperatorUpdateBuilder(TestCase):
+
+    def get_builder(self):
+        class VehicleSerializer(DocumentSerializer):
+            class Meta:
+                model = Vehicle
+
+        return OperatorUpdateBuilder(VehicleSerializer(partial=True))
+
+    def test_merge_patch(self):
+        update = self.get_builder().build({'name': 'DMC 12', 'manufacturer': None})
+        self.assertEqual(update, {'$set': {'name': 'DMC 12'}, '$unset': {'manufacturer': ''}})
+
+    def test_increment(self):
+        update = self.get_builder().build({'$inc': {'weight': 10}})
+        self.assertEqual(update, {'$inc': {'weight': 10}})
+
+    def test_increment_of_text_field_is_rejected(self):
+        self.assertRaises(ValidationError, self.get_builder().build, {'$inc': {'name': 1}})
+
+    def test_conflicting_paths_are_rejected(self):
+        self.assertRaises(ValidationError, self.get_builder().build, {'weight': 1, '$inc': {'weight': 1}})
+
+
+class GarageSerializer(DocumentSerializer):
+    class Meta:
+        model = Garage
+        fields = ('id', 'name', 'city', 'spaces')
+
+
+class GarageViewSet(OperatorPartialUpdateMixin, MongoGenericViewSet):
+    queryset = Garage.objects
+    serializer_class = GarageSerializer
+    authentication_classes = ()
+    permission_classes = ()
+
+
+class TestBoundedIncrement(TestCase):
+
+    def setUp(self):
+        self.garage = Garage(name='north', spaces=45)
+        self.garage.save()
+
+    def tearDown(self):
+        Garage.objects.delete()
+
+    def patch(self, data):
+        view = GarageViewSet.as_view({'patch': 'partial_update'})
+        return view(APIRequestFactory().patch('/', data, format='json'), id=str(self.garage.pk))
+
+    def test_amount_is_not_checked_against_bounds(self):
+        builder = OperatorUpdateBuilder(GarageSerializer(partial=True))
+        self.assertEqual(builder.build({'$inc': {'spaces': 60}}), {'$inc': {'spaces': 60}})
+        self.assertEqual(builder.conditions, {'spaces': {'$lte': -10}})
+
+    def test_decrement_is_bounded_below(self):
+        builder = OperatorUpdateBuilder(GarageSerializer(partial=True))
+        builder.build({'$inc': {'spaces': -5}})
+        self.assertEqual(builder.conditions, {'spaces': {'$gte': 5}})
+
+    def test_missing_field_counts_as_zero(self):
+        builder = OperatorUpdateBuilder(GarageSerializer(partial=True))
+        builder.build({'$inc': {'spaces': 5}})
+        self.assertEqual(builder.get_query({'_id': self.garage.pk}),
+                         {'$and': [{'_id': self.garage.pk},
+                                   {'$or': [{'spaces': {'$lte': 45}}, {'spaces': {'$exists': False}}]}]})
+        builder = OperatorUpdateBuilder(GarageSerializer(partial=True))
+        builder.build({'$inc': {'spaces': -5}})
+        self.assertEqual(builder.get_query({'_id': self.garage.pk}),
+                         {'$and': [{'_id': self.garage.pk}, {'spaces': {'$gte': 5}}]})
+
+    def test_amount_type_is_checked(self):
+        for amount in ('1', 1.5, True):
+            builder = OperatorUpdateBuilder(GarageSerializer(partial=True))
+            self.assertRaises(ValidationError, builder.build, {'$inc': {'spaces': amount}})
+
+    def test_increment_within_bounds(self):
+        response = self.patch({'$inc': {'spaces': 5}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Garage.objects.get(pk=self.garage.pk).spaces, 50)
+
+    def test_increment_past_bounds(self):
+        response = self.patch({'$inc': {'spaces': 10}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('spaces', response.data)
+        self.assertEqual(Garage.objects.get(pk=self.garage.pk).spaces, 45)
+
+    def test_increment_of_missing_field(self):
+        Garage.objects(pk=self.garage.pk).update_one(unset__spaces=True)
+        self.assertEqual(self.patch({'$inc': {'spaces': -1}}).status_code, 400)
+        response = self.patch({'$inc': {'spaces': 5}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Garage.objects.get(pk=self.garage.pk).spaces, 5)
+
+    def test_own_unique_value(self):
+        response = self.patch({'name': 'north', 'city': 'Oslo'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Garage.objects.get(pk=self.garage.pk).city, 'Oslo')
+
+    def test_unique_value_of_another_document(self):
+        Garage(name='south').save()
+        self.assertEqual(self.patch({'name': 'south'}).status_code, 400)
+
+
+class TestListItemSelector(TestCase):
+
+    def test_by_index(self):
+        selector = ListItemSelector('extensions', index=2)
+        self.assertEqual(selector.query, {'extensions.2': {'$exists': True}})
+        self.assertEqual(selector.path, 'extensions.2')
+        self.assertIsNone(selector.array_filters)
+        self.assertEqual(selector.projection, {'extensions': {'$slice': [2, 1]}})
+        self.assertEqual(selector.removal(), [{'$unset': {'extensions.2': 1}}, {'$pull': {'extensions': None}}])
+
+    def test_by_key(self):
+        selector = ListItemSelector('extensions', key='name', value='tags')
+        self.assertEqual(selector.query, {'extensions.name': 'tags'})
+        self.assertEqual(selector.array_filters, [{'item.name': 'tags'}])
+        self.assertEqual(selector.removal(), [{'$pull': {'extensions': {'name': 'tags'}}}])
+        self.assertEqual(prefix_update_document({'$set': {'value': 1}}, selector.path),
+                         {'$set': {'extensions.$[item].value': 1}})
+
+
+class TestVersionedUpdate(TestCase):
+
+    def get_serializer_class(self):
+        class NoteSerializer(DocumentSerializer):
+            class Meta:
+                model = Note
+                version_field = 'version'
+
+        return NoteSerializer
+
+    def tearDown(self):
+        Note.objects.delete()
+
+    def test_update_increments_version(self):
+        NoteSerializer = self.get_serializer_class()
+        note = NoteSerializer().create({'text': 'first'})
+        self.assertEqual(note.version, 1)
+
+        serializer = NoteSerializer(note, data={'text': 'second'})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(Note.objects.get(pk=note.pk).version, 2)
+
+    def test_stale_update_conflicts(self):
+        NoteSerializer = self.get_serializer_class()
+        note = NoteSerializer().create({'text': 'first'})
+        stale = Note.objects.get(pk=note.pk)
+        Note.objects(pk=note.pk).update(set__text='meanwhile', inc__version=1)
+
+        serializer = NoteSerializer(stale, data={'text': 'second'})
+        self.assertTrue(serializer.is_valid())
+        self.assertRaises(VersionConflict, serializer.save)
+        self.assertEqual(Note.objects.get(pk=note.pk).text, 'meanwhile')
+
+    def test_if_match_mismatch_fails_precondition(self):
+        NoteSerializer = self.get_serializer_class()
+        note = NoteSerializer().create({'text': 'first'})
+
+        serializer = NoteSerializer(note, data={'text': 'second'}, context={'if_match_version': 5})
+        self.assertTrue(serializer.is_valid())
+        self.assertRaises(VersionPreconditionFailed, serializer.save)
+
+    def test_document_stored_without_version_updates(self):
+        NoteSerializer = self.get_serializer_class()
+        pk = Note._get_collection().insert_one({'text': 'before versions'}).inserted_id
+        note = Note.objects.get(pk=pk)
+        self.assertEqual(note.version, 1)
+
+        serializer = NoteSerializer(note, data={'text': 'second'})
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(Note.objects.get(pk=pk).version, 2)
+
+    def test_version_writes_are_rejected(self):
+        self.assertRaises(ValidationError, add_version_increment, {'$inc': {'version': 5}}, 'version')
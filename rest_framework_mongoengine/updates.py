@@ -0,0 +1,426 @@
+from __future__ import unicode_literals
+
+import decimal
+import numbers
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from mongoengine import fields as me_fields
+from mongoengine.base import BaseDocument
+from mongoengine.errors import ValidationError as me_ValidationError
+from mongoengine.fields import DynamicField
+from rest_framework import fields as drf_fields, status
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+from rest_framework_mongoengine.fields import ListField
+
+
+def get_model_field(instance, name):
+    field = instance._fields.get(name)
+    if field is None:
+        #undeclared attribute of a DynamicDocument
+        field = getattr(instance, '_dynamic_fields', {}).get(name) or DynamicField(db_field=name)
+    return field
+
+
+def field_to_mongo(instance, name):
+    """
+    Returns (db field name, stored value) of attribute `name` of `instance`.
+    Raw `_data` is read, so references are not dereferenced.
+    """
+    field = get_model_field(instance, name)
+    value = instance._data.get(name)
+    if value is not None:
+        value = field.to_mongo(value)
+        if isinstance(value, BaseDocument):
+            value = value.to_mongo()
+    return field.db_field or name, value
+
+
+def get_field_names(instance):
+    """
+    Attribute names of all declared and dynamic fields of `instance`.
+    """
+    return list(instance._fields_ordered) + [name for name in getattr(instance, '_dynamic_fields', {})
+                                             if name not in instance._fields]
+
+
+def diff_values(path, before, after, to_set, to_unset):
+    """
+    Collect `$set`/`$unset` paths turning stored value `before` into `after`.
+    Embedded documents (of the same class) are compared key by key, into dotted
+    paths; anything else, lists included, is set as a whole.
+    """
+    if after == before:
+        return
+    if after is None:
+        to_unset[path] = ''
+    elif isinstance(before, dict) and isinstance(after, dict) and before.get('_cls') == after.get('_cls'):
+        for key, value in after.items():
+            diff_values('%s.%s' % (path, key), before.get(key), value, to_set, to_unset)
+        for key in before:
+            #to_mongo() leaves out None values
+            if key not in after:
+                to_unset['%s.%s' % (path, key)] = ''
+    else:
+        to_set[path] = after
+
+
+def snapshot(instance, names):
+    """
+    Stored values of attributes `names` of `instance`, keyed by attribute name.
+    Take one before changing an instance, and pass it to `get_update_document()`.
+    """
+    pk_name = instance._meta.get('id_field')
+    return dict((name, field_to_mongo(instance, name)[1]) for name in names if name != pk_name)
+
+
+def get_update_document(instance, original):
+    """
+    Compare the attributes in `original` (see `snapshot()`) with their current values
+    on `instance`, and return a `$set`/`$unset` update document for the changed ones.
+    Returns an empty dict when nothing changed.
+    """
+    to_set = {}
+    to_unset = {}
+    for name, before in original.items():
+        db_field, after = field_to_mongo(instance, name)
+        diff_values(db_field, before, after, to_set, to_unset)
+    return _update_document(to_set, to_unset)
+
+
+def _update_document(to_set, to_unset):
+    update = {}
+    if to_set:
+        update['$set'] = to_set
+    if to_unset:
+        update['$unset'] = to_unset
+    return update
+
+
+def _get_fields(field):
+    #serializer fields of an embedded document: EmbeddedDocumentField, or a nested EmbeddedDocumentSerializer
+    return getattr(field, 'fields', None) or {}
+
+
+def _get_element_field(field):
+    #serializer field of list elements: our ListField, or DRF ListField/ListSerializer
+    if isinstance(field, ListField):
+        return field.fields[field.model_field.name]
+    return getattr(field, 'child', None)
+
+
+def _validate(field, model_field, value, trusted=False):
+    value = field.run_validation(value)
+    if isinstance(value, dict) and isinstance(model_field, me_fields.EmbeddedDocumentField):
+        value = model_field.document_type(**value)
+    if value is not None and not trusted:
+        model_field.validate(value)
+    return model_field.to_mongo(value) if value is not None else None
+
+
+def _to_number(bound, amount):
+    #DecimalField bounds are Decimals, its values are stored as floats
+    return float(bound) if isinstance(amount, float) else bound
+
+
+def _validate_amount(model_field, value):
+    #an increment is checked for its type only, the bounds apply to the incremented value
+    if isinstance(value, bool) or not isinstance(value, (numbers.Number, decimal.Decimal)):
+        raise drf_fields.ValidationError('A number is required.')
+    if isinstance(model_field, (me_fields.IntField, me_fields.LongField)) and value != int(value):
+        raise drf_fields.ValidationError('A valid integer is required.')
+    return model_field.to_mongo(value)
+
+
+class OperatorUpdateBuilder(object):
+    """
+    Translates a PATCH body into a MongoDB update document, validating every value
+    through its serializer field (and the model field, unless the serializer sets
+    `Meta.trust_serializer_validation`):
+
+    - plain keys are a JSON merge patch: values are `$set`, nulls `$unset` and objects
+      on embedded documents are merged key by key.
+    - `$inc`: {field: amount} on numeric fields. The `min_value`/`max_value` of the model
+      field are kept by `conditions`, which `get_query()` adds to the update's filter.
+    - `$push`, `$addToSet`: {field: item} or {field: {"$each": [items]}} on list fields.
+    - `$pull`: {field: item} or {field: {"$in": [items]}} on list fields.
+
+    `build()` raises a ValidationError holding per-field errors.
+    """
+
+    numeric_fields = (me_fields.IntField, me_fields.LongField, me_fields.FloatField, me_fields.DecimalField)
+    list_operators = {'$push': '$each', '$addToSet': '$each', '$pull': '$in'}
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.document = serializer.Meta.model
+        self.trusted = getattr(serializer, 'trust_validation', False)
+        self.update = {}
+        self.conditions = {}
+        self.errors = {}
+
+    def add(self, operator, path, value):
+        self.update.setdefault(operator, {})[path] = value
+
+    def get_field(self, fields, document, name):
+        field = fields.get(name)
+        if field is None or field.read_only:
+            raise drf_fields.ValidationError('Unknown or read only field.')
+        model_field = document._fields.get(field.source)
+        if model_field is None:
+            raise drf_fields.ValidationError('Not a field of %s.' % document.__name__)
+        return field, model_field
+
+    def merge(self, fields, document, name, value, prefix=''):
+        field, model_field = self.get_field(fields, document, name)
+        path = prefix + model_field.db_field
+
+        if value is None:
+            if model_field.required:
+                raise drf_fields.ValidationError('This field may not be removed.')
+            self.add('$unset', path, '')
+        elif isinstance(value, dict) and isinstance(model_field, me_fields.EmbeddedDocumentField) and _get_fields(field):
+            for key, sub_value in value.items():
+                self.merge(_get_fields(field), model_field.document_type, key, sub_value, path + '.')
+        else:
+            self.add('$set', path, _validate(field, model_field, value, self.trusted))
+
+    def increment(self, name, value):
+        field, model_field = self.get_field(self.serializer.fields, self.document, name)
+        if not isinstance(model_field, self.numeric_fields):
+            raise drf_fields.ValidationError('Only numeric fields can be incremented.')
+        amount = _validate_amount(model_field, value)
+        self.add('$inc', model_field.db_field, amount)
+
+        bounds = {}
+        if model_field.max_value is not None and amount > 0:
+            bounds['$lte'] = _to_number(model_field.max_value, amount) - amount
+        if model_field.min_value is not None and amount < 0:
+            bounds['$gte'] = _to_number(model_field.min_value, amount) - amount
+        if bounds:
+            self.conditions[model_field.db_field] = bounds
+
+    def change_list(self, operator, name, value):
+        field, model_field = self.get_field(self.serializer.fields, self.document, name)
+        element_field = _get_element_field(field)
+        if not isinstance(model_field, me_fields.ListField) or element_field is None:
+            raise drf_fields.ValidationError('%s only applies to list fields.' % operator)
+
+        modifier = self.list_operators[operator]
+        if isinstance(value, dict) and modifier in value:
+            items = value[modifier]
+            if not isinstance(items, list):
+                raise drf_fields.ValidationError('%s expects a list.' % modifier)
+            value = {modifier: [_validate(element_field, model_field.field, item, self.trusted) for item in items]}
+        else:
+            value = _validate(element_field, model_field.field, value, self.trusted)
+        self.add(operator, model_field.db_field, value)
+
+    def check_conflicts(self):
+        paths = [path for operation in self.update.values() for path in operation]
+        for index, path in enumerate(paths):
+            for other in paths[index + 1:]:
+                if path == other or other.startswith(path + '.') or path.startswith(other + '.'):
+                    self.errors[path] = ['Conflicting updates of this field.']
+
+    def build(self, data):
+        if not isinstance(data, dict):
+            raise drf_fields.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected an object.']})
+
+        for key, value in data.items():
+            if not key.startswith('$'):
+                self.run(key, self.merge, self.serializer.fields, self.document, key, value)
+            elif key != '$inc' and key not in self.list_operators:
+                self.errors[key] = ['Unsupported update operator.']
+            elif not isinstance(value, dict):
+                self.errors[key] = ['Expected an object of field names.']
+            else:
+                for name, operand in value.items():
+                    if key == '$inc':
+                        self.run(name, self.increment, name, operand)
+                    else:
+                        self.run(name, self.change_list, key, name, operand)
+
+        self.check_conflicts()
+        if self.errors:
+            raise drf_fields.ValidationError(self.errors)
+        return self.update
+
+    def get_query(self, select):
+        """
+        `select` restricted by `conditions`. `$inc` counts a missing field as 0, so documents
+        without the field match as well when the amount alone is within the bounds.
+        """
+        clauses = []
+        for db_field, bounds in self.conditions.items():
+            if all(0 <= value if operator == '$lte' else 0 >= value for operator, value in bounds.items()):
+                clauses.append({'$or': [{db_field: bounds}, {db_field: {'$exists': False}}]})
+            else:
+                clauses.append({db_field: bounds})
+        return {'$and': [select] + clauses} if clauses else select
+
+    def bounds_error(self):
+        """
+        ValidationError for an update that matched nothing because of its `conditions`.
+        """
+        names = [name for name, field in self.serializer.fields.items()
+                 if getattr(self.document._fields.get(field.source), 'db_field', None) in self.conditions]
+        return drf_fields.ValidationError(dict((name, ['The increment is out of the bounds of this field.'])
+                                               for name in names))
+
+    def run(self, name, method, *args):
+        try:
+            method(*args)
+        except drf_fields.ValidationError as exc:
+            self.errors[name] = exc.detail
+        except me_ValidationError as exc:
+            self.errors[name] = [exc.message]
+        except DjangoValidationError as exc:
+            self.errors[name] = list(exc.messages)
+        except drf_fields.SkipField:
+            pass
+
+
+def get_set_document(instance, names):
+    """
+    `$set`/`$unset` update document writing attributes `names` of `instance`
+    as they are, without comparing to stored values.
+    """
+    to_set = {}
+    to_unset = {}
+    pk_name = instance._meta.get('id_field')
+    for name in names:
+        if name == pk_name:
+            continue
+        db_field, value = field_to_mongo(instance, name)
+        if value is None:
+            to_unset[db_field] = ''
+        else:
+            to_set[db_field] = value
+    return _update_document(to_set, to_unset)
+
+
+def prefix_update_document(update, prefix):
+    """
+    Moves every path of a `$set`/`$unset` update document under `prefix`.
+    """
+    return dict((operator, dict(('%s.%s' % (prefix, path), value) for path, value in paths.items()))
+                for operator, paths in update.items())
+
+
+class ListItemSelector(object):
+    """
+    Addresses one element of a list of embedded documents stored in `db_field`, by its
+    index or, when `key` (db field name of the element's key) is given, by the value
+    of that key. Gives the pieces of queries and updates reaching that element only:
+
+    - `query`: added to the document filter, matches when the element exists.
+    - `path`: update path of the element, `<list>.<index>` or `<list>.$[item]`.
+    - `array_filters`: the `arrayFilters` going with `path` (MongoDB >= 3.6).
+    - `projection`: returns that element only, as a one item list.
+    """
+
+    def __init__(self, db_field, index=None, key=None, value=None):
+        self.db_field = db_field
+        self.index = index
+        self.key = key
+        self.value = value
+
+    @property
+    def query(self):
+        if self.key is None:
+            return {'%s.%d' % (self.db_field, self.index): {'$exists': True}}
+        return {'%s.%s' % (self.db_field, self.key): self.value}
+
+    @property
+    def path(self):
+        if self.key is None:
+            return '%s.%d' % (self.db_field, self.index)
+        return '%s.$[item]' % self.db_field
+
+    @property
+    def array_filters(self):
+        if self.key is None:
+            return None
+        return [{'item.%s' % self.key: self.value}]
+
+    @property
+    def projection(self):
+        if self.key is None:
+            return {self.db_field: {'$slice': [self.index, 1]}}
+        return {self.db_field: {'$elemMatch': {self.key: self.value}}}
+
+    def removal(self):
+        """
+        Updates removing the element, to apply in order: the first one under `query`, the
+        others on the document. A `$pull` by key; by index, an `$unset` of the element,
+        which leaves a null in its place, then a `$pull` of nulls.
+        """
+        if self.key is not None:
+            return [{'$pull': {self.db_field: {self.key: self.value}}}]
+        return [{'$unset': {self.path: 1}}, {'$pull': {self.db_field: None}}]
+
+
+class VersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The document was changed meanwhile, reload it and try again.'
+
+
+class VersionPreconditionFailed(VersionConflict):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The document does not match If-Match.'
+
+
+def version_conflict(if_match=False):
+    """
+    The exception for a version mismatch: 412 when the expected version came from
+    an If-Match header, 409 otherwise.
+    """
+    return VersionPreconditionFailed() if if_match else VersionConflict()
+
+
+def next_version(expected):
+    #documents without a version are at version 1 once written
+    return 1 if expected is None else expected + 1
+
+
+def get_version_condition(model_field, expected):
+    """
+    Filter value matching the documents at version `expected`. Documents stored without the
+    version field load with its default, so they match when `expected` is the default.
+    """
+    if expected is None or expected == model_field.default:
+        return {'$in': [expected, None]}
+    return expected
+
+
+def check_version_write(update, db_field):
+    """
+    Versions are only moved on by the server: raises a 400 when `update` writes `db_field`.
+    """
+    for fields in update.values():
+        if any(name == db_field or name.startswith(db_field + '.') for name in fields):
+            raise drf_fields.ValidationError({db_field: ['The version is set by the server, it can not be written.']})
+
+
+def add_version_increment(update, db_field):
+    """
+    Copy of `update` also incrementing the version field `db_field`, for updates that are
+    not conditioned on the version.
+    """
+    check_version_write(update, db_field)
+    update = dict(update)
+    update['$inc'] = dict(update.get('$inc', {}), **{db_field: 1})
+    return update
+
+
+def add_version_update(update, db_field, expected):
+    """
+    Copy of `update` also setting the version field `db_field` to the version after
+    `expected`, for updates conditioned on `get_version_condition()`.
+    """
+    check_version_write(update, db_field)
+    update = dict(update)
+    update['$set'] = dict(update.get('$set', {}), **{db_field: next_version(expected)})
+    return update
@@ -3,10 +3,12 @@ from django.core.exceptions import ImproperlyConfigured
 from django.utils import six
 
 import collections
+from rest_framework.fields import empty
 from rest_framework.utils.serializer_helpers import BindingDict
 
 from mongoengine.base.common import get_document
 import mongoengine
+import mongoengine.base
 
 from collections import OrderedDict
 from rest_framework.utils import field_mapping
@@ -85,6 +87,167 @@ def get_field_info(model):
 
     return FieldInfo(pk, fields, forward_relations, reverse_relations, fields_and_pk, relations)
 
+def get_index_specs(model):
+    """
+    Returns index specs of a document: `Meta.indexes`, `unique=True` fields
+    and `unique_with` declarations, normalized by mongoengine to db field names.
+    The `_cls` key mongoengine prepends for inherited documents is stripped,
+    since every query on those documents filters on `_cls` anyway.
+    """
+    specs = []
+    for spec in model._meta.get('index_specs') or []:
+        keys = [key for key, direction in spec['fields']]
+        if keys and keys[0] == '_cls' and len(keys) > 1:
+            keys = keys[1:]
+        specs.append(dict(spec, keys=keys))
+    return specs
+
+
+def get_indexed_fields(model):
+    """
+    Returns the db field names that lead an index of `model`, and so can be
+    used alone to select documents without a collection scan. `_id` is always there.
+    """
+    indexed = set(['_id'])
+    for spec in get_index_specs(model):
+        if spec['keys']:
+            indexed.add(spec['keys'][0])
+    return indexed
+
+
+def get_db_field(model, field_path):
+    """
+    Maps a (dotted or `__` separated) field path of `model` to its db field path.
+    """
+    parts = field_path.replace('__', '.').split('.')
+    db_parts = []
+    document = model
+    for part in parts:
+        field = None
+        if document is not None:
+            if part in ('id', 'pk') and not issubclass(document, mongoengine.EmbeddedDocument):
+                field = document._fields.get(document._meta['id_field'])
+            else:
+                field = document._fields.get(part)
+        db_parts.append(field.db_field if field is not None else part)
+        field = getattr(field, 'field', field)  # unwrap ListField
+        document = getattr(field, 'document_type', None) if field is not None else None
+        if document is not None and not (inspect.isclass(document) and issubclass(document, mongoengine.BaseDocument)):
+            document = None
+    return '.'.join(db_parts)
+
+
+#model field types whose mongoengine validation is repeated by the serializer field
+#generated for them, as long as the model field does not override `validate()`.
+TRUSTED_FIELD_TYPES = (
+    mongoengine.StringField, mongoengine.IntField, mongoengine.LongField, mongoengine.FloatField,
+    mongoengine.DecimalField, mongoengine.BooleanField, mongoengine.DateTimeField,
+    mongoengine.ObjectIdField, mongoengine.ReferenceField, mongoengine.ListField,
+    mongoengine.EmbeddedDocumentField, mongoengine.BinaryField,
+)
+
+#model field constraints stored under the same attribute name by serializer fields
+CONSTRAINT_ATTRIBUTES = ('max_length', 'min_length', 'min_value', 'max_value', 'max_bytes')
+
+
+def _overrides(cls, base, name):
+    method = getattr(cls, name)
+    base_method = getattr(base, name)
+    return getattr(method, '__func__', method) is not getattr(base_method, '__func__', base_method)
+
+
+def _is_trusted_type(model_field):
+    for cls in inspect.getmro(type(model_field)):
+        if cls in TRUSTED_FIELD_TYPES:
+            return not _overrides(type(model_field), cls, 'validate')
+    return False
+
+
+def _is_nested_serializer(field):
+    return hasattr(field, 'fields') and hasattr(getattr(field, 'Meta', None), 'model')
+
+
+def _get_element_field(field):
+    #list elements: DRF ListField/ListSerializer child, or the nested field of our ListField
+    if hasattr(field, 'child'):
+        return field.child
+    model_field = getattr(field, 'model_field', None)
+    if isinstance(model_field, mongoengine.ListField):
+        return field.fields[model_field.name]
+    return None
+
+
+def get_validation_gaps(serializer):
+    """
+    Lists what mongoengine's `validate()` checks on documents written through `serializer`
+    that the serializer's own validation does not: required model fields the serializer
+    leaves out, constraints (choices, regex, lengths, bounds, `validation=` functions)
+    its fields do not mirror, field types validated differently, and `clean()` methods.
+    An empty list means validating again on save is redundant.
+    """
+    return _document_gaps(serializer.Meta.model, serializer.fields, '', serializer.get_field_mapping)
+
+
+def _document_gaps(document, fields, prefix, get_field_mapping):
+    gaps = []
+    if _overrides(document, mongoengine.base.BaseDocument, 'clean'):
+        gaps.append('%s.clean() is not run by the serializer.' % document.__name__)
+
+    by_source = dict((field.source, field) for field in fields.values() if not field.read_only)
+    for name, model_field in document._fields.items():
+        gaps.extend(_field_gaps(prefix + name, model_field, by_source.get(name), get_field_mapping))
+    return gaps
+
+
+def _field_gaps(path, model_field, field, get_field_mapping):
+    required = model_field.required and model_field.default is None
+    if field is None:
+        return ['%s is required, but not written by the serializer.' % path] if required else []
+
+    gaps = []
+    if required and ((not field.required and field.default is empty) or getattr(field, 'allow_null', False)):
+        gaps.append('%s is required, but the serializer lets it be empty.' % path)
+
+    if not _is_trusted_type(model_field):
+        gaps.append('%s: %s is not validated by the serializer.' % (path, type(model_field).__name__))
+        return gaps
+    if getattr(model_field, 'validation', None) is not None:
+        gaps.append('%s: its validation function is not run by the serializer.' % path)
+
+    for attr in CONSTRAINT_ATTRIBUTES:
+        value = getattr(model_field, attr, None)
+        if value is not None and getattr(field, attr, None) != value:
+            gaps.append('%s: %s=%r is not enforced by the serializer.' % (path, attr, value))
+
+    regex = getattr(model_field, 'regex', None)
+    if regex is not None and not any(getattr(getattr(validator, 'regex', None), 'pattern', None) == regex.pattern
+                                     for validator in field.validators):
+        gaps.append('%s: regex %r is not enforced by the serializer.' % (path, regex.pattern))
+
+    if model_field.choices:
+        choices = set(choice[0] if isinstance(choice, (list, tuple)) else choice for choice in model_field.choices)
+        if set(getattr(field, 'choices', None) or ()) != choices:
+            gaps.append('%s: choices are not enforced by the serializer.' % path)
+
+    if isinstance(model_field, mongoengine.EmbeddedDocumentField):
+        if _is_nested_serializer(field):
+            gaps.extend(_document_gaps(model_field.document_type, field.fields, path + '.', get_field_mapping))
+        else:
+            gaps.append('%s: embedded document fields are only validated by a nested '
+                        'EmbeddedDocumentSerializer.' % path)
+    elif isinstance(model_field, mongoengine.ListField):
+        element_field = _get_element_field(field)
+        if element_field is None:
+            gaps.append('%s: list elements are not validated by the serializer.' % path)
+        elif model_field.field is not None:
+            gaps.extend(_field_gaps(path + '[]', model_field.field, element_field, get_field_mapping))
+    else:
+        field_cls = get_field_mapping(model_field)
+        if field_cls is None or not isinstance(field, field_cls):
+            gaps.append('%s: %s does not validate a %s.' % (path, type(field).__name__, type(model_field).__name__))
+    return gaps
+
+
 class PolymorphicChainMap(object):
     #that's a mouthful.
     #more like a TreeChainMap or something?
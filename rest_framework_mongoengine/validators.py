@@ -1,45 +1,224 @@
+import re
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import validators
 from rest_framework.exceptions import ValidationError
 
+from rest_framework_mongoengine.utils import get_db_field, get_index_specs
+
+DUPLICATE_KEY_ERROR = 11000
+
+_index_name_re = re.compile(r'index: (?:\S*\$)?(\S+)')
+
+#batch state of validators by id, per thread: validator instances are shared by all
+#instances of a serializer class.
+_batches = threading.local()
+
+
+def exists(queryset):
+    """
+    True when `queryset` matches a document. Only the `_id` of one match is fetched.
+    """
+    return queryset.only(queryset._document._meta['id_field']).limit(1).first() is not None
+
+
+def get_index_name(spec):
+    #name given in Meta.indexes, or the one MongoDB generates
+    return spec.get('name') or '_'.join('%s_%s' % (key, direction) for key, direction in spec['fields'])
+
+
+def get_duplicate_index(document, write_error):
+    """
+    The unique index spec (see `utils.get_index_specs()`) of `document` that a duplicate key
+    error was raised by, or None. `write_error` is a pymongo write error / error details
+    dict: the index is found from `keyPattern` when the server sends it, else by the index
+    name in `errmsg`.
+    """
+    specs = [spec for spec in get_index_specs(document) if spec.get('unique')]
+    key_pattern = write_error.get('keyPattern')
+    if key_pattern:
+        keys = [key for key in key_pattern if key != '_cls']
+        for spec in specs:
+            if spec['keys'] == keys:
+                return spec
+    match = _index_name_re.search(write_error.get('errmsg', ''))
+    if match:
+        for spec in specs:
+            if get_index_name(spec) == match.group(1):
+                return spec
+    return None
+
+
+class IndexUniquenessMixin(object):
+    """
+    With `use_index=True`, uniqueness is left to a unique index of the document: the
+    validator makes no query, and the serializer turns duplicate key errors of its writes
+    into this validator's error (see `DocumentSerializer.get_duplicate_key_detail()`).
+    The index must exist, which is checked as soon as the unique fields are known.
+    """
+    use_index = False
+
+    def find_unique_index(self, names=None):
+        document = self.queryset._document
+        keys = set(get_db_field(document, name) for name in (names or self.get_unique_field_names()))
+        for spec in get_index_specs(document):
+            if spec.get('unique') and set(spec['keys']) == keys:
+                return spec
+        return None
+
+    def check_index(self, names=None):
+        if self.use_index and self.find_unique_index(names) is None:
+            raise ImproperlyConfigured(
+                '%s(use_index=True) requires a unique index of %s on %s, in `Meta.indexes` or '
+                'from `unique=True`.' % (self.__class__.__name__, self.queryset._document.__name__,
+                                         ', '.join(names or self.get_unique_field_names())))
+
 
-class UniqueValidator(validators.UniqueValidator):
+class BatchUniquenessMixin(object):
+    """
+    Lets a list serializer check the uniqueness of many items with a single query.
+
+    After `set_context()`, `start_batch()` fetches the stored documents holding any of the
+    candidate values of the items, with one `$in` query projecting the unique fields only.
+    Until `end_batch()`, calls check against those, and against the values of the items
+    checked before, so duplicates within the payload are caught too. Set `batch_item_id`
+    to the id of the document the current item updates, if any.
+    """
+
+    @property
+    def batch(self):
+        return getattr(_batches, 'state', {}).get(id(self))
+
+    @property
+    def batch_item_id(self):
+        return self.batch['item_id']
+
+    @batch_item_id.setter
+    def batch_item_id(self, pk):
+        self.batch['item_id'] = pk
+
+    def get_unique_field_names(self):
+        raise NotImplementedError('`get_unique_field_names()` must be implemented.')
+
+    def to_mongo_key(self, values):
+        document = self.queryset._document
+        return tuple(document._fields[name].to_mongo(value) if name in document._fields else value
+                     for name, value in zip(self.get_unique_field_names(), values))
+
+    def start_batch(self, keys):
+        """
+        `keys` are the candidate values of the items, as tuples ordered like the unique fields.
+        """
+        names = self.get_unique_field_names()
+        document = self.queryset._document
+        stored = {}
+        if keys:
+            filter_kwargs = dict(('%s__in' % name, list(set(key[index] for key in keys)))
+                                 for index, name in enumerate(names))
+            db_fields = [get_db_field(document, name) for name in names]
+            for son in self.queryset.filter(**filter_kwargs).only(*names).as_pymongo():
+                key = tuple(son.get(db_field) for db_field in db_fields)
+                stored.setdefault(key, set()).add(son['_id'])
+        if not hasattr(_batches, 'state'):
+            _batches.state = {}
+        _batches.state[id(self)] = {'stored': stored, 'seen': set(), 'item_id': None}
+
+    def end_batch(self):
+        getattr(_batches, 'state', {}).pop(id(self), None)
+
+    def is_taken(self, values):
+        key = self.to_mongo_key(values)
+        try:
+            hash(key)
+        except TypeError:
+            #values that can't be collected (lists...) are left to the unique index
+            return False
+        if key in self.batch['seen']:
+            return True
+        self.batch['seen'].add(key)
+        return bool(self.batch['stored'].get(key, set()) - set([self.batch_item_id]))
+
+
+class UniqueValidator(IndexUniquenessMixin, BatchUniquenessMixin, validators.UniqueValidator):
     """
     Validator that corresponds to `unique=True` on a model field.
 
     Should be applied to an individual field on the serializer.
     """
+    def __init__(self, queryset, message=None, use_index=False):
+        super(UniqueValidator, self).__init__(queryset, message=message)
+        self.use_index = use_index
+
+    def set_context(self, serializer_field):
+        super(UniqueValidator, self).set_context(serializer_field)
+        if self.use_index and not getattr(self, 'index_checked', False):
+            self.check_index()
+            self.index_checked = True
+
+    def get_unique_field_names(self):
+        return [self.field_name]
+
     def __call__(self, value):
+        if self.use_index:
+            return
+        if self.batch is not None:
+            if self.is_taken([value]):
+                raise ValidationError(self.message)
+            return
+
         queryset = self.queryset
         queryset = self.filter_queryset(value, queryset)
         queryset = self.exclude_current_instance(queryset)
-        if queryset.first():
+        if exists(queryset):
             raise ValidationError(self.message)
 
 
-class UniqueTogetherValidator(validators.UniqueTogetherValidator):
+class UniqueTogetherValidator(IndexUniquenessMixin, BatchUniquenessMixin, validators.UniqueTogetherValidator):
     """
     Validator that corresponds to `unique_together = (...)` on a model class.
 
     Should be applied to the serializer class, not to an individual field.
     """
+    def __init__(self, queryset, fields, message=None, use_index=False):
+        super(UniqueTogetherValidator, self).__init__(queryset, fields, message=message)
+        self.use_index = use_index
+        self.check_index()
+
+    def get_unique_field_names(self):
+        return list(self.fields)
+
     def __call__(self, attrs):
         self.enforce_required_fields(attrs)
+        if self.use_index:
+            return
+        field_names = ', '.join(self.fields)
+        if self.batch is not None and all(name in attrs for name in self.fields):
+            if self.is_taken([attrs[name] for name in self.fields]):
+                raise ValidationError(self.message.format(field_names=field_names))
+            return
+
         queryset = self.queryset
         queryset = self.filter_queryset(attrs, queryset)
         queryset = self.exclude_current_instance(attrs, queryset)
-        if queryset.first():
-            field_names = ', '.join(self.fields)
+        if exists(queryset):
             raise ValidationError(self.message.format(field_names=field_names))
 
 
 class BaseUniqueForValidator(validators.BaseUniqueForValidator):
+    def __init__(self, queryset, field, date_field, message=None, use_index=False):
+        if use_index:
+            #no index can hold a value unique per day, month or year of another field
+            raise ImproperlyConfigured('%s can not be backed by an index.' % self.__class__.__name__)
+        super(BaseUniqueForValidator, self).__init__(queryset, field, date_field, message=message)
+
     def __call__(self, attrs):
         self.enforce_required_fields(attrs)
         queryset = self.queryset
         queryset = self.filter_queryset(attrs, queryset)
         queryset = self.exclude_current_instance(attrs, queryset)
-        if queryset.first():
+        if exists(queryset):
             message = self.message.format(date_field=self.date_field)
             raise ValidationError({self.field: message})
 